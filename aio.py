@@ -0,0 +1,38 @@
+"""
+Shared event loop for async I/O.
+
+Async database and quote clients keep connection pools that belong to the
+event loop they were first used on. Flask runs every async view in a fresh
+loop, so those clients live on one long-lived loop in a daemon thread and
+views await them through run().
+"""
+
+import asyncio
+import threading
+
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """Return the shared event loop, starting it on first use."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="aio", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+async def run(coro):
+    """Run coroutine on the shared loop and await its result from any loop."""
+    loop = get_loop()
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    if current is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
@@ -0,0 +1,232 @@
+"""
+Portfolio analytics over a user's ledger.
+
+A user's transactions are loaded column by column into NumPy arrays
+(Ledger), and analyze() derives everything from them in vectorized passes:
+
+- FIFO cost basis and average cost per share of open positions
+- FIFO realized P&L of every sale
+- unrealized P&L and allocation weights at current prices
+- a daily equity curve: cash plus positions at their last traded price
+
+FIFO works on a "share queue": each symbol's bought shares are laid end to
+end in purchase order, so the cost of the first x shares is a piecewise
+linear function of x, and the cost of any sale is the difference of that
+function at the sale's start and end positions in the queue.
+"""
+
+import numpy as np
+
+
+# Whole ledger of a user, oldest first
+LEDGER_QUERY = (
+    "SELECT symbol, shares, price, timestamp FROM transactions WHERE user_id = ? "
+    "ORDER BY timestamp, id"
+)
+
+
+class Ledger:
+    """A user's transactions as parallel arrays, oldest first."""
+
+    def __init__(self, symbols, codes, shares, prices, days):
+        """
+        Args:
+            symbols: Sorted array of distinct symbols
+            codes: Index into symbols of each transaction
+            shares: Shares of each transaction, negative for sales
+            prices: Price per share of each transaction
+            days: Date of each transaction as datetime64[D]
+        """
+        self.symbols = symbols
+        self.codes = codes
+        self.shares = shares
+        self.prices = prices
+        self.days = days
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build ledger from Database.columns() of LEDGER_QUERY."""
+        symbols, codes = np.unique(np.array(columns["symbol"], dtype=str), return_inverse=True)
+        return cls(
+            symbols,
+            codes.astype(np.int64),
+            np.array(columns["shares"], dtype=np.int64),
+            np.array(columns["price"], dtype=np.float64),
+            np.array(columns["timestamp"], dtype="datetime64[s]").astype("datetime64[D]"),
+        )
+
+    def __len__(self):
+        return len(self.shares)
+
+
+def load(db, user_id):
+    """Load ledger of user_id from db."""
+    return Ledger.from_columns(db.columns(LEDGER_QUERY, user_id))
+
+
+def fifo(ledger):
+    """
+    Match sales to purchases first in, first out.
+
+    Returns:
+        Tuple of arrays indexed like ledger.symbols: (shares held, cost basis
+        of the shares held, realized P&L)
+    """
+    count = len(ledger.symbols)
+    order = np.argsort(ledger.codes, kind="stable")
+    codes = ledger.codes[order]
+    shares = ledger.shares[order]
+    prices = ledger.prices[order]
+
+    bought = np.where(shares > 0, shares, 0)
+    sold = np.where(shares < 0, -shares, 0)
+    bought_total = np.bincount(codes, weights=bought, minlength=count).astype(np.int64)
+
+    # Where each symbol's lots start in the share queue
+    offsets = np.concatenate(([0], np.cumsum(bought_total)[:-1]))
+
+    # Cumulative shares bought and sold per symbol up to each transaction
+    group_start = np.searchsorted(codes, np.arange(count))
+    bought_cum = np.cumsum(bought)
+    bought_cum -= (bought_cum - bought)[group_start][codes]
+    sold_cum = np.cumsum(sold)
+    sold_cum -= (sold_cum - sold)[group_start][codes]
+    # Never sell more than was bought, whatever the ledger says
+    sold_cum = np.minimum(sold_cum, bought_cum)
+    sold_before = np.concatenate(([0], sold_cum[:-1]))
+    sold_before[group_start] = 0
+    sold = sold_cum - sold_before
+
+    # Queue end position and cumulative cost of every lot
+    is_buy = bought > 0
+    lot_end = np.cumsum(bought)[is_buy]
+    lot_cost = np.cumsum(bought * prices)[is_buy]
+    lot_price = prices[is_buy]
+
+    def cost(position):
+        """Cost of the first position shares of the queue."""
+        if not len(lot_end):
+            return np.zeros(len(position))
+        lot = np.minimum(np.searchsorted(lot_end, position), len(lot_end) - 1)
+        return lot_cost[lot] - (lot_end[lot] - position) * lot_price[lot]
+
+    sale_end = offsets[codes] + sold_cum
+    sale_cost = cost(sale_end) - cost(sale_end - sold)
+    realized = np.bincount(codes, weights=np.where(sold > 0, sold * prices - sale_cost, 0), minlength=count)
+
+    sold_total = np.bincount(codes, weights=sold, minlength=count).astype(np.int64)
+    held = bought_total - sold_total
+    open_cost = cost(offsets + bought_total) - cost(offsets + sold_total)
+    return held, open_cost, realized
+
+
+def last_prices(ledger):
+    """Return the last traded price of each symbol in ledger."""
+    last = np.zeros(len(ledger.symbols))
+    # Fancy assignment doesn't promise which duplicate wins, so pick each symbol's last trade
+    _, first_reversed = np.unique(ledger.codes[::-1], return_index=True)
+    last[ledger.codes[::-1][first_reversed]] = ledger.prices[::-1][first_reversed]
+    return last
+
+
+def equity_curve(ledger, cash):
+    """
+    Value the account at the end of every day from first to last transaction.
+
+    Positions are valued at their last traded price in the ledger, and cash
+    is replayed backwards from the current balance.
+
+    Args:
+        ledger: Ledger of the user
+        cash: Current cash balance
+
+    Returns:
+        Tuple of (dates as datetime64[D], equity)
+    """
+    if not len(ledger):
+        return np.array([], dtype="datetime64[D]"), np.array([])
+
+    count = len(ledger.symbols)
+    first = ledger.days.min()
+    days = (ledger.days - first).astype(np.int64)
+    span = int(days.max()) + 1
+    cells = days * count + ledger.codes
+
+    # Shares held at the end of each day
+    held = np.cumsum(
+        np.bincount(cells, weights=ledger.shares, minlength=span * count).reshape(span, count), axis=0
+    )
+
+    # Last trade of each (day, symbol), carried forward to the following days
+    _, first_reversed = np.unique(cells[::-1], return_index=True)
+    last_trade = np.full(span * count, -1, dtype=np.int64)
+    last_trade[cells[::-1][first_reversed]] = len(cells) - 1 - first_reversed
+    last_trade = np.maximum.accumulate(last_trade.reshape(span, count), axis=0)
+    price = np.where(last_trade >= 0, ledger.prices[last_trade], 0.0)
+
+    # Cash before the first transaction, then daily flows
+    flows = -ledger.shares * ledger.prices
+    balance = cash - flows.sum() + np.cumsum(np.bincount(days, weights=flows, minlength=span))
+
+    return first + np.arange(span), balance + (held * price).sum(axis=1)
+
+
+def analyze(ledger, cash, quotes, curve=True):
+    """
+    Compute portfolio analytics.
+
+    Args:
+        ledger: Ledger of the user
+        cash: Current cash balance
+        quotes: Dict mapping symbol to quote dict (or None), as returned by lookup_many;
+            symbols without a quote are valued at their last traded price
+        curve: Whether to include the daily equity curve
+
+    Returns:
+        Dict with cash, open positions (symbol, shares, cost_basis, average_cost,
+        price, value, unrealized_pnl, realized_pnl, weight), totals and, if
+        curve is set, equity_curve as a list of (date, equity)
+    """
+    held, open_cost, realized = fifo(ledger)
+    prices = last_prices(ledger)
+    for i, symbol in enumerate(ledger.symbols):
+        quote_data = quotes.get(str(symbol))
+        if quote_data is not None:
+            prices[i] = quote_data["price"]
+
+    value = held * prices
+    unrealized = value - open_cost
+    total = cash + value.sum()
+    weights = value / total if total else np.zeros(len(value))
+    average_cost = np.divide(open_cost, held, out=np.zeros(len(held)), where=held > 0)
+
+    positions = [
+        {
+            "symbol": str(ledger.symbols[i]),
+            "shares": int(held[i]),
+            "cost_basis": float(open_cost[i]),
+            "average_cost": float(average_cost[i]),
+            "price": float(prices[i]),
+            "value": float(value[i]),
+            "unrealized_pnl": float(unrealized[i]),
+            "realized_pnl": float(realized[i]),
+            "weight": float(weights[i]),
+        }
+        for i in np.flatnonzero(held > 0)
+    ]
+
+    report = {
+        "cash": float(cash),
+        "positions": positions,
+        "totals": {
+            "value": float(total),
+            "cost_basis": float(open_cost.sum()),
+            "unrealized_pnl": float(unrealized.sum()),
+            "realized_pnl": float(realized.sum()),
+            "cash_weight": float(cash / total) if total else 1.0,
+        },
+    }
+    if curve:
+        dates, equity = equity_curve(ledger, cash)
+        report["equity_curve"] = [(str(date), float(amount)) for date, amount in zip(dates, equity)]
+    return report
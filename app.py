@@ -1,85 +1,579 @@
+import atexit
+import csv
+import functools
+import io
+import json
 import os
+import threading
+import time
+import weakref
 
-from flask import Flask, flash, redirect, render_template, request, session
-from flask_session import Session
-from werkzeug.security import check_password_hash, generate_password_hash
+from datetime import datetime, timezone
 
-from database import Database
-from helpers import apology, login_required, lookup, usd
+import click
 
-# Configure application
-app = Flask(__name__)
+from flask import (
+    Blueprint, Flask, Response, before_render_template, current_app, flash, g, jsonify, redirect, render_template,
+    request, session, stream_with_context, template_rendered
+)
+from markupsafe import Markup
+from werkzeug.local import LocalProxy
 
-# Custom filter
-app.jinja_env.filters["usd"] = usd
+import analytics
+import caching
+import deletion
+import holdings
+import metrics
+import schema
 
-# Configure session to use filesystem (instead of signed cookies)
-app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+from database import AsyncDatabase, Database
+from feed import HEARTBEAT, FeedFull, PortfolioStream, PriceFeed
+from fragments import FragmentCache
+from leaderboard import Leaderboard
+from passwords import PasswordHasher, PasswordServiceBusy
+from pricestore import PriceStore, ReplayClient, SimulatedClock, parse_time
+from helpers import (
+    QuoteService, admin_required, age, apology, decode_cursor, encode_cursor, flag, login_required, lookup, lookup_async,
+    lookup_many, lookup_many_async, quote_cache, setting, usd
+)
+from refresher import PriceRefresher
+from sessions import delete_expired_sessions, init_session
+from symbols import SymbolDirectory
 
-# Configure SQLAlchemy Core to use SQLite database
-db = Database("sqlite:///finance.db")
+# Transactions per page of history
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
 
+# Orders accepted in one bulk order request
+BULK_ORDER_LIMIT = 500
 
-@app.after_request
+# Matches returned by one autocomplete request
+SYMBOL_SEARCH_LIMIT = 10
+SYMBOL_SEARCH_MAX_LIMIT = 50
+
+# Routes, request hooks and CLI commands, registered on the app by create_app
+bp = Blueprint("finance", __name__, cli_group=None)
+
+
+
+class Services:
+    """
+    Services of one app, created by create_app and kept in app.extensions["finance"].
+
+    Routes reach them through the module level proxies below, which resolve
+    to the current app's; background threads are handed the objects.
+    """
+
+    def __init__(
+        self, *, db, adb, quotes, fingerprints, price_store, replay_clock, symbol_directory, refresher, hasher,
+        price_feed, fragments, leaderboard, purger, profiler
+    ):
+        self.db = db
+        self.adb = adb
+        self.quotes = quotes
+        self.fingerprints = fingerprints
+        self.price_store = price_store
+        self.replay_clock = replay_clock
+        self.symbol_directory = symbol_directory
+        self.refresher = refresher
+        self.hasher = hasher
+        self.price_feed = price_feed
+        self.fragments = fragments
+        self.leaderboard = leaderboard
+        self.purger = purger
+        self.profiler = profiler
+
+    def stop(self):
+        """Stop background work, write buffered quotes and shut down worker pools."""
+        if self.refresher is not None:
+            self.refresher.stop()
+        self.purger.stop()
+        self.price_feed.stop()
+        self.price_store.flush()
+        self.hasher.close()
+        self.quotes.close()
+
+
+def services():
+    """Return the Services of the current app."""
+    return current_app.extensions["finance"]
+
+
+def _service(name):
+    """Proxy to a service of the current app."""
+    return LocalProxy(lambda: getattr(services(), name))
+
+
+# Services used by the routes, resolved to the current app's on each use
+db = _service("db")
+adb = _service("adb")
+fingerprints = _service("fingerprints")
+symbol_directory = _service("symbol_directory")
+hasher = _service("hasher")
+price_feed = _service("price_feed")
+fragments = _service("fragments")
+leaderboard = _service("leaderboard")
+purger = _service("purger")
+
+# Services of every app created, so buffered quotes are written on exit
+_created = weakref.WeakSet()
+
+
+def create_app(config=None):
+    """
+    Create and configure the application.
+
+    Nothing is connected or loaded here: the database engine (and schema
+    migrations), the quote API client, the session store and the symbol
+    directory are created on first use, so workers, tests and CLI commands
+    start without paying for what they don't touch.
+
+    Args:
+        config: Mapping of settings named like the environment variables in the
+            README (e.g. {"DATABASE_URL": ..., "DATABASE_POOL_SIZE": 10}),
+            missing ones are read from the environment
+
+    Returns:
+        Flask app
+    """
+    config = dict(config or {})
+
+    app = Flask(__name__)
+
+    # Custom filters
+    app.jinja_env.filters["usd"] = usd
+    app.jinja_env.filters["age"] = age
+
+    # Static files are linked by content fingerprint, so they can be cached as immutable
+    fingerprints = caching.StaticFingerprints(app.static_folder)
+    app.jinja_env.globals["static_url"] = fingerprints.url
+
+    # Compress HTML responses (brotli if installed, else gzip)
+    app.config["COMPRESS_HTML"] = setting(config, "COMPRESS_HTML", True, flag)
+    app.config["COMPRESS_MIN_SIZE"] = setting(config, "COMPRESS_MIN_SIZE", 500, int)
+    app.config["COMPRESS_LEVEL"] = setting(config, "COMPRESS_LEVEL", 6, int)
+
+    # Configure SQLAlchemy Core to use SQLite database, connecting (and migrating) on first query
+    database_options = {
+        "production": setting(config, "DATABASE_PRODUCTION", True, flag),
+        "pool_size": setting(config, "DATABASE_POOL_SIZE", 5, int),
+        "max_overflow": setting(config, "DATABASE_MAX_OVERFLOW", 10, int),
+    }
+    app.config["DATABASE_URL"] = setting(config, "DATABASE_URL", "sqlite:///finance.db")
+    db = Database(app.config["DATABASE_URL"], migrate=True, lazy=True, **database_options)
+
+    # Optionally serve the portfolio and quote pages with non-blocking database and quote I/O (see asgi.py)
+    app.config["ASYNC_MODE"] = setting(config, "ASYNC_MODE", False, flag)
+    adb = None
+    if app.config["ASYNC_MODE"]:
+        adb = AsyncDatabase(app.config["DATABASE_URL"], **database_options)
+
+    # Configure session storage: filesystem (default), cookie, sqlite or redis, set up on first request
+    app.config["SESSION_PERMANENT"] = False
+    app.config["SESSION_BACKEND"] = setting(config, "SESSION_BACKEND", "filesystem")
+    app.config["SESSION_REDIS_URL"] = setting(config, "SESSION_REDIS_URL", "redis://localhost:6379/0")
+    app.secret_key = setting(config, "SECRET_KEY")
+    init_session(app, db, lazy=True)
+
+    # Quote API client (created on first fetch), cache and lookup pool
+    quotes = QuoteService(config)
+
+    # Record every quote fetched from the quote API in the prices table
+    price_store = PriceStore(db, batch_size=setting(config, "PRICE_STORE_BATCH", 200, int))
+
+    # Optionally serve recorded quotes at a simulated time instead of calling the quote API
+    # (QUOTE_REPLAY_START is a unix timestamp, an ISO date/time, or "first" for the earliest recorded quote)
+    replay_start = setting(config, "QUOTE_REPLAY_START")
+    replay_clock = None
+    if replay_start:
+        start = price_store.span()[0] if replay_start == "first" else parse_time(replay_start)
+        if start is None:
+            raise RuntimeError("QUOTE_REPLAY_START=first but no prices have been recorded")
+        replay_clock = SimulatedClock(start, speed=setting(config, "QUOTE_REPLAY_SPEED", 1.0, float))
+        quotes.replay_prices(ReplayClient(price_store, replay_clock))
+    elif setting(config, "PRICE_STORE", True, flag):
+        quotes.record_prices(price_store)
+
+    # Known symbols for autocomplete; a listing file in SYMBOLS_FILE also makes lookup reject
+    # unlisted symbols before they reach the quote API, otherwise recorded symbols are suggested
+    symbols_file = setting(config, "SYMBOLS_FILE")
+    if symbols_file:
+        symbol_directory = SymbolDirectory.from_csv(symbols_file, lazy=True)
+    else:
+        symbol_directory = SymbolDirectory.from_prices(db, lazy=True)
+    quotes.use_symbol_directory(symbol_directory)
+
+    # Optionally keep quotes of held symbols fresh in the background (pointless when replaying)
+    refresh_interval = setting(config, "QUOTE_REFRESH_INTERVAL", 0.0, float)
+    refresher = None
+    if refresh_interval > 0 and replay_clock is None:
+        refresher = PriceRefresher(
+            db,
+            quotes.cache,
+            quotes.fetch,
+            interval=refresh_interval,
+            rate=setting(config, "QUOTE_REFRESH_RATE", 5.0, float),
+        )
+        # Quotes must outlive a refresh cycle for handlers to always find them cached
+        quotes.cache.ttl = max(quotes.cache.ttl, 2 * refresh_interval)
+        refresher.start()
+
+    # Password hashing, offloaded to worker processes (PASSWORD_HASH_WORKERS=0 hashes inline)
+    hasher = PasswordHasher(
+        method=setting(config, "PASSWORD_HASH_METHOD", "scrypt"),
+        workers=setting(config, "PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1), int),
+        max_pending=setting(config, "PASSWORD_HASH_MAX_PENDING", 64, int),
+    )
+
+    # One shared poller of the symbols open portfolio pages watch, fanned out to their event streams
+    price_feed = PriceFeed(
+        quotes.lookup_many,
+        interval=setting(config, "FEED_INTERVAL", 5.0, float),
+        max_subscribers=setting(config, "FEED_MAX_SUBSCRIBERS", 10000, int),
+    )
+    app.config["STREAM_HEARTBEAT"] = setting(config, "STREAM_HEARTBEAT", 15.0, float)
+
+    # Rendered portfolio, history and sell fragments per user, dropped when the user trades
+    fragments = FragmentCache(
+        max_bytes=setting(config, "FRAGMENT_CACHE_BYTES", 16 * 1024 * 1024, int),
+        ttl=setting(config, "FRAGMENT_CACHE_TTL", 60.0, float),
+    )
+
+    # Ranking of all accounts for admins, kept up to date as trades commit
+    app.config["ADMIN_USERNAMES"] = {name for name in setting(config, "ADMIN_USERNAMES", "").split(",") if name}
+    leaderboard = Leaderboard(db, quotes.lookup_many, ttl=setting(config, "LEADERBOARD_TTL", 60.0, float))
+
+    # Ledgers of deleted accounts, removed (and optionally archived) in throttled chunks
+    purger = deletion.AccountPurger(
+        db,
+        archive_dir=setting(config, "ACCOUNT_ARCHIVE_DIR"),
+        chunk_size=setting(config, "ACCOUNT_PURGE_CHUNK", 500, int),
+        duty=setting(config, "ACCOUNT_PURGE_DUTY", 0.2, float),
+        interval=setting(config, "ACCOUNT_PURGE_INTERVAL", 30.0, float),
+        lease=setting(config, "ACCOUNT_PURGE_LEASE", 60.0, float),
+    )
+
+    # Opt-in profiles of slow requests
+    profiler = None
+    slow_ms = setting(config, "PROFILE_SLOW_MS", None, float)
+    if slow_ms is not None:
+        profiler = metrics.SlowRequestProfiler(
+            slow_ms,
+            sample_rate=setting(config, "PROFILE_SAMPLE_RATE", 1.0, float),
+            directory=setting(config, "PROFILE_DIR", "profiles"),
+        )
+
+    # Instrumentation: template render timings
+    before_render_template.connect(metrics.before_render, app)
+    template_rendered.connect(metrics.after_render, app)
+
+    # Each app has its own services, so apps created side by side (tests, benchmarks) don't share state
+    app.extensions["quotes"] = quotes
+    app.extensions["finance"] = Services(
+        db=db, adb=adb, quotes=quotes, fingerprints=fingerprints, price_store=price_store, replay_clock=replay_clock,
+        symbol_directory=symbol_directory, refresher=refresher, hasher=hasher, price_feed=price_feed,
+        fragments=fragments, leaderboard=leaderboard, purger=purger, profiler=profiler
+    )
+    _created.add(app.extensions["finance"])
+
+    app.register_blueprint(bp)
+
+    # In async mode the I/O-heavy pages are served by their async versions
+    if app.config["ASYNC_MODE"]:
+        app.view_functions["finance.index"] = index_async
+        app.view_functions["finance.quote"] = quote_async
+
+    return app
+
+
+# Guards creating the default app (see __getattr__)
+_default_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """Create the default app, configured from the environment, when app.app is first used."""
+    if name == "app":
+        with _default_app_lock:
+            if "app" not in globals():
+                globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@atexit.register
+def _flush_prices():
+    """Write buffered quotes on exit."""
+    for created in list(_created):
+        created.price_store.flush()
+
+
+def quote_metrics():
+    """Quote cache and refresher counters of the current app for /metrics"""
+    price_store, refresher = services().price_store, services().refresher
+    stats = quote_cache.stats()
+    samples = [
+        (f"finance_quote_cache_{name}_total", "counter", f"Quote cache {name}.", stats[name])
+        for name in ("hits", "misses", "evictions", "coalesced", "stale")
+    ]
+    samples.append(("finance_quote_cache_size", "gauge", "Symbols in the quote cache.", stats["size"]))
+    samples.append(("finance_prices_recorded_total", "counter", "Quotes written to the price store.", price_store.recorded))
+    samples.append(("finance_feed_subscribers", "gauge", "Open live portfolio streams.", price_feed.subscribers))
+    samples.append(("finance_feed_polls_total", "counter", "Polls of the watched symbols.", price_feed.polls))
+    samples.append(("finance_feed_published_total", "counter", "Price changes published to streams.", price_feed.published))
+    stats = fragments.stats()
+    samples.extend(
+        (f"finance_fragment_cache_{name}_total", "counter", f"Fragment cache {name}.", stats[name])
+        for name in ("hits", "misses", "evictions", "invalidations")
+    )
+    samples.append(("finance_fragment_cache_bytes", "gauge", "Size of cached fragments.", stats["bytes"]))
+    samples.append(("finance_accounts_purged_total", "counter", "Deleted accounts purged.", purger.accounts))
+    samples.append(
+        ("finance_transactions_purged_total", "counter", "Transactions of deleted accounts purged.", purger.transactions)
+    )
+    if refresher is not None:
+        samples.append(("finance_quote_refreshed_total", "counter", "Quotes refreshed in the background.", refresher.refreshed))
+        samples.append(("finance_quote_refresh_failed_total", "counter", "Failed background refreshes.", refresher.failed))
+    return samples
+
+
+metrics.COLLECTORS.append(quote_metrics)
+
+
+@bp.before_app_request
+def before_request():
+    """Start timing (and maybe profiling) the request, and the account purger if it isn't running"""
+    g.request_started = time.perf_counter()
+    # Picks up accounts left marked deleted by an earlier process, once the app serves requests
+    purger.start()
+    if services().profiler is not None:
+        services().profiler.start()
+
+
+@bp.after_app_request
 def after_request(response):
-    """Ensure responses aren't cached"""
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Expires"] = 0
-    response.headers["Pragma"] = "no-cache"
+    """Apply the caching policy, compress HTML and report where the time went"""
+    # Only static files and pages with validators may be cached (see caching.py)
+    caching.apply_policy(response, fingerprints)
+    if current_app.config["COMPRESS_HTML"]:
+        caching.compress(response, current_app.config["COMPRESS_MIN_SIZE"], current_app.config["COMPRESS_LEVEL"])
+
+    if "request_started" in g:
+        elapsed = time.perf_counter() - g.request_started
+        response.headers["Server-Timing"] = metrics.server_timing(elapsed)
+        metrics.request_seconds.observe(
+            elapsed, endpoint=request.endpoint, method=request.method, status=response.status_code
+        )
+        if services().profiler is not None:
+            services().profiler.stop(request.endpoint, elapsed)
     return response
 
 
-@app.route("/")
+@bp.teardown_app_request
+def teardown_request(exception):
+    """Make sure a failed request doesn't leave the profiler running"""
+    active = g.pop("profiler", None)
+    if active is not None:
+        active.disable()
+
+
+@bp.app_errorhandler(PasswordServiceBusy)
+def password_service_busy(e):
+    """Shed load when the password hashing pool is saturated"""
+    return apology("too busy, try again", 503)
+
+
+@bp.route("/metrics")
+def metrics_endpoint():
+    """Expose metrics in Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@bp.route("/")
 @login_required
 def index():
     """Show portfolio of stocks"""
     
-    # Get user's cash balance
-    user = db.execute("SELECT cash FROM users WHERE id = ?", session["user_id"])
+    # Get user's cash balance, ledger version and realized P&L
+    user = db.execute("SELECT cash, ledger_version, realized_pnl FROM users WHERE id = ?", session["user_id"])
     if not user:
         return apology("user not found", 400)
     
-    cash = user[0]["cash"]
+    # Reuse the rendered table while the user hasn't traded and its quotes are still current
+    version = user[0]["ledger_version"]
+    fragment = fragments.get(session["user_id"], "index", version, epoch=_cached_quotes_epoch)
+    if fragment is not None:
+        return render_template("index.html", fragment=Markup(fragment.html))
     
-    # Get all stocks owned by user with total shares
-    # Use GROUP BY and SUM to aggregate shares per symbol
+    # Get all stocks owned by user with shares and average cost basis
     stocks = db.execute(
-        "SELECT symbol, SUM(shares) as total_shares FROM transactions WHERE user_id = ? GROUP BY symbol HAVING SUM(shares) > 0",
+        "SELECT symbol, shares, cost_basis FROM holdings WHERE user_id = ?",
+        session["user_id"]
+    )
+    
+    # Look up current prices for all holdings at once
+    quotes = lookup_many(stock["symbol"] for stock in stocks)
+    
+    # Render template with portfolio data
+    return _render_index(version, _portfolio(user[0], stocks, quotes), quotes)
+
+
+@login_required
+async def index_async():
+    """Show portfolio of stocks, fetching their quotes concurrently on the shared event loop"""
+    
+    # Get user's cash balance, ledger version and realized P&L
+    user = await adb.execute("SELECT cash, ledger_version, realized_pnl FROM users WHERE id = ?", session["user_id"])
+    if not user:
+        return apology("user not found", 400)
+    
+    # Reuse the rendered table while the user hasn't traded and its quotes are still current
+    version = user[0]["ledger_version"]
+    fragment = fragments.get(session["user_id"], "index", version, epoch=_cached_quotes_epoch)
+    if fragment is not None:
+        return render_template("index.html", fragment=Markup(fragment.html))
+    
+    # Get all stocks owned by user with shares and average cost basis
+    stocks = await adb.execute(
+        "SELECT symbol, shares, cost_basis FROM holdings WHERE user_id = ?",
         session["user_id"]
     )
     
+    # Look up current prices for all holdings at once
+    quotes = await lookup_many_async(stock["symbol"] for stock in stocks)
+    
+    # Render template with portfolio data
+    return _render_index(version, _portfolio(user[0], stocks, quotes), quotes)
+
+
+def _render_index(version, portfolio, quotes):
+    """Render portfolio page, caching its table if every quote was found"""
+    html = render_template("portfolio_table.html", **portfolio)
+    if all(quote is not None for quote in quotes.values()):
+        fragments.put(session["user_id"], "index", version, html, epoch=_quotes_epoch(quotes), data={"symbols": list(quotes)})
+    return render_template("index.html", fragment=Markup(html))
+
+
+def _ledger_version(user_id):
+    """Return the ledger version of user_id, bumped by every trade (see fragments)"""
+    user = db.execute("SELECT ledger_version FROM users WHERE id = ?", user_id)
+    return user[0]["ledger_version"] if user else None
+
+
+def _quotes_epoch(quotes):
+    """Identify the quotes a portfolio table was rendered with"""
+    return tuple(quote["fetched_at"] if quote is not None else None for quote in quotes.values())
+
+
+def _cached_quotes_epoch(fragment):
+    """Identify the quotes the quote cache holds now for the symbols of a cached portfolio table"""
+    return _quotes_epoch({symbol: quote_cache.get_cached(symbol) for symbol in fragment.data["symbols"]})
+
+
+def _portfolio(user, stocks, quotes):
+    """Value holdings at quoted prices against their average cost, skipping symbols without a quote"""
+    cash = user["cash"]
     portfolio = []
     grand_total = cash
+    cost_basis = 0.0
     
     # For each stock, get current price and calculate total value
     for stock in stocks:
         symbol = stock["symbol"]
-        shares = stock["total_shares"]
+        shares = stock["shares"]
         
-        # Look up current price
-        quote_data = lookup(symbol)
+        quote_data = quotes.get(symbol.upper())
         if quote_data is None:
             continue
         
         current_price = quote_data["price"]
         total_value = shares * current_price
         grand_total += total_value
+        cost_basis += stock["cost_basis"]
         
         portfolio.append({
             "symbol": symbol,
             "name": quote_data["name"],
             "shares": shares,
             "price": current_price,
-            "total": total_value
+            "total": total_value,
+            "age": time.time() - quote_data["fetched_at"],
+            "average_cost": stock["cost_basis"] / shares,
+            "unrealized_pnl": total_value - stock["cost_basis"]
         })
     
-    # Render template with portfolio data
-    return render_template("index.html", portfolio=portfolio, cash=cash, grand_total=grand_total)
+    # Weights once the total is known
+    for stock in portfolio:
+        stock["weight"] = stock["total"] / grand_total if grand_total else 0.0
+    
+    totals = {
+        "unrealized_pnl": grand_total - cash - cost_basis,
+        "realized_pnl": user["realized_pnl"],
+        "cash_weight": cash / grand_total if grand_total else 1.0,
+    }
+    return {"portfolio": portfolio, "cash": cash, "grand_total": grand_total, "totals": totals}
 
 
-@app.route("/buy", methods=["GET", "POST"])
+@bp.route("/api/portfolio")
+@login_required
+def portfolio_api():
+    """Portfolio analytics as JSON: FIFO cost basis, P&L, allocation and daily equity curve"""
+    
+    user = db.execute("SELECT cash FROM users WHERE id = ?", session["user_id"])
+    if not user:
+        return jsonify(error="user not found"), 400
+    
+    # Current prices of the open positions
+    stocks = db.execute("SELECT symbol FROM holdings WHERE user_id = ?", session["user_id"])
+    quotes = lookup_many(stock["symbol"] for stock in stocks)
+    
+    ledger = analytics.load(db, session["user_id"])
+    
+    curve = request.args.get("curve", "1") != "0"
+    return jsonify(analytics.analyze(ledger, user[0]["cash"], quotes, curve=curve))
+
+
+@bp.route("/api/stream")
+@login_required
+def portfolio_stream():
+    """Server-sent events with price changes of the user's positions and recomputed totals"""
+    # The events are sent once the request context is gone, so they get the services themselves
+    feed, load = services().price_feed, functools.partial(stream_holdings, services().db)
+    try:
+        subscription = feed.subscribe(session["user_id"])
+    except FeedFull:
+        return apology("too many live connections", 503)
+    heartbeat = current_app.config["STREAM_HEARTBEAT"]
+    
+    def events():
+        stream = PortfolioStream(feed, subscription, load)
+        try:
+            yield stream.snapshot()
+            while True:
+                updates, stale = subscription.wait(heartbeat)
+                yield stream.advance(updates, stale) or HEARTBEAT
+        finally:
+            feed.unsubscribe(subscription)
+    
+    # Each open stream holds a server thread here, asgi.py serves it on the event loop instead
+    return Response(events(), mimetype="text/event-stream", headers={"X-Accel-Buffering": "no"})
+
+
+def stream_holdings(db, user_id):
+    """Cash and {symbol: (shares, average cost basis)} of user_id in db for PortfolioStream, as on the portfolio page"""
+    user = db.execute("SELECT cash FROM users WHERE id = ?", user_id)
+    if not user:
+        return 0, {}
+    rows = db.execute("SELECT symbol, shares, cost_basis FROM holdings WHERE user_id = ?", user_id)
+    return user[0]["cash"], {row["symbol"]: (row["shares"], row["cost_basis"]) for row in rows}
+
+
+def session_user(app, environ):
+    """Return user_id of the session carried by a WSGI environ to app, None if not logged in"""
+    with app.request_context(environ):
+        return session.get("user_id")
+
+
+@bp.route("/buy", methods=["GET", "POST"])
 @login_required
 def buy():
     """Buy shares of stock"""
@@ -110,34 +604,43 @@ def buy():
         except ValueError:
             return apology("must provide a positive integer", 400)
 
-        # Get user's current cash
-        user = db.execute("SELECT cash FROM users WHERE id = ?", session["user_id"])
-        if not user:
-            return apology("user not found", 400)
-
-        cash = user[0]["cash"]
         price = quote_data["price"]
         total_cost = shares * price
 
-        # Check if user can afford the purchase
-        if cash < total_cost:
-            return apology("can't afford", 400)
+        # Check funds and record the purchase atomically, so parallel orders can't overdraw
+        with db.transaction() as tx:
+            # Get user's current cash
+            # Accounts being deleted can't trade from sessions opened before the deletion
+            user = tx.execute("SELECT cash FROM users WHERE id = ? AND deleted_at IS NULL", session["user_id"])
+            if not user:
+                return apology("user not found", 400)
 
-        # Insert transaction into database
-        db.execute(
-            "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
-            session["user_id"],
-            symbol,
-            shares,
-            price
-        )
+            cash = user[0]["cash"]
 
-        # Update user's cash
-        db.execute(
-            "UPDATE users SET cash = cash - ? WHERE id = ?",
-            total_cost,
-            session["user_id"]
-        )
+            # Check if user can afford the purchase
+            if cash < total_cost:
+                return apology("can't afford", 400)
+
+            # Insert transaction into database
+            tx.execute(
+                "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
+                session["user_id"],
+                symbol,
+                shares,
+                price
+            )
+            holdings.record_buy(tx, session["user_id"], symbol, shares, price)
+
+            # Update user's cash, and the ledger version cached pages are keyed on
+            tx.execute(
+                "UPDATE users SET cash = cash - ?, ledger_version = ledger_version + 1 WHERE id = ?",
+                total_cost,
+                session["user_id"]
+            )
+
+        leaderboard.record_trade(session["user_id"], symbol, shares, price)
+        price_feed.holdings_changed(session["user_id"])
+        fragments.invalidate(session["user_id"])
 
         # Redirect to home page
         return redirect("/")
@@ -147,37 +650,278 @@ def buy():
         return render_template("buy.html")
 
 
-@app.route("/history")
+@bp.route("/api/orders", methods=["POST"])
+@login_required
+def bulk_orders():
+    """Buy and sell a basket of stocks in one transaction"""
+    
+    # Ensure a list of orders was submitted
+    payload = request.get_json(silent=True)
+    orders = payload.get("orders") if isinstance(payload, dict) else None
+    if not isinstance(orders, list) or not orders:
+        return jsonify(error="must provide a list of orders"), 400
+    if len(orders) > BULK_ORDER_LIMIT:
+        return jsonify(error=f"at most {BULK_ORDER_LIMIT} orders per request"), 400
+    
+    # Validate every order before pricing anything
+    basket = []
+    for i, order in enumerate(orders):
+        if not isinstance(order, dict):
+            return _order_error(i, "order must be an object")
+        symbol = order.get("symbol")
+        side = order.get("side")
+        shares = order.get("shares")
+        if not isinstance(symbol, str) or not symbol:
+            return _order_error(i, "must provide symbol")
+        if side not in ("buy", "sell"):
+            return _order_error(i, "side must be buy or sell")
+        if not isinstance(shares, int) or isinstance(shares, bool) or shares <= 0:
+            return _order_error(i, "must provide a positive integer")
+        basket.append((symbol.upper(), shares if side == "buy" else -shares))
+    
+    # Price every symbol with one batched lookup
+    quotes = lookup_many(symbol for symbol, _ in basket)
+    for i, (symbol, _) in enumerate(basket):
+        if quotes[symbol] is None:
+            return _order_error(i, "invalid symbol")
+    trades = [(symbol, shares, quotes[symbol]["price"]) for symbol, shares in basket]
+    
+    # Check and record the whole basket atomically
+    with db.transaction() as tx:
+        user = tx.execute("SELECT cash FROM users WHERE id = ? AND deleted_at IS NULL", session["user_id"])
+        if not user:
+            return jsonify(error="user not found"), 400
+        current = tx.execute(
+            "SELECT symbol, shares, cost_basis FROM holdings WHERE user_id = ?",
+            session["user_id"]
+        )
+        
+        # Check cash and holdings once, in order, as if the orders were submitted one by one
+        cash = user[0]["cash"]
+        held = {row["symbol"]: row["shares"] for row in current}
+        for i, (symbol, shares, price) in enumerate(trades):
+            if -shares > held.get(symbol, 0):
+                return _order_error(i, "you don't own that many shares")
+            if shares * price > cash:
+                return _order_error(i, "can't afford")
+            cash -= shares * price
+            held[symbol] = held.get(symbol, 0) + shares
+        
+        # Insert all transactions, update holdings and cash with batched writes
+        tx.executemany(
+            "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
+            [(session["user_id"], symbol, shares, price) for symbol, shares, price in trades]
+        )
+        holdings.record_trades(tx, session["user_id"], current, trades)
+        tx.execute(
+            "UPDATE users SET cash = cash - ?, ledger_version = ledger_version + 1 WHERE id = ?",
+            sum(shares * price for _, shares, price in trades),
+            session["user_id"]
+        )
+    
+    for trade in trades:
+        leaderboard.record_trade(session["user_id"], *trade)
+    price_feed.holdings_changed(session["user_id"])
+    fragments.invalidate(session["user_id"])
+    
+    return jsonify(
+        orders=[
+            {
+                "symbol": symbol,
+                "side": "buy" if shares > 0 else "sell",
+                "shares": abs(shares),
+                "price": price,
+                "total": abs(shares) * price
+            }
+            for symbol, shares, price in trades
+        ],
+        cash=cash
+    )
+
+
+def _order_error(index, message):
+    """JSON error response for the order at index of a bulk request"""
+    return jsonify(error=message, order=index), 400
+
+
+@bp.route("/history")
 @login_required
 def history():
-    """Show history of transactions"""
+    """Show history of transactions, one page at a time"""
+    
+    # Ensure page size is a positive integer
+    try:
+        limit = int(request.args.get("limit", HISTORY_PAGE_SIZE))
+        if limit <= 0:
+            return apology("must provide a positive integer", 400)
+    except ValueError:
+        return apology("must provide a positive integer", 400)
+    limit = min(limit, HISTORY_MAX_PAGE_SIZE)
+    
+    # Decode keyset cursor: "before" pages to older transactions, "after" to newer ones
+    try:
+        before = request.args.get("before")
+        after = request.args.get("after")
+        cursor = decode_cursor(before or after) if before or after else None
+    except ValueError:
+        return apology("invalid cursor", 400)
+    
+    # A page rendered since the user last traded is reused as is
+    version = _ledger_version(session["user_id"])
+    fragment = fragments.get(session["user_id"], ("history", request.full_path), version)
+    if fragment is not None:
+        etag, last_modified = fragment.data["etag"], fragment.data["last_modified"]
+    else:
+        latest = db.execute(
+            "SELECT id, timestamp FROM transactions WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            session["user_id"],
+            1
+        )
+        etag = caching.etag_for(
+            "history", session["user_id"], session.get("admin"), latest[0]["id"] if latest else 0, request.full_path
+        )
+        last_modified = _utc(latest[0]["timestamp"]) if latest else None
+    
+    # The page only changes when the user trades, so answer revalidations with 304
+    cached = caching.not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    if fragment is not None:
+        response = current_app.make_response(render_template("history.html", fragment=Markup(fragment.html)))
+        return caching.validators(response, etag, last_modified)
+    
+    # Fetch one row more than needed to know whether there is another page
+    if cursor is None:
+        transactions = db.execute(
+            "SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            session["user_id"],
+            limit + 1
+        )
+    elif before:
+        transactions = db.execute(
+            "SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? AND (timestamp, id) < (?, ?) "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            session["user_id"],
+            *cursor,
+            limit + 1
+        )
+    else:
+        transactions = db.execute(
+            "SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? AND (timestamp, id) > (?, ?) "
+            "ORDER BY timestamp, id LIMIT ?",
+            session["user_id"],
+            *cursor,
+            limit + 1
+        )
+    
+    more = len(transactions) > limit
+    transactions = transactions[:limit]
+    if after:
+        # Newer page was read oldest first, show it most recent first
+        transactions.reverse()
+    
+    # Cursors for the neighbouring pages
+    older = newer = None
+    if transactions:
+        if more or after:
+            older = encode_cursor(transactions[-1]["timestamp"], transactions[-1]["id"])
+        if before or (after and more):
+            newer = encode_cursor(transactions[0]["timestamp"], transactions[0]["id"])
+    
+    # Process transactions to determine type and format data
+    history_data = (_history_row(transaction) for transaction in transactions)
+    
+    # Render transaction history, keeping the table for the next view of this page
+    html = render_template("history_table.html", transactions=history_data, older=older, newer=newer, limit=limit)
+    fragments.put(
+        session["user_id"], ("history", request.full_path), version, html,
+        data={"etag": etag, "last_modified": last_modified}
+    )
+    response = current_app.make_response(render_template("history.html", fragment=Markup(html)))
+    return caching.validators(response, etag, last_modified)
+
+
+@bp.route("/history/export")
+@login_required
+def history_export():
+    """Download full history of transactions as CSV or JSON Lines"""
+    
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "jsonl"):
+        return apology("format must be csv or jsonl", 400)
     
-    # Get all transactions for the user, ordered by timestamp (most recent first)
-    transactions = db.execute(
-        "SELECT symbol, shares, price, timestamp FROM transactions WHERE user_id = ? ORDER BY timestamp DESC",
+    # Rows are read from a server-side cursor while the response is sent
+    transactions = db.iterate(
+        "SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? "
+        "ORDER BY timestamp DESC, id DESC",
         session["user_id"]
     )
     
-    # Process transactions to determine type and format data
-    history_data = []
-    for transaction in transactions:
-        shares = transaction["shares"]
-        transaction_type = "BUY" if shares > 0 else "SELL"
-        shares_abs = abs(shares)
-        
-        history_data.append({
-            "type": transaction_type,
-            "symbol": transaction["symbol"],
-            "shares": shares_abs,
-            "price": transaction["price"],
-            "timestamp": transaction["timestamp"]
-        })
+    def generate():
+        if export_format == "csv":
+            yield "type,symbol,shares,price,timestamp\r\n"
+        for transaction in transactions:
+            row = _history_row(transaction)
+            if export_format == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerow(
+                    [row["type"], row["symbol"], row["shares"], row["price"], row["timestamp"]]
+                )
+                yield buffer.getvalue()
+            else:
+                yield json.dumps(row, default=str) + "\n"
     
-    # Render template with transaction history
-    return render_template("history.html", transactions=history_data)
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=history.{export_format}"}
+    )
+
 
+def _utc(timestamp):
+    """Parse SQLite CURRENT_TIMESTAMP value (UTC) into an aware datetime"""
+    if isinstance(timestamp, datetime):
+        return timestamp.replace(tzinfo=timezone.utc)
+    return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
 
-@app.route("/login", methods=["GET", "POST"])
+
+def _history_row(transaction):
+    """Convert ledger row to a history entry with type and absolute shares"""
+    shares = transaction["shares"]
+    return {
+        "type": "BUY" if shares > 0 else "SELL",
+        "symbol": transaction["symbol"],
+        "shares": abs(shares),
+        "price": transaction["price"],
+        "timestamp": transaction["timestamp"]
+    }
+
+
+@bp.route("/leaderboard")
+@login_required
+@admin_required
+def leaderboard_page():
+    """Rank all accounts by total value"""
+    return render_template("leaderboard.html", accounts=leaderboard.top(_leaderboard_limit()))
+
+
+@bp.route("/api/leaderboard")
+@login_required
+@admin_required
+def leaderboard_api():
+    """Ranking of all accounts as JSON"""
+    return jsonify(leaderboard.top(_leaderboard_limit()))
+
+
+def _leaderboard_limit():
+    """Number of accounts requested with ?limit=, all if missing or invalid"""
+    limit = request.args.get("limit", type=int)
+    return limit if limit and limit > 0 else None
+
+
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     """Log user in"""
 
@@ -196,17 +940,23 @@ def login():
 
         # Query database for username
         rows = db.execute(
-            "SELECT * FROM users WHERE username = ?", request.form.get("username")
+            "SELECT * FROM users WHERE username = ? AND deleted_at IS NULL", request.form.get("username")
         )
 
         # Ensure username exists and password is correct
-        if len(rows) != 1 or not check_password_hash(
-            rows[0]["hash"], request.form.get("password")
-        ):
+        if len(rows) != 1:
+            return apology("invalid username and/or password", 403)
+        matches, new_hash = hasher.verify_and_update(rows[0]["hash"], request.form.get("password"))
+        if not matches:
             return apology("invalid username and/or password", 403)
 
+        # Upgrade hashes made with older parameters while we have the password
+        if new_hash is not None:
+            db.execute("UPDATE users SET hash = ? WHERE id = ?", new_hash, rows[0]["id"])
+
         # Remember which user has logged in
         session["user_id"] = rows[0]["id"]
+        session["admin"] = rows[0]["username"] in current_app.config["ADMIN_USERNAMES"]
 
         # Redirect user to home page
         return redirect("/")
@@ -216,7 +966,7 @@ def login():
         return render_template("login.html")
 
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     """Log user out"""
 
@@ -227,7 +977,7 @@ def logout():
     return redirect("/")
 
 
-@app.route("/profile", methods=["GET", "POST"])
+@bp.route("/profile", methods=["GET", "POST"])
 @login_required
 def profile():
     """Change password or delete account"""
@@ -251,14 +1001,15 @@ def profile():
             delete_password = request.form.get("delete_password")
             
             # Check if password is correct
-            if not check_password_hash(current_hash, delete_password):
+            if not hasher.verify(current_hash, delete_password):
                 return apology("password is incorrect", 400)
             
-            # Delete all user's transactions
-            db.execute("DELETE FROM transactions WHERE user_id = ?", session["user_id"])
-            
-            # Delete user account
-            db.execute("DELETE FROM users WHERE id = ?", session["user_id"])
+            # Mark the account deleted, its transactions are archived and deleted in the background
+            deletion.mark_deleted(db, session["user_id"])
+            purger.wake()
+            leaderboard.remove_user(session["user_id"])
+            price_feed.holdings_changed(session["user_id"])
+            fragments.invalidate(session["user_id"])
             
             # Clear session
             session.clear()
@@ -294,7 +1045,7 @@ def profile():
             confirmation = request.form.get("confirmation")
             
             # Check if current password is correct
-            if not check_password_hash(current_hash, current_password):
+            if not hasher.verify(current_hash, current_password):
                 return apology("current password is incorrect", 400)
             
             # Ensure new password and confirmation match
@@ -302,7 +1053,7 @@ def profile():
                 return apology("new passwords do not match", 400)
             
             # Update password in database
-            new_hash = generate_password_hash(new_password)
+            new_hash = hasher.hash(new_password)
             db.execute(
                 "UPDATE users SET hash = ? WHERE id = ?",
                 new_hash,
@@ -320,7 +1071,7 @@ def profile():
         return render_template("profile.html")
 
 
-@app.route("/quote", methods=["GET", "POST"])
+@bp.route("/quote", methods=["GET", "POST"])
 @login_required
 def quote():
     """Get stock quote."""
@@ -344,12 +1095,81 @@ def quote():
                              symbol=quote_data["symbol"],
                              price=quote_data["price"])
 
+    # User reached route via GET with a symbol (as by submitting the quote form)
+    elif request.args.get("symbol"):
+        quote_data = lookup(request.args.get("symbol"))
+        if quote_data is None:
+            return apology("invalid symbol", 400)
+        return _quoted(quote_data)
+
     # User reached route via GET (as by clicking a link or via redirect)
     else:
         return render_template("quote.html")
 
 
-@app.route("/register", methods=["GET", "POST"])
+def _quoted(quote_data):
+    """Render quote with validators, so it is revalidated instead of re-sent until the price changes"""
+    etag = caching.etag_for(
+        "quoted", session["user_id"], session.get("admin"), quote_data["symbol"], quote_data["price"]
+    )
+    last_modified = datetime.fromtimestamp(quote_data["fetched_at"], timezone.utc)
+    cached = caching.not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    response = current_app.make_response(render_template("quoted.html",
+                                                 name=quote_data["name"],
+                                                 symbol=quote_data["symbol"],
+                                                 price=quote_data["price"]))
+    return caching.validators(response, etag, last_modified)
+
+
+@login_required
+async def quote_async():
+    """Get stock quote through the async quote client."""
+
+    if request.method == "POST":
+        if not request.form.get("symbol"):
+            return apology("must provide symbol", 400)
+
+        quote_data = await lookup_async(request.form.get("symbol"))
+        if quote_data is None:
+            return apology("invalid symbol", 400)
+
+        return render_template("quoted.html",
+                             name=quote_data["name"],
+                             symbol=quote_data["symbol"],
+                             price=quote_data["price"])
+
+    elif request.args.get("symbol"):
+        quote_data = await lookup_async(request.args.get("symbol"))
+        if quote_data is None:
+            return apology("invalid symbol", 400)
+        return _quoted(quote_data)
+
+    else:
+        return render_template("quote.html")
+
+
+@bp.route("/symbols")
+@login_required
+def symbols():
+    """Symbols and companies starting with ?prefix=, for autocomplete"""
+    prefix = request.args.get("prefix", "")
+    limit = request.args.get("limit", SYMBOL_SEARCH_LIMIT, type=int)
+    limit = max(0, min(limit, SYMBOL_SEARCH_MAX_LIMIT))
+
+    # Matches only change when the directory is reloaded
+    etag = caching.etag_for("symbols", symbol_directory.version, prefix.strip().upper(), limit)
+    cached = caching.not_modified(etag)
+    if cached is not None:
+        return cached
+
+    matches = symbol_directory.search(prefix, limit)
+    response = jsonify(prefix=prefix, symbols=[{"symbol": symbol, "name": name} for symbol, name in matches])
+    return caching.validators(response, etag)
+
+
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     """Register user"""
 
@@ -376,14 +1196,17 @@ def register():
             user_id = db.execute(
                 "INSERT INTO users (username, hash) VALUES (?, ?)",
                 request.form.get("username"),
-                generate_password_hash(request.form.get("password"))
+                hasher.hash(request.form.get("password"))
             )
         except ValueError:
             # Username already exists (UNIQUE INDEX constraint)
             return apology("username already exists", 400)
 
+        leaderboard.add_user(user_id)
+
         # Remember which user has logged in
         session["user_id"] = user_id
+        session["admin"] = request.form.get("username") in current_app.config["ADMIN_USERNAMES"]
 
         # Redirect user to home page
         return redirect("/")
@@ -393,7 +1216,7 @@ def register():
         return render_template("register.html")
 
 
-@app.route("/sell", methods=["GET", "POST"])
+@bp.route("/sell", methods=["GET", "POST"])
 @login_required
 def sell():
     """Sell shares of stock"""
@@ -418,22 +1241,6 @@ def sell():
         except ValueError:
             return apology("must provide a positive integer", 400)
         
-        # Check if user owns this stock
-        user_stocks = db.execute(
-            "SELECT symbol, SUM(shares) as total_shares FROM transactions WHERE user_id = ? AND symbol = ? GROUP BY symbol HAVING SUM(shares) > 0",
-            session["user_id"],
-            symbol
-        )
-        
-        if not user_stocks:
-            return apology("you don't own this stock", 400)
-        
-        owned_shares = user_stocks[0]["total_shares"]
-        
-        # Check if user owns enough shares
-        if shares > owned_shares:
-            return apology("you don't own that many shares", 400)
-        
         # Look up the stock symbol to get current price
         quote_data = lookup(symbol)
         if quote_data is None:
@@ -442,31 +1249,101 @@ def sell():
         price = quote_data["price"]
         total_value = shares * price
         
-        # Insert transaction with negative shares (selling)
-        db.execute(
-            "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
-            session["user_id"],
-            symbol,
-            -shares,
-            price
-        )
+        # Check ownership and record the sale atomically, so parallel orders can't oversell
+        with db.transaction() as tx:
+            # Check if user owns this stock
+            user_stocks = tx.execute(
+                "SELECT symbol, shares as total_shares FROM holdings WHERE user_id = ? AND symbol = ?",
+                session["user_id"],
+                symbol
+            )
+            
+            if not user_stocks:
+                return apology("you don't own this stock", 400)
+            
+            owned_shares = user_stocks[0]["total_shares"]
+            
+            # Check if user owns enough shares
+            if shares > owned_shares:
+                return apology("you don't own that many shares", 400)
+            
+            # Insert transaction with negative shares (selling)
+            tx.execute(
+                "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
+                session["user_id"],
+                symbol,
+                -shares,
+                price
+            )
+            holdings.record_sell(tx, session["user_id"], symbol, shares, price)
+            
+            # Update user's cash (add money from sale) and ledger version
+            tx.execute(
+                "UPDATE users SET cash = cash + ?, ledger_version = ledger_version + 1 WHERE id = ?",
+                total_value,
+                session["user_id"]
+            )
         
-        # Update user's cash (add money from sale)
-        db.execute(
-            "UPDATE users SET cash = cash + ? WHERE id = ?",
-            total_value,
-            session["user_id"]
-        )
+        leaderboard.record_trade(session["user_id"], symbol, -shares, price)
+        price_feed.holdings_changed(session["user_id"])
+        fragments.invalidate(session["user_id"])
         
         # Redirect to home page
         return redirect("/")
     
     # User reached route via GET (as by clicking a link or via redirect)
     else:
-        # Get all stocks owned by user
-        stocks = db.execute(
-            "SELECT symbol, SUM(shares) as total_shares FROM transactions WHERE user_id = ? GROUP BY symbol HAVING SUM(shares) > 0",
-            session["user_id"]
-        )
+        # The form lists held symbols, reuse it until the user trades
+        version = _ledger_version(session["user_id"])
+        fragment = fragments.get(session["user_id"], "sell", version)
+        if fragment is None:
+            # Get all stocks owned by user
+            stocks = db.execute(
+                "SELECT symbol, shares as total_shares FROM holdings WHERE user_id = ?",
+                session["user_id"]
+            )
+            
+            fragment = fragments.put(session["user_id"], "sell", version, render_template("sell_form.html", stocks=stocks))
         
-        return render_template("sell.html", stocks=stocks)
+        return render_template("sell.html", fragment=Markup(fragment.html))
+
+
+@bp.cli.command("rebuild-holdings")
+@click.option("--user-id", type=int, help="Only rebuild this user's holdings.")
+def rebuild_holdings(user_id):
+    """Recompute the holdings table and realized P&L from transactions."""
+    count = holdings.rebuild(db, user_id)
+    holdings.rebuild_realized(db, user_id)
+    click.echo(f"Rebuilt {count} positions")
+
+
+@bp.cli.command("verify-holdings")
+@click.option("--user-id", type=int, help="Only verify this user's holdings.")
+def verify_holdings(user_id):
+    """Check the holdings table against transactions."""
+    mismatches = holdings.verify(db, user_id)
+    for mismatch_user, symbol, stored, expected in mismatches:
+        click.echo(f"user {mismatch_user} {symbol}: holdings {stored}, transactions {expected}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} positions out of sync, run flask rebuild-holdings")
+    click.echo("Holdings match transactions")
+
+
+@bp.cli.command("session_cleanup")
+def session_cleanup():
+    """Delete expired sessions (sqlite session backend)."""
+    if delete_expired_sessions(current_app):
+        click.echo("Deleted expired sessions")
+    else:
+        click.echo(f"The {current_app.config['SESSION_BACKEND']} session backend expires sessions on its own")
+
+
+@bp.cli.command("check-query-plans")
+def check_query_plans():
+    """Check that every route query is answered through an index."""
+    failures = schema.check_query_plans(db)
+    for query, plan in failures:
+        click.echo(f"{query}\n    " + "\n    ".join(plan))
+    if failures:
+        raise click.ClickException(f"{len(failures)} queries don't use an index")
+    click.echo(f"All {len(schema.ROUTE_QUERIES)} route queries use an index")
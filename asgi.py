@@ -0,0 +1,124 @@
+"""
+ASGI entry point.
+
+Serves the app in async mode, where the portfolio and quote pages await
+the database and quote API on the shared event loop (see aio), so a page
+fetches all its quotes concurrently:
+
+    uvicorn asgi:app --workers 4
+
+Flask itself is WSGI, so each request still runs in a worker thread and
+holds it until the response is ready, async views included: concurrent
+requests are capped at ASGI_THREADS per worker, as under a threaded WSGI
+server. asgiref's WsgiToAsgi would run them all in one thread; here they
+run in a pool of ASGI_THREADS threads instead. The live portfolio stream
+is the exception: it is served on the event loop, so an idle stream costs
+a coroutine instead of a thread.
+"""
+
+import asyncio
+import functools
+import io
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+os.environ.setdefault("ASYNC_MODE", "1")
+
+import app as finance  # noqa: E402
+
+from feed import HEARTBEAT, FeedFull, PortfolioStream  # noqa: E402
+
+flask_app = finance.app
+services = flask_app.extensions["finance"]
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASGI_THREADS", 64)),
+    thread_name_prefix="asgi",
+)
+
+
+class _PooledInstance(WsgiToAsgiInstance):
+    """WsgiToAsgiInstance running the WSGI app in _executor."""
+
+    run_wsgi_app = SyncToAsync(
+        WsgiToAsgiInstance.__dict__["run_wsgi_app"].func, thread_sensitive=False, executor=_executor
+    )
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi serving requests concurrently from a thread pool."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            # Nothing to set up, but tell the server so it doesn't warn
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        if scope["type"] == "http" and scope["path"] == "/api/stream":
+            return await portfolio_stream(scope, receive, send)
+        await _PooledInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+async def portfolio_stream(scope, receive, send):
+    """Serve /api/stream (see app.portfolio_stream) without holding a thread while idle."""
+    loop = asyncio.get_running_loop()
+
+    # Authenticate through the app's session interface, whichever backend it uses
+    instance = WsgiToAsgiInstance(flask_app)
+    instance.scope = scope
+    environ = instance.build_environ(scope, io.BytesIO())
+    user_id = await loop.run_in_executor(_executor, finance.session_user, flask_app, environ)
+    if user_id is None:
+        return await _respond(send, 302, b"", [(b"location", b"/login")])
+    price_feed = services.price_feed
+    try:
+        subscription = price_feed.subscribe(user_id, loop)
+    except FeedFull:
+        return await _respond(send, 503, b"too many live connections", [(b"content-type", b"text/plain")])
+
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        stream = PortfolioStream(price_feed, subscription, functools.partial(finance.stream_holdings, services.db))
+        event = await loop.run_in_executor(_executor, stream.snapshot)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-store")],
+        })
+        while not disconnected.done():
+            await send({"type": "http.response.body", "body": event.encode(), "more_body": True})
+            waiter = asyncio.ensure_future(subscription.wait_async(flask_app.config["STREAM_HEARTBEAT"]))
+            await asyncio.wait({waiter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                waiter.cancel()
+                break
+            updates, stale = waiter.result()
+            # Reloading holdings queries the database, keep that off the loop
+            if stale:
+                event = await loop.run_in_executor(_executor, stream.advance, updates, stale)
+            else:
+                event = stream.advance(updates, stale) or HEARTBEAT
+    finally:
+        disconnected.cancel()
+        price_feed.unsubscribe(subscription)
+
+
+async def _disconnected(receive):
+    """Return once the client has gone away."""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _respond(send, status, body, headers):
+    """Send a complete response."""
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+app = PooledWsgiToAsgi(flask_app)
@@ -0,0 +1,95 @@
+"""
+Cost of portfolio analytics on a large ledger.
+
+Seeds one user with N transactions, then times loading the ledger into
+arrays and each vectorized pass of analytics, next to a row-by-row Python
+FIFO replay of the same ledger (whose results must match).
+
+    python -m benchmarks.bench_analytics --transactions 100000
+"""
+
+import argparse
+import collections
+import os
+import tempfile
+import time
+
+import analytics
+
+from benchmarks import seed as seeding
+
+
+def replay(rows):
+    """Row-by-row FIFO replay, returns {symbol: (held, open cost, realized)}."""
+    lots = collections.defaultdict(collections.deque)
+    realized = collections.Counter()
+    for row in rows:
+        symbol, shares, price = row["symbol"], row["shares"], row["price"]
+        if shares > 0:
+            lots[symbol].append([shares, price])
+            continue
+        remaining = -shares
+        while remaining and lots[symbol]:
+            lot = lots[symbol][0]
+            taken = min(remaining, lot[0])
+            realized[symbol] += taken * (price - lot[1])
+            lot[0] -= taken
+            remaining -= taken
+            if not lot[0]:
+                lots[symbol].popleft()
+    return {
+        symbol: (sum(lot[0] for lot in queue), sum(lot[0] * lot[1] for lot in queue), realized[symbol])
+        for symbol, queue in lots.items()
+    }
+
+
+def timed(repeat, func, *args):
+    """Return (best seconds of repeat runs, result of the last run)."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portfolio analytics on a large ledger")
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = seeding.seed(os.path.join(workdir, "bench.db"), 1, args.transactions)
+
+        results = []
+        seconds, columns = timed(args.repeat, db.columns, analytics.LEDGER_QUERY, 1)
+        results.append(("load columns", seconds))
+        seconds, rows = timed(args.repeat, db.execute, analytics.LEDGER_QUERY, 1)
+        results.append(("load dicts (execute)", seconds))
+
+        seconds, ledger = timed(args.repeat, analytics.Ledger.from_columns, columns)
+        results.append(("build arrays", seconds))
+        seconds, (held, open_cost, realized) = timed(args.repeat, analytics.fifo, ledger)
+        results.append(("fifo", seconds))
+        seconds, (dates, _) = timed(args.repeat, analytics.equity_curve, ledger, 10_000.0)
+        results.append((f"equity curve ({len(dates)} days)", seconds))
+        seconds, _ = timed(args.repeat, analytics.analyze, ledger, 10_000.0, {})
+        results.append(("analyze (fifo, curve, weights)", seconds))
+        seconds, expected = timed(args.repeat, replay, rows)
+        results.append(("python fifo replay", seconds))
+
+    for i, symbol in enumerate(ledger.symbols):
+        want = expected.get(str(symbol), (0, 0.0, 0.0))
+        got = (held[i], open_cost[i], realized[i])
+        if want[0] != got[0] or abs(want[1] - got[1]) > 1e-3 or abs(want[2] - got[2]) > 1e-3:
+            raise SystemExit(f"{symbol}: vectorized {got} != replay {want}")
+
+    print(f"{args.transactions} transactions, {len(ledger.symbols)} symbols")
+    print(f"{'step':<32}{'ms':>10}")
+    for name, seconds in results:
+        print(f"{name:<32}{seconds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
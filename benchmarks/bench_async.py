@@ -0,0 +1,153 @@
+"""
+Portfolio page served by threaded WSGI versus async mode under uvicorn.
+
+Seeds a scratch database, starts the stub quote server with the given
+latency and runs the app in a subprocess per mode, then drives concurrent
+logged-in HTTP sessions against "/" and reports latency and throughput.
+The quote cache TTL is 0 by default so every page waits on the quote API.
+
+    python -m benchmarks.bench_async --sessions 64 --duration 10 --quote-latency 0.1
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYNC_SERVER = (
+    "import sys; from werkzeug.serving import run_simple; from app import app; "
+    "run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)"
+)
+
+MODES = ("sync", "async")
+
+
+def free_port():
+    """Return a TCP port nobody listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, env, workdir):
+    """Start the app in mode on port, return the process once it answers."""
+    if mode == "sync":
+        command = [sys.executable, "-c", SYNC_SERVER, str(port)]
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "asgi:app", "--app-dir", ROOT,
+            "--port", str(port), "--log-level", "warning", "--no-access-log",
+        ]
+    env = dict(env, ASYNC_MODE="1" if mode == "async" else "0")
+    process = subprocess.Popen(command, env=env, cwd=workdir, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/login", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{mode} server didn't start")
+
+
+def login(base_url, user):
+    """Return HTTP session logged in as user."""
+    client = requests.Session()
+    client.post(f"{base_url}/login", data={"username": user, "password": seeding.PASSWORD})
+    return client
+
+
+def session_worker(client, base_url, deadline, latencies, errors, lock):
+    """Load the portfolio page until deadline."""
+    local = []
+    failed = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = client.get(f"{base_url}/", allow_redirects=False)
+        local.append(time.perf_counter() - started)
+        failed += response.status_code != 200
+    with lock:
+        latencies.extend(local)
+        errors.append(failed)
+
+
+def run(mode, args, env, workdir):
+    """Return (requests, errors, requests per second, p50 ms, p99 ms) for mode."""
+    port = free_port()
+    process = start_server(mode, port, env, workdir)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        # Log in up front, password hashing would otherwise dominate the first seconds
+        clients = [login(base_url, f"user{i % args.users}") for i in range(args.sessions)]
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(target=session_worker, args=(client, base_url, deadline, latencies, errors, lock))
+            for client in clients
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+        process.wait()
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return len(latencies), sum(errors), len(latencies) / args.duration, cuts[49] * 1000, cuts[98] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async serving of the portfolio page")
+    parser.add_argument("--sessions", type=int, default=32, help="concurrent logged-in sessions")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run each mode")
+    parser.add_argument("--users", type=int, default=32, help="users to seed")
+    parser.add_argument("--transactions", type=int, default=200, help="transactions per seeded user")
+    parser.add_argument("--quote-latency", type=float, default=0.1, help="stub quote API latency in seconds")
+    parser.add_argument("--cache-ttl", type=float, default=0, help="quote cache TTL in seconds")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    path = os.path.join(workdir, "bench.db")
+    print(f"Seeding {args.users} users x {args.transactions} transactions into {path}")
+    seeding.seed(path, args.users, args.transactions)
+    stub = start_stub_server(latency=args.quote_latency)
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        DATABASE_URL=f"sqlite:///{path}",
+        QUOTE_API_URL=stub.url,
+        QUOTE_CACHE_TTL=str(args.cache_ttl),
+        SECRET_KEY="benchmark",
+        SESSION_BACKEND="cookie",
+        # Hash inline, worker processes would outlive the terminated server
+        PASSWORD_HASH_WORKERS="0",
+    )
+
+    print(f"{'mode':<8}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode in args.modes:
+        count, failed, rate, p50, p99 = run(mode, args, env, workdir)
+        print(f"{mode:<8}{count:>10}{failed:>8}{rate:>10.1f}{p50:>10.2f}{p99:>10.2f}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Bulk order endpoint versus one form POST per order.
+
+Places the same basket of N orders (buys, then sells of part of each
+position) through /buy and /sell form POSTs and through one POST to
+/api/orders, with a cold quote cache each time, and reports wall time and
+quote API requests.
+
+    python -m benchmarks.bench_bulk_orders --orders 100 --quote-latency 0.05
+"""
+
+import argparse
+import importlib
+import os
+import tempfile
+import time
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+def basket(size):
+    """Return size orders as (symbol, side, shares), every sell covered by an earlier buy."""
+    buys = size // 2 + size % 2
+    orders = [(seeding.SYMBOLS[i % len(seeding.SYMBOLS)], "buy", 10) for i in range(buys)]
+    # Sell only symbols bought above, at most one share per 10 bought
+    bought = seeding.SYMBOLS[:min(buys, len(seeding.SYMBOLS))]
+    orders.extend((bought[i % len(bought)], "sell", 1) for i in range(size - buys))
+    return orders
+
+
+def place_forms(client, orders):
+    """Submit orders as form POSTs, return number of failures."""
+    failed = 0
+    for symbol, side, shares in orders:
+        response = client.post(f"/{side}", data={"symbol": symbol, "shares": str(shares)})
+        failed += response.status_code != 302
+    return failed
+
+
+def place_bulk(client, orders):
+    """Submit orders as one bulk request, return number of failures."""
+    response = client.post(
+        "/api/orders",
+        json={"orders": [{"symbol": symbol, "side": side, "shares": shares} for symbol, side, shares in orders]}
+    )
+    return 0 if response.status_code == 200 else len(orders)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk orders vs form POSTs")
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--quote-latency", type=float, default=0.05, help="stub quote API latency in seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    path = os.path.join(workdir, "bench.db")
+    seeding.seed(path, 2, 0)
+    stub = start_stub_server(latency=args.quote_latency)
+
+    # The app reads its configuration from the environment at import
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["QUOTE_API_URL"] = stub.url
+    os.chdir(workdir)
+    app_module = importlib.import_module("app")
+
+    orders = basket(args.orders)
+    print(f"{args.orders} orders, quote API latency {args.quote_latency * 1000:.0f} ms")
+    print(f"{'path':<8}{'best ms':>10}{'quote requests':>16}{'failed':>8}")
+    for name, user, place in (("forms", "user0", place_forms), ("bulk", "user1", place_bulk)):
+        client = app_module.app.test_client()
+        client.post("/login", data={"username": user, "password": seeding.PASSWORD})
+        best = float("inf")
+        for _ in range(args.repeat):
+            app_module.app.extensions["quotes"].cache.invalidate()
+            requests_before = stub.requests
+            started = time.perf_counter()
+            failed = place(client, orders)
+            best = min(best, time.perf_counter() - started)
+            quote_requests = stub.requests - requests_before
+        print(f"{name:<8}{best * 1000:>10.1f}{quote_requests:>16}{failed:>8}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
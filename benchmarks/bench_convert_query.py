@@ -0,0 +1,59 @@
+"""
+Per-call cost of preparing a query in database.Database.
+
+Compares the original per-call translation (re.sub over the SQL, a new
+text() clause and sniffing the statement type) with the memoized
+Database._convert_query, for the query strings used by app.py.
+
+    python -m benchmarks.bench_convert_query --number 100000
+"""
+
+import argparse
+import re
+import timeit
+
+from sqlalchemy import text
+
+from database import Database
+
+
+QUERIES = [
+    ("SELECT cash FROM users WHERE id = ?", (1,)),
+    ("SELECT * FROM users WHERE username = ?", ("alice",)),
+    ("INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)", (1, "AAPL", 10, 123.45)),
+    ("UPDATE users SET cash = cash - ? WHERE id = ?", (1234.5, 1)),
+]
+
+
+def legacy_prepare(query, args):
+    """Translation as done on every call before memoization."""
+    query_upper = query.strip().upper()
+    param_index = 1
+
+    def replace_placeholder(match):
+        nonlocal param_index
+        param_name = f"param{param_index}"
+        param_index += 1
+        return f":{param_name}"
+
+    converted_query = re.sub(r'\?', replace_placeholder, query)
+    params = {f"param{i}": arg for i, arg in enumerate(args, start=1)}
+    return text(converted_query), params, query_upper.startswith("SELECT")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query preparation cost")
+    parser.add_argument("--number", type=int, default=100000, help="calls per query")
+    args = parser.parse_args()
+
+    db = Database("sqlite://")
+
+    print(f"{'query':<50}{'before (us)':>14}{'after (us)':>14}")
+    for query, params in QUERIES:
+        before = timeit.timeit(lambda: legacy_prepare(query, params), number=args.number)
+        after = timeit.timeit(lambda: db._convert_query(query, params), number=args.number)
+        print(f"{query[:48]:<50}{before / args.number * 1e6:>14.2f}{after / args.number * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Write throughput of database.Database under concurrent writers.
+
+Each writer repeatedly performs the statements of a purchase (read cash,
+insert transaction, update cash) against a scratch SQLite file, with the
+default settings and with production mode (WAL, pooled connections).
+
+    python -m benchmarks.bench_db_writers --duration 5
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from database import Database
+
+
+def make_database(path, production, writers):
+    """Create scratch database with one user per writer."""
+    db = Database(f"sqlite:///{path}", production=production, pool_size=writers, max_overflow=0, migrate=True)
+    for i in range(writers):
+        db.execute("INSERT INTO users (username, hash, cash) VALUES (?, ?, ?)", f"user{i}", "x", 1e12)
+    return db
+
+
+def writer(db, user_id, deadline, counts):
+    """Perform purchases until deadline."""
+    trades = errors = 0
+    while time.perf_counter() < deadline:
+        try:
+            db.execute("SELECT cash FROM users WHERE id = ?", user_id)
+            db.execute(
+                "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
+                user_id, "AAPL", 1, 100.0
+            )
+            db.execute("UPDATE users SET cash = cash - ? WHERE id = ?", 100.0, user_id)
+            trades += 1
+        except OperationalError:
+            # "database is locked"
+            errors += 1
+    counts.append((trades, errors))
+
+
+def run(production, writers, duration):
+    """Return (trades per second, locked errors) for one configuration."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_database(os.path.join(tmp, "bench.db"), production, writers)
+        counts = []
+        deadline = time.perf_counter() + duration
+        threads = [
+            threading.Thread(target=writer, args=(db, i + 1, deadline, counts))
+            for i in range(writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        db.engine.dispose()
+
+    trades = sum(t for t, _ in counts)
+    errors = sum(e for _, e in counts)
+    return trades / duration, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent writer throughput")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per configuration")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'writers':>8}{'trades/s':>12}{'locked':>8}")
+    for production in (False, True):
+        for writers in args.writers:
+            rate, errors = run(production, writers, args.duration)
+            mode = "production" if production else "default"
+            print(f"{mode:<12}{writers:>8}{rate:>12.1f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
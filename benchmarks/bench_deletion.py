@@ -0,0 +1,160 @@
+"""
+Buy latency while a large account is deleted.
+
+Seeds a database where one account has a ledger of N transactions, then,
+for each mode, keeps other users buying through the app while that account
+is deleted, and reports how long the delete request took, how long until
+the account was gone, and buy latency before and during the deletion.
+
+- inline: the old delete path, one DELETE of the whole ledger in the request
+- purge: the account is marked deleted and AccountPurger removes the ledger
+  in throttled chunks, archiving it with --archive
+
+    python -m benchmarks.bench_deletion --ledger 500000 --buyers 4
+"""
+
+import argparse
+import importlib
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+MODES = ("inline", "purge")
+
+
+def seed_ledger(path, users, size):
+    """Seed users, then give user0 a ledger of size transactions."""
+    seeding.seed(path, users, 10)
+    conn = sqlite3.connect(path)
+    user_id = conn.execute("SELECT id FROM users WHERE username = 'user0'").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO transactions (user_id, symbol, shares, price, timestamp) VALUES (?, ?, 1, 100.0, ?)",
+        (
+            (user_id, seeding.SYMBOLS[i % len(seeding.SYMBOLS)], f"2020-01-01 00:00:{i % 60:02d}")
+            for i in range(size)
+        )
+    )
+    conn.commit()
+    conn.close()
+    return user_id
+
+
+def buyer(client, stop, samples):
+    """Buy one share at a time until stop is set, recording (finished at, latency)."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        client.post("/buy", data={"symbol": "AAPL", "shares": "1"})
+        finished = time.perf_counter()
+        samples.append((finished, finished - started))
+
+
+def summary(latencies):
+    """Return (count, p50, p99, max) of latencies in milliseconds."""
+    if len(latencies) < 2:
+        return len(latencies), 0.0, 0.0, 0.0
+    cuts = statistics.quantiles(latencies, n=100)
+    return len(latencies), cuts[49] * 1000, cuts[98] * 1000, max(latencies) * 1000
+
+
+def run(app_module, mode, path, user_id, config, args):
+    """Delete user_id in mode while buyers run, return measurements."""
+    flask_app = app_module.create_app(dict(config, DATABASE_URL=f"sqlite:///{path}"))
+    clients = []
+    for i in range(1, args.buyers + 1):
+        client = flask_app.test_client()
+        client.post("/login", data={"username": f"user{i}", "password": seeding.PASSWORD})
+        # Warm the quote cache and the connection pool
+        client.post("/buy", data={"symbol": "AAPL", "shares": "1"})
+        clients.append(client)
+
+    stop = threading.Event()
+    samples = []
+    threads = [threading.Thread(target=buyer, args=(client, stop, samples)) for client in clients]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.baseline)
+
+    services = flask_app.extensions["finance"]
+    db = services.db
+    started = time.perf_counter()
+    if mode == "inline":
+        db.execute("DELETE FROM transactions WHERE user_id = ?", user_id)
+        db.execute("DELETE FROM holdings WHERE user_id = ?", user_id)
+        db.execute("DELETE FROM users WHERE id = ?", user_id)
+        requested = gone = time.perf_counter()
+    else:
+        app_module.deletion.mark_deleted(db, user_id)
+        services.purger.wake()
+        requested = time.perf_counter()
+        while db.execute("SELECT id FROM users WHERE id = ?", user_id):
+            time.sleep(0.05)
+        gone = time.perf_counter()
+
+    # Buys blocked behind an inline DELETE only finish after it
+    time.sleep(0.5)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    services.stop()
+
+    before = [latency for finished, latency in samples if finished < started]
+    # Every buy in flight at some point between the start of the deletion and the account being gone
+    during = [latency for finished, latency in samples if finished >= started and finished - latency <= gone]
+    return requested - started, gone - started, summary(before), summary(during)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buy latency during a large account deletion")
+    parser.add_argument("--ledger", type=int, default=500000, help="transactions of the deleted account")
+    parser.add_argument("--buyers", type=int, default=4, help="users buying concurrently")
+    parser.add_argument("--baseline", type=float, default=2.0, help="seconds of buying before the deletion")
+    parser.add_argument("--chunk", type=int, default=500, help="ACCOUNT_PURGE_CHUNK")
+    parser.add_argument("--duty", type=float, default=0.2, help="ACCOUNT_PURGE_DUTY")
+    parser.add_argument("--archive", action="store_true", help="archive the purged ledger")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    template = os.path.join(workdir, "template.db")
+    user_id = seed_ledger(template, args.buyers + 1, args.ledger)
+    stub = start_stub_server()
+    config = {
+        "QUOTE_API_URL": stub.url,
+        "QUOTE_CACHE_TTL": 3600,
+        "PASSWORD_HASH_WORKERS": 0,
+        "SESSION_BACKEND": "cookie",
+        "SECRET_KEY": "benchmark",
+        "FRAGMENT_CACHE_BYTES": 0,
+        "ACCOUNT_PURGE_CHUNK": args.chunk,
+        "ACCOUNT_PURGE_DUTY": args.duty,
+        "ACCOUNT_ARCHIVE_DIR": os.path.join(workdir, "archive") if args.archive else None,
+    }
+    os.chdir(workdir)
+    app_module = importlib.import_module("app")
+
+    print(f"deleting a ledger of {args.ledger} transactions, {args.buyers} buyers")
+    print(
+        f"{'mode':<8}{'request ms':>12}{'gone s':>8}"
+        f"{'before p50':>12}{'p99':>8}{'during p50':>12}{'p99':>8}{'max ms':>9}{'buys':>7}"
+    )
+    for mode in args.modes:
+        path = os.path.join(workdir, f"{mode}.db")
+        shutil.copy(template, path)
+        requested, gone, before, during = run(app_module, mode, path, user_id, config, args)
+        print(
+            f"{mode:<8}{requested * 1000:>12.1f}{gone:>8.2f}{before[1]:>12.2f}{before[2]:>8.2f}"
+            f"{during[1]:>12.2f}{during[2]:>8.2f}{during[3]:>9.1f}{during[0]:>7}"
+        )
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Rendered fragment cache hit and miss latency.
+
+Seeds users with a long ledger, then times the portfolio, history and sell
+pages through the app with the fragment cache disabled (every view queries
+and renders), and enabled with warm entries. Quotes come from the stub API
+and stay cached for the whole run, so only the page work is measured.
+
+    python -m benchmarks.bench_fragments --transactions 1000 --requests 500
+"""
+
+import argparse
+import importlib
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+PAGES = ("/", "/history", "/sell")
+
+
+def percentiles(client, path, requests):
+    """GET path requests times, return (p50, p99) latency in milliseconds."""
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get(path)
+        timings.append(time.perf_counter() - started)
+    cuts = statistics.quantiles(timings, n=100)
+    return cuts[49] * 1000, cuts[98] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fragment cache latency")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--transactions", type=int, default=1000, help="transactions per seeded user")
+    parser.add_argument("--requests", type=int, default=500, help="requests per page and mode")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    path = os.path.join(workdir, "bench.db")
+    seeding.seed(path, args.users, args.transactions)
+    stub = start_stub_server()
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["QUOTE_API_URL"] = stub.url
+    os.environ["QUOTE_CACHE_TTL"] = "3600"
+    os.environ["PASSWORD_HASH_WORKERS"] = "0"
+    os.chdir(workdir)
+    app_module = importlib.import_module("app")
+    client = app_module.app.test_client()
+    client.post("/login", data={"username": "user0", "password": seeding.PASSWORD})
+    fragments = app_module.app.extensions["finance"].fragments
+    max_bytes = fragments.max_bytes
+
+    print(f"{args.transactions} transactions, {args.requests} requests per page")
+    print(f"{'page':<12}{'miss p50':>10}{'miss p99':>10}{'hit p50':>10}{'hit p99':>10}")
+    for page in PAGES:
+        # Warm the quote cache either way
+        client.get(page)
+        fragments.max_bytes = 0
+        fragments.clear()
+        miss = percentiles(client, page, args.requests)
+        fragments.max_bytes = max_bytes
+        client.get(page)
+        hits_before = fragments.hits
+        hit = percentiles(client, page, args.requests)
+        if fragments.hits - hits_before < args.requests:
+            print(f"  {page}: only {fragments.hits - hits_before} of {args.requests} requests hit")
+        print(f"{page:<12}{miss[0]:>10.2f}{miss[1]:>10.2f}{hit[0]:>10.2f}{hit[1]:>10.2f}")
+    print(fragments.stats())
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
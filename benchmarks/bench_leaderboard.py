@@ -0,0 +1,80 @@
+"""
+Cost of ranking every account.
+
+Compares valuing each user the way the portfolio page does (one query and
+a quote lookup per held symbol, per user) with Leaderboard.rebuild() (one
+query and one batched lookup), then times reading the cached ranking and
+applying a trade to it.
+
+    python -m benchmarks.bench_leaderboard --users 1000 --quote-latency 0.02
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+def per_user(db, lookup):
+    """Value every account one user at a time, return {user_id: value}."""
+    values = {}
+    for user in db.execute("SELECT id, cash FROM users"):
+        value = user["cash"]
+        for stock in db.execute("SELECT symbol, shares FROM holdings WHERE user_id = ?", user["id"]):
+            quote = lookup(stock["symbol"])
+            if quote is not None:
+                value += stock["shares"] * quote["price"]
+        values[user["id"]] = value
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Leaderboard over all accounts")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=50, help="transactions per user")
+    parser.add_argument("--quote-latency", type=float, default=0.02, help="stub quote API latency in seconds")
+    args = parser.parse_args()
+
+    stub = start_stub_server(latency=args.quote_latency)
+    # helpers builds its quote client from the environment at import
+    os.environ["QUOTE_API_URL"] = stub.url
+    import helpers
+    from leaderboard import Leaderboard
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = seeding.seed(os.path.join(workdir, "bench.db"), args.users, args.transactions)
+
+        helpers.quote_cache.invalidate()
+        started = time.perf_counter()
+        per_user(db, helpers.lookup)
+        naive = time.perf_counter() - started
+
+        helpers.quote_cache.invalidate()
+        board = Leaderboard(db, helpers.lookup_many)
+        started = time.perf_counter()
+        board.rebuild()
+        rebuild = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(1000):
+            board.top(10)
+        top = (time.perf_counter() - started) / 1000
+
+        started = time.perf_counter()
+        for i in range(1000):
+            board.record_trade(1 + i % args.users, "AAPL", 1, 100.0)
+        trade = (time.perf_counter() - started) / 1000
+    stub.shutdown()
+
+    print(f"{args.users} users, quote API latency {args.quote_latency * 1000:.0f} ms")
+    print(f"{'per-user valuation (cold cache)':<36}{naive * 1000:>12.2f} ms")
+    print(f"{'Leaderboard.rebuild (cold cache)':<36}{rebuild * 1000:>12.2f} ms")
+    print(f"{'Leaderboard.top(10)':<36}{top * 1e6:>12.2f} us")
+    print(f"{'Leaderboard.record_trade':<36}{trade * 1e6:>12.2f} us")
+
+
+if __name__ == "__main__":
+    main()
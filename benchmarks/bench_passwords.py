@@ -0,0 +1,109 @@
+"""
+Mixed login and portfolio traffic with inline versus offloaded password hashing.
+
+Some threads log in over and over while others load the portfolio page.
+Each mode is run with hashing in the request thread (workers 0) and in a
+pool of worker processes, reporting logins per second and the latency of
+the portfolio page next to them.
+
+    python -m benchmarks.bench_passwords --login-threads 8 --page-threads 8 --workers 0 4
+"""
+
+import argparse
+import importlib
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+def login_worker(app, user, deadline, counts, lock):
+    """Log in as user until deadline."""
+    client = app.test_client()
+    done = 0
+    while time.perf_counter() < deadline:
+        response = client.post("/login", data={"username": user, "password": seeding.PASSWORD})
+        done += response.status_code == 302
+    with lock:
+        counts.append(done)
+
+
+def page_worker(client, deadline, latencies, lock):
+    """Load the portfolio page with logged-in client until deadline."""
+    local = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        client.get("/")
+        local.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(local)
+
+
+def run(app, args):
+    """Return (logins per second, pages per second, page p50 ms, page p99 ms)."""
+    # Page sessions log in up front, so only logins compete for the hasher during the run
+    clients = []
+    for i in range(args.page_threads):
+        client = app.test_client()
+        client.post("/login", data={"username": f"user{i % args.users}", "password": seeding.PASSWORD})
+        clients.append(client)
+
+    counts = []
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=login_worker, args=(app, f"user{i % args.users}", deadline, counts, lock))
+        for i in range(args.login_threads)
+    ] + [
+        threading.Thread(target=page_worker, args=(client, deadline, latencies, lock))
+        for client in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return sum(counts) / args.duration, len(latencies) / args.duration, cuts[49] * 1000, cuts[98] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing under mixed traffic")
+    parser.add_argument("--login-threads", type=int, default=8)
+    parser.add_argument("--page-threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--method", default="scrypt", help="Werkzeug hash method")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4], help="hashing processes per run")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    path = os.path.join(workdir, "bench.db")
+    seeding.seed(path, args.users, 50)
+    stub = start_stub_server()
+
+    config = {
+        "DATABASE_URL": f"sqlite:///{path}",
+        "QUOTE_API_URL": stub.url,
+        "PASSWORD_HASH_METHOD": args.method,
+    }
+    os.chdir(workdir)
+    app_module = importlib.import_module("app")
+
+    print(f"{'workers':<10}{'logins/s':>10}{'pages/s':>10}{'page p50 ms':>14}{'page p99 ms':>14}")
+    for workers in args.workers:
+        flask_app = app_module.create_app(dict(config, PASSWORD_HASH_WORKERS=workers))
+        logins, pages, p50, p99 = run(flask_app, args)
+        # Shut down this app's hashing pool before the next one starts its own
+        flask_app.extensions["finance"].stop()
+        print(f"{workers:<10}{logins:>10.1f}{pages:>10.1f}{p50:>14.2f}{p99:>14.2f}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Recording quotes into the price store and replaying them.
+
+Fetches every symbol in SYMBOLS from a jittery stub quote API for a number
+of rounds with recording on, then replays the same rounds through lookup
+at a simulated clock, checking that every replayed price matches the one
+recorded in that round.
+
+    python -m benchmarks.bench_replay --rounds 50 --quote-latency 0.02
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price store recording and replay")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--quote-latency", type=float, default=0.02, help="stub quote API latency in seconds")
+    args = parser.parse_args()
+
+    stub = start_stub_server(latency=args.quote_latency, jitter=0.01)
+    # helpers builds its quote client from the environment at import
+    os.environ["QUOTE_API_URL"] = stub.url
+    import helpers
+    from pricestore import PriceStore, ReplayClient, SimulatedClock
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = seeding.seed(os.path.join(workdir, "bench.db"), 1, 0)
+        store = PriceStore(db)
+        helpers.record_prices(store)
+
+        # Record: every lookup goes to the quote API, remember what each round saw and when it ended
+        rounds = []
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            helpers.quote_cache.invalidate()
+            quotes = helpers.lookup_many(seeding.SYMBOLS)
+            rounds.append((time.time(), {symbol: quote["price"] for symbol, quote in quotes.items()}))
+        store.flush()
+        record = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(workdir, "bench.db"))
+
+        # Replay the same rounds at a clock that only moves when told to
+        helpers.record_prices(None)
+        clock = SimulatedClock(rounds[0][0], speed=0)
+        helpers.replay_prices(ReplayClient(store, clock))
+        mismatches = 0
+        requests_before = stub.requests
+        started = time.perf_counter()
+        for ended, recorded in rounds:
+            clock.set(ended)
+            for symbol, quote in helpers.lookup_many(seeding.SYMBOLS).items():
+                mismatches += quote is None or quote["price"] != recorded[symbol]
+        replay = time.perf_counter() - started
+        quote_requests = stub.requests - requests_before
+    stub.shutdown()
+
+    lookups = args.rounds * len(seeding.SYMBOLS)
+    print(f"{lookups} lookups over {args.rounds} rounds, quote API latency {args.quote_latency * 1000:.0f} ms")
+    print(f"{'record (live quote API)':<28}{record * 1000:>10.1f} ms{lookups / record:>12.0f} lookups/s")
+    print(f"{'replay (simulated clock)':<28}{replay * 1000:>10.1f} ms{lookups / replay:>12.0f} lookups/s")
+    print(f"recorded {store.recorded} quotes, database {size / 1024:.0f} KiB")
+    print(f"replay: {mismatches} mismatched prices, {quote_requests} quote API requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Per-request cost of the session backends.
+
+Each backend serves a tiny app whose route reads the session and writes a
+counter back, the way an authenticated request touches the session. The
+redis backend runs against the in-process MemoryRedis stand-in unless
+--redis-url points to a real server.
+
+    python -m benchmarks.bench_sessions --requests 2000 --threads 4
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from flask import Flask, session
+
+from database import Database
+from sessions import BACKENDS, init_session
+
+
+def make_app(backend, workdir, redis_url):
+    """Create app using backend for sessions."""
+    app = Flask(__name__)
+    app.config["SESSION_PERMANENT"] = False
+    app.config["SESSION_BACKEND"] = backend
+    app.config["SESSION_FILE_DIR"] = os.path.join(workdir, "flask_session")
+    app.config["SESSION_REDIS_URL"] = redis_url
+    app.secret_key = "benchmark"
+
+    db = Database(f"sqlite:///{os.path.join(workdir, backend + '.db')}", production=True, migrate=True)
+    init_session(app, db)
+
+    @app.route("/")
+    def touch():
+        session["user_id"] = 1
+        session["hits"] = session.get("hits", 0) + 1
+        return str(session["hits"])
+
+    return app
+
+
+def worker(app, count, latencies, lock):
+    """Issue count requests in one client session."""
+    client = app.test_client()
+    local = []
+    for _ in range(count):
+        started = time.perf_counter()
+        client.get("/")
+        local.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(local)
+
+
+def run(backend, requests, threads, redis_url):
+    """Return (requests per second, p50 ms, p99 ms) for backend."""
+    with tempfile.TemporaryDirectory() as workdir:
+        app = make_app(backend, workdir, redis_url)
+        latencies = []
+        lock = threading.Lock()
+        started = time.perf_counter()
+        pool = [
+            threading.Thread(target=worker, args=(app, requests // threads, latencies, lock))
+            for _ in range(threads)
+        ]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return len(latencies) / elapsed, cuts[49] * 1000, cuts[98] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session backend cost")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--redis-url", default="memory://")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    print(f"{'backend':<12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for backend in args.backends:
+        rate, p50, p99 = run(backend, args.requests, args.threads, args.redis_url)
+        print(f"{backend:<12}{rate:>10.1f}{p50:>10.3f}{p99:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
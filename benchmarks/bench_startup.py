@@ -0,0 +1,109 @@
+"""
+Cold start of the app.
+
+Starts fresh interpreters against a seeded database and times, in each,
+importing app, create_app(), the first request (which opens the database
+and sets up the session store) and a second one, then reports the median
+of every phase and, from `python -X importtime`, the modules whose import
+costs the most.
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import seed as seeding
+from benchmarks.bench_async import ROOT
+
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+client = flask_app.test_client()
+# Logged in without a password check, so the request only pays for setting up
+with client.session_transaction() as session:
+    session["user_id"] = 1
+client.get("/history")
+first = time.perf_counter()
+client.get("/history?limit=10")
+second = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "first request": first - created,
+    "second request": second - first,
+    "modules": sorted(sys.modules),
+}))
+"""
+
+
+def importtimes(stderr):
+    """Parse -X importtime output into {module: (cumulative seconds, nesting depth)}."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(cumulative) / 1e6, depth)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start cost of the app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="heaviest imports to list")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    path = os.path.join(workdir, "bench.db")
+    seeding.seed(path, 1, 100)
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        DATABASE_URL=f"sqlite:///{path}",
+        SECRET_KEY="benchmark",
+        PASSWORD_HASH_WORKERS="0",
+    )
+
+    phases = {}
+    imports = {}
+    for _ in range(args.runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            env=env, cwd=workdir, capture_output=True, text=True, check=True,
+        )
+        timings = json.loads(result.stdout.splitlines()[-1])
+        loaded = set(timings.pop("modules"))
+        for phase, seconds in timings.items():
+            phases.setdefault(phase, []).append(seconds)
+        for module, (seconds, depth) in importtimes(result.stderr).items():
+            imports.setdefault(module, (depth, []))[1].append(seconds)
+
+    print(f"median of {args.runs} cold starts (import times include -X importtime overhead)")
+    for phase, samples in phases.items():
+        print(f"{phase:<18}{statistics.median(samples) * 1000:>10.1f} ms")
+
+    # Third-party packages and the app's own modules, not every submodule
+    print(f"\n{'heaviest imports':<40}{'ms':>10}")
+    ranked = sorted(
+        ((statistics.median(samples), module) for module, (depth, samples) in imports.items() if depth <= 1),
+        reverse=True,
+    )
+    for seconds, module in ranked[:args.top]:
+        print(f"{module:<40}{seconds * 1000:>10.1f}")
+    print(f"\nrequests imported: {'requests' in loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Many open live portfolio streams.
+
+Runs the app threaded under WSGI and under uvicorn (async mode, where
+/api/stream is served on the event loop), opens N event streams spread
+over the seeded users and holds them while the stub quote API's prices
+move. Reports server memory and threads with the streams open, events
+delivered, and quote API requests per second, which should depend on the
+number of watched symbols and not on N.
+
+    python -m benchmarks.bench_stream --streams 1000 --duration 20
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import tempfile
+import time
+
+from benchmarks import seed as seeding
+from benchmarks.bench_async import MODES, ROOT, free_port, login, start_server
+from benchmarks.stub_quote_server import start_stub_server
+
+
+def process_status(pid):
+    """Return (resident MiB, threads) of process pid, from /proc."""
+    with open(f"/proc/{pid}/status") as f:
+        status = f.read()
+    rss = int(re.search(r"VmRSS:\s+(\d+)", status).group(1)) / 1024
+    threads = int(re.search(r"Threads:\s+(\d+)", status).group(1))
+    return rss, threads
+
+
+async def listen(port, cookie, opened, counts, stop):
+    """Open one event stream with cookie and count the events it receives until stop is set."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"GET /api/stream HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\nAccept: text/event-stream\r\n\r\n".encode()
+    )
+    await writer.drain()
+    opened.append(True)
+    try:
+        while not stop.is_set():
+            try:
+                line = await asyncio.wait_for(reader.readline(), 1)
+            except asyncio.TimeoutError:
+                continue
+            if not line:
+                break
+            if line.startswith(b"event: "):
+                name = line[7:].strip().decode()
+                counts[name] = counts.get(name, 0) + 1
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def hold(port, cookies, args, process, stub):
+    """Open the streams, hold them for the duration, return measurements."""
+    opened = []
+    counts = {}
+    stop = asyncio.Event()
+    tasks = []
+    for i in range(args.streams):
+        tasks.append(asyncio.ensure_future(listen(port, cookies[i % len(cookies)], opened, counts, stop)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.05)
+    while len(opened) < args.streams:
+        await asyncio.sleep(0.1)
+    # Let every stream get its snapshot before measuring
+    deadline = time.monotonic() + 30
+    while counts.get("snapshot", 0) < args.streams and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+    requests_before = stub.requests
+    started = time.monotonic()
+    await asyncio.sleep(args.duration)
+    quote_rate = (stub.requests - requests_before) / (time.monotonic() - started)
+    rss, threads = process_status(process.pid)
+
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return counts.get("snapshot", 0), counts.get("prices", 0), quote_rate, rss, threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open live portfolio streams")
+    parser.add_argument("--streams", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--transactions", type=int, default=20, help="transactions per seeded user")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to hold the streams")
+    parser.add_argument("--interval", type=float, default=1.0, help="FEED_INTERVAL and quote cache TTL")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    path = os.path.join(workdir, "bench.db")
+    seeding.seed(path, args.users, args.transactions)
+    stub = start_stub_server(jitter=0.01)
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        DATABASE_URL=f"sqlite:///{path}",
+        QUOTE_API_URL=stub.url,
+        QUOTE_CACHE_TTL=str(args.interval),
+        FEED_INTERVAL=str(args.interval),
+        SECRET_KEY="benchmark",
+        SESSION_BACKEND="cookie",
+        # Hash inline, worker processes would outlive the terminated server
+        PASSWORD_HASH_WORKERS="0",
+    )
+
+    print(f"{args.streams} streams over {args.users} users, {len(seeding.SYMBOLS)} symbols, {args.duration:.0f} s")
+    print(f"{'mode':<8}{'snapshots':>10}{'updates':>10}{'quote req/s':>13}{'RSS MiB':>10}{'threads':>9}")
+    for mode in args.modes:
+        port = free_port()
+        process = start_server(mode, port, env, workdir)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            cookies = [
+                "; ".join(f"{name}={value}" for name, value in login(base_url, f"user{i}").cookies.items())
+                for i in range(args.users)
+            ]
+            snapshots, updates, quote_rate, rss, threads = asyncio.run(hold(port, cookies, args, process, stub))
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{mode:<8}{snapshots:>10}{updates:>10}{quote_rate:>13.1f}{rss:>10.1f}{threads:>9}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
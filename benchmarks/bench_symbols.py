@@ -0,0 +1,123 @@
+"""
+Symbol directory lookups over a large listing.
+
+Writes a synthetic listing of N symbols with company names, loads it into
+a SymbolDirectory and reports p50/p99 latency of prefix searches, symbol
+checks and the /symbols endpoint, and what a mistyped symbol costs with
+and without the directory in front of the quote API.
+
+    python -m benchmarks.bench_symbols --symbols 10000 --quote-latency 0.05
+"""
+
+import argparse
+import csv
+import importlib
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+WORDS = [
+    "Acme", "Global", "United", "First", "American", "Pacific", "General", "National", "Advanced", "Digital",
+    "Energy", "Health", "Capital", "Systems", "Networks", "Holdings", "Resources", "Financial", "Materials", "Foods",
+]
+
+
+def listing(size, rng):
+    """Return size distinct (symbol, name) pairs, including the benchmark seed symbols."""
+    entries = {symbol: f"{symbol} Inc." for symbol in seeding.SYMBOLS}
+    while len(entries) < size:
+        symbol = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 5)))
+        entries.setdefault(symbol, f"{' '.join(rng.sample(WORDS, 2))} {symbol} Corp.")
+    return list(entries.items())
+
+
+def percentiles(func, inputs):
+    """Call func on every input, return (p50, p99) latency in microseconds."""
+    timings = []
+    for value in inputs:
+        started = time.perf_counter()
+        func(value)
+        timings.append(time.perf_counter() - started)
+    cuts = statistics.quantiles(timings, n=100)
+    return cuts[49] * 1e6, cuts[98] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Symbol directory latency")
+    parser.add_argument("--symbols", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--quote-latency", type=float, default=0.05, help="stub quote API latency in seconds")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    entries = listing(args.symbols, rng)
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    path = os.path.join(workdir, "symbols.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Symbol", "Name"])
+        writer.writerows(entries)
+
+    from symbols import SymbolDirectory
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    directory = SymbolDirectory.from_csv(path)
+    load = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Prefixes of 1-4 characters of symbols and names, as typed into the form
+    prefixes = []
+    for _ in range(args.queries):
+        symbol, name = rng.choice(entries)
+        source = symbol if rng.random() < 0.7 else name
+        prefixes.append(source[:rng.randint(1, 4)])
+    checks = [rng.choice(entries)[0] if rng.random() < 0.5 else rng.choice(entries)[0] + "X" for _ in range(args.queries)]
+
+    print(f"{len(directory)} symbols loaded in {load * 1000:.1f} ms, {memory / 1024 / 1024:.1f} MiB")
+    print(f"{'operation':<24}{'p50 us':>10}{'p99 us':>10}")
+    for label, func, inputs in (
+        ("search(prefix)", directory.search, prefixes),
+        ("is_valid(symbol)", directory.is_valid, checks),
+    ):
+        p50, p99 = percentiles(func, inputs)
+        print(f"{label:<24}{p50:>10.2f}{p99:>10.2f}")
+
+    # Through the app, with the listing as SYMBOLS_FILE
+    db_path = os.path.join(workdir, "bench.db")
+    seeding.seed(db_path, 1, 0)
+    stub = start_stub_server(latency=args.quote_latency)
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["QUOTE_API_URL"] = stub.url
+    os.environ["SYMBOLS_FILE"] = path
+    os.chdir(workdir)
+    app_module = importlib.import_module("app")
+    client = app_module.app.test_client()
+    client.post("/login", data={"username": "user0", "password": seeding.PASSWORD})
+
+    p50, p99 = percentiles(lambda prefix: client.get("/symbols", query_string={"prefix": prefix}), prefixes[:2000])
+    print(f"{'GET /symbols':<24}{p50:>10.2f}{p99:>10.2f}")
+
+    # A mistyped symbol, unlisted in the directory but well-formed for the quote API
+    typos = [symbol for symbol in ("QQQQA", "ZXCVB", "MSFTT", "APPLE") if symbol not in directory][:3]
+    for label, directory_in_use in (("typo, no directory", None), ("typo, directory", directory)):
+        quotes = app_module.app.extensions["quotes"]
+        quotes.use_symbol_directory(directory_in_use)
+        quotes.cache.invalidate()
+        requests_before = stub.requests
+        p50, p99 = percentiles(lambda symbol: client.post("/buy", data={"symbol": symbol, "shares": "1"}), typos * 10)
+        print(f"{label:<24}{p50:>10.2f}{p99:>10.2f}   quote API requests: {stub.requests - requests_before}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
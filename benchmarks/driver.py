@@ -0,0 +1,177 @@
+"""
+Load test of the Flask app.
+
+Seeds a scratch database (or uses an existing one), starts the stub quote
+server and runs concurrent logged-in sessions through the app's routes,
+then reports p50/p95/p99 latency and requests per second per route.
+
+    python -m benchmarks.driver --sessions 16 --duration 10 --output run.json
+    python -m benchmarks.driver --sessions 16 --duration 10 --compare run.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks import seed as seeding
+from benchmarks.stub_quote_server import start_stub_server
+
+
+# Route mix of a session: (name, weight)
+ROUTES = [
+    ("index", 40),
+    ("history", 20),
+    ("quote", 15),
+    ("buy", 15),
+    ("sell", 10),
+]
+
+
+def request(client, route, rng):
+    """Issue one request for route, return True if it succeeded."""
+    if route == "index":
+        return client.get("/").status_code == 200
+    if route == "history":
+        return client.get("/history").status_code == 200
+    if route == "quote":
+        symbol = rng.choice(seeding.SYMBOLS)
+        return client.post("/quote", data={"symbol": symbol}).status_code == 200
+    if route == "buy":
+        return client.post("/buy", data={"symbol": "AAPL", "shares": "1"}).status_code == 302
+    if route == "sell":
+        return client.post("/sell", data={"symbol": "AAPL", "shares": "1"}).status_code == 302
+    raise ValueError(route)
+
+
+def session_worker(app, user, deadline, seed, samples, errors, lock):
+    """Log in as user and issue requests until deadline."""
+    rng = random.Random(seed)
+    names = [name for name, _ in ROUTES]
+    weights = [weight for _, weight in ROUTES]
+
+    client = app.test_client()
+    client.post("/login", data={"username": user, "password": seeding.PASSWORD})
+    # Make sure there is something to sell
+    client.post("/buy", data={"symbol": "AAPL", "shares": "1000"})
+
+    local_samples = {name: [] for name in names}
+    local_errors = {name: 0 for name in names}
+    while time.perf_counter() < deadline:
+        route = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        ok = request(client, route, rng)
+        local_samples[route].append(time.perf_counter() - started)
+        if not ok:
+            local_errors[route] += 1
+
+    with lock:
+        for name in names:
+            samples[name].extend(local_samples[name])
+            errors[name] += local_errors[name]
+
+
+def summarize(samples, errors, duration):
+    """Return per-route latency percentiles (ms) and throughput."""
+    report = {}
+    for name, latencies in samples.items():
+        if len(latencies) < 2:
+            continue
+        cuts = statistics.quantiles(latencies, n=100)
+        report[name] = {
+            "requests": len(latencies),
+            "errors": errors[name],
+            "rps": len(latencies) / duration,
+            "p50_ms": cuts[49] * 1000,
+            "p95_ms": cuts[94] * 1000,
+            "p99_ms": cuts[98] * 1000,
+        }
+    return report
+
+
+def print_report(report, baseline=None):
+    """Print report, with relative p95 change against baseline if given."""
+    header = f"{'route':<10}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'p95 vs base':>14}"
+    print(header)
+    for name, row in report.items():
+        line = (
+            f"{name:<10}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+            f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+        )
+        if baseline and name in baseline.get("routes", {}):
+            before = baseline["routes"][name]["p95_ms"]
+            line += f"{(row['p95_ms'] - before) / before * 100:>+13.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test routes of the app")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent logged-in sessions")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--db", help="existing database seeded by benchmarks.seed")
+    parser.add_argument("--users", type=int, default=50, help="users to seed")
+    parser.add_argument("--transactions", type=int, default=500, help="transactions per seeded user")
+    parser.add_argument("--quote-latency", type=float, default=0.05, help="stub quote API latency in seconds")
+    parser.add_argument("--quote-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    path = os.path.abspath(args.db) if args.db else os.path.join(workdir, "bench.db")
+    if not args.db:
+        print(f"Seeding {args.users} users x {args.transactions} transactions into {path}")
+        seeding.seed(path, args.users, args.transactions, args.seed)
+
+    stub = start_stub_server(latency=args.quote_latency, error_rate=args.quote_error_rate)
+
+    # The app reads its configuration from the environment at import
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["QUOTE_API_URL"] = stub.url
+    os.chdir(workdir)
+    app = importlib.import_module("app").app
+
+    samples = {name: [] for name, _ in ROUTES}
+    errors = {name: 0 for name, _ in ROUTES}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(
+            target=session_worker,
+            args=(app, f"user{i % args.users}", deadline, args.seed + i, samples, errors, lock)
+        )
+        for i in range(args.sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stub.shutdown()
+
+    results = {
+        "config": vars(args),
+        "quote_requests": stub.requests,
+        "routes": summarize(samples, errors, args.duration),
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results["routes"], baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
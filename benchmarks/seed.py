@@ -0,0 +1,98 @@
+"""
+Seed a scratch SQLite database with users and transactions.
+
+Users are named user0, user1, ... and all share the password "password".
+Each user gets M transactions spread over the symbols in SYMBOLS, with
+sells never exceeding the shares held.
+
+    python -m benchmarks.seed bench.db --users 100 --transactions 1000
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import holdings
+
+from database import Database
+
+
+SYMBOLS = [
+    "AAPL", "MSFT", "GOOG", "AMZN", "META", "NVDA", "TSLA", "NFLX", "INTC", "AMD",
+    "ORCL", "IBM", "CSCO", "ADBE", "CRM", "PYPL", "QCOM", "TXN", "AVGO", "SBUX",
+]
+
+PASSWORD = "password"
+
+
+def seed(path, users, transactions, seed=0):
+    """
+    Create database at path and fill it.
+
+    Args:
+        path: SQLite file to create (must not contain the tables yet)
+        users: Number of users
+        transactions: Number of transactions per user
+        seed: Random seed, so runs are reproducible
+
+    Returns:
+        Database for path
+    """
+    db = Database(f"sqlite:///{path}", migrate=True)
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(PASSWORD)
+    start = datetime(2020, 1, 1)
+
+    # Bulk insert through sqlite3 directly, row-by-row inserts would dominate
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (username, hash, cash) VALUES (?, ?, ?)",
+        ((f"user{i}", password_hash, 1_000_000.0) for i in range(users))
+    )
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+
+    for user_id in user_ids:
+        held = {}
+        rows = []
+        timestamp = start
+        for _ in range(transactions):
+            symbol = rng.choice(SYMBOLS)
+            if held.get(symbol, 0) > 0 and rng.random() < 0.4:
+                shares = -rng.randint(1, held[symbol])
+            else:
+                shares = rng.randint(1, 100)
+            held[symbol] = held.get(symbol, 0) + shares
+            timestamp += timedelta(minutes=rng.randint(1, 600))
+            rows.append((user_id, symbol, shares, round(rng.uniform(10, 500), 2), timestamp.strftime("%Y-%m-%d %H:%M:%S")))
+        conn.executemany(
+            "INSERT INTO transactions (user_id, symbol, shares, price, timestamp) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+    conn.commit()
+    conn.close()
+
+    holdings.rebuild(db)
+    holdings.rebuild_realized(db)
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed scratch database")
+    parser.add_argument("path", help="SQLite file to create")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--transactions", type=int, default=1000, help="transactions per user")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed(args.path, args.users, args.transactions, args.seed)
+    print(f"Seeded {args.users} users x {args.transactions} transactions in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
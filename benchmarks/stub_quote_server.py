@@ -0,0 +1,110 @@
+"""
+Local stand-in for the quote API.
+
+Serves /quote?symbol=SYMBOL in the same format as finance.cs50.io, with
+configurable latency and error rate, so the quote client and the app can be
+exercised without network access.
+
+    python -m benchmarks.stub_quote_server --port 8001 --latency 0.05 --error-rate 0.01
+    QUOTE_API_URL=http://127.0.0.1:8001/quote flask run
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+SYMBOL_RE = re.compile(r"^[A-Z]{1,5}$")
+
+
+def price_for(symbol):
+    """Return a stable pseudo-price for symbol."""
+    return round(10 + zlib.crc32(symbol.encode()) % 50000 / 100, 2)
+
+
+class StubQuoteHandler(BaseHTTPRequestHandler):
+    """Request handler, configured through attributes of the server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        symbol = parse_qs(url.query).get("symbol", [""])[0].upper()
+
+        self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if url.path != "/quote":
+            return self._send(404, {"error": "not found"})
+        if random.random() < self.server.error_rate:
+            return self._send(503, {"error": "unavailable"})
+        if not SYMBOL_RE.match(symbol):
+            return self._send(404, {"error": "unknown symbol"})
+
+        price = price_for(symbol)
+        if self.server.jitter:
+            price = round(price * random.uniform(1 - self.server.jitter, 1 + self.server.jitter), 2)
+        self._send(200, {"companyName": f"{symbol} Inc.", "latestPrice": price, "symbol": symbol})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, latency=0.0, error_rate=0.0, jitter=0.0):
+    """
+    Start stub quote server in a background thread.
+
+    Args:
+        port: Port to listen on (0 picks a free one)
+        latency: Seconds to wait before answering each request
+        error_rate: Fraction of requests answered with 503
+        jitter: Relative random price movement per request
+
+    Returns:
+        Running server, its quote URL is server.url
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubQuoteHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.jitter = jitter
+    server.requests = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/quote"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = start_stub_server(args.port, args.latency, args.error_rate, args.jitter)
+    print(f"Serving quotes on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+HTTP caching policy.
+
+- Static files are linked with a content fingerprint (static_url), and
+  fingerprinted requests are cached for a year as immutable.
+- Read-only pages set an ETag and Last-Modified (validators) and answer
+  matching conditional requests with 304 before doing the work
+  (not_modified). Browsers store them privately but revalidate every time.
+- Everything else stays uncacheable.
+- HTML responses are compressed with brotli (if installed) or gzip when
+  the client accepts it.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+
+from flask import Response, request
+from functools import cache
+
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+PRIVATE_REVALIDATE = "private, no-cache"
+NO_STORE = "no-cache, no-store, must-revalidate"
+
+
+class StaticFingerprints:
+    """Content hashes of static files, recomputed when a file changes."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, filename):
+        """Return short content hash of filename, None if it doesn't exist."""
+        path = os.path.join(self.folder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._versions.get(filename)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._versions[filename] = (key, digest)
+        return digest
+
+    def url(self, filename):
+        """Return URL of static file with its fingerprint, for templates."""
+        version = self.version(filename)
+        if version is None:
+            return f"/static/{filename}"
+        return f"/static/{filename}?v={version}"
+
+
+def etag_for(*parts):
+    """Return an ETag value identifying parts."""
+    return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Return a 304 response if the request's validators match, otherwise None.
+
+    Args:
+        etag: ETag the response would have
+        last_modified: datetime the response would report as Last-Modified
+    """
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        matches = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        matches = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        matches = False
+    if not matches:
+        return None
+    response = Response(status=304)
+    validators(response, etag, last_modified)
+    return response
+
+
+def validators(response, etag, last_modified=None):
+    """Mark response as a private, revalidated page with ETag and Last-Modified."""
+    # Weak, because the compressed and uncompressed bodies differ
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = PRIVATE_REVALIDATE
+    response.vary.add("Cookie")
+    return response
+
+
+def apply_policy(response, fingerprints):
+    """Set Cache-Control of response according to the policy above."""
+    if request.endpoint == "static":
+        filename = request.view_args.get("filename", "")
+        version = request.args.get("v")
+        if version is not None and version == fingerprints.version(filename):
+            response.headers["Cache-Control"] = IMMUTABLE
+        else:
+            response.headers["Cache-Control"] = REVALIDATE
+    elif response.headers.get("Cache-Control") != PRIVATE_REVALIDATE:
+        response.headers["Cache-Control"] = NO_STORE
+        response.headers["Expires"] = 0
+        response.headers["Pragma"] = "no-cache"
+    return response
+
+
+def compress(response, min_size=500, level=6):
+    """Compress an HTML response with the best encoding the client accepts."""
+    if (
+        response.mimetype != "text/html"
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or response.direct_passthrough
+    ):
+        return response
+
+    encodings = ["br", "gzip"] if _brotli() is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(encodings)
+    response.vary.add("Accept-Encoding")
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # Compress chunk by chunk, flushing each so the page still renders progressively
+        response.response = _compress_stream(response.response, encoding, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        if encoding == "br":
+            response.set_data(_brotli().compress(body, quality=min(level, 11)))
+        else:
+            response.set_data(gzip.compress(body, compresslevel=level))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def _compress_stream(chunks, encoding, level):
+    """Yield compressed chunks."""
+    if encoding == "br":
+        compressor = _brotli().Compressor(quality=min(level, 11))
+        for chunk in chunks:
+            data = chunk.encode() if isinstance(chunk, str) else chunk
+            yield compressor.process(data) + compressor.flush()
+        yield compressor.finish()
+    else:
+        # wbits 31 writes a gzip header and trailer
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = chunk.encode() if isinstance(chunk, str) else chunk
+            yield compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+@cache
+def _brotli():
+    """Return the brotli module if it is installed, only trying the import once."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
@@ -1,52 +1,146 @@
-from sqlalchemy import create_engine, text
+from contextlib import contextmanager
+from functools import lru_cache
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.exc import IntegrityError
 import re
+import threading
+
+import aio
+import metrics
+import schema
+
+
+# Statements that only read and therefore never need a commit
+READ_ONLY_STATEMENTS = ("SELECT", "EXPLAIN", "PRAGMA")
+
+# Statement kinds detected by _prepare
+READ = "read"
+INSERT = "insert"
+WRITE = "write"
+
+# Number of distinct query strings whose translation is memoized
+QUERY_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _prepare(query):
+    """
+    Translate query once per distinct query string.
+    
+    Args:
+        query: SQL query with ? placeholders
+        
+    Returns:
+        Tuple of (text_clause, param_names, kind) where ? placeholders are
+        replaced with :param1, :param2, etc. and kind is READ, INSERT or WRITE
+    """
+    param_names = []
+    
+    def replace_placeholder(match):
+        param_name = f"param{len(param_names) + 1}"
+        param_names.append(param_name)
+        return f":{param_name}"
+    
+    # Replace ? placeholders with named parameters
+    converted_query = re.sub(r'\?', replace_placeholder, query)
+    
+    query_upper = query.lstrip().upper()
+    if query_upper.startswith(READ_ONLY_STATEMENTS):
+        kind = READ
+    elif query_upper.startswith("INSERT"):
+        kind = INSERT
+    else:
+        kind = WRITE
+    
+    return text(converted_query), tuple(param_names), kind
 
 
 class Database:
     """Database wrapper using SQLAlchemy Core for compatibility with cs50.SQL API"""
     
-    def __init__(self, connection_string):
+    def __init__(self, connection_string, production=False, pool_size=5, max_overflow=10,
+                 busy_timeout=5000, mmap_size=256 * 1024 * 1024, migrate=False, lazy=False):
         """
         Initialize database connection.
         
+        In production mode connections come from a sized, reusable pool, and
+        SQLite connections are switched to WAL journaling with
+        synchronous=NORMAL, a busy timeout and memory-mapped I/O, so
+        concurrent readers and writers don't block each other.
+        
         Args:
             connection_string: Database connection string (e.g., "sqlite:///finance.db")
+            production: Enable connection pool sizing and SQLite pragma tuning
+            pool_size: Number of connections kept open in production mode
+            max_overflow: Extra connections allowed above pool_size under load
+            busy_timeout: Milliseconds SQLite waits for a lock before failing
+            mmap_size: Bytes of the SQLite database file to memory-map
+            migrate: Create missing tables and indexes and apply pending
+                migrations from the schema module
+            lazy: Create the engine (and migrate) on first use instead of now
         """
-        self.engine = create_engine(connection_string, echo=False)
+        self.connection_string = connection_string
+        self.production = production
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.migrate = migrate
+        
+        self._options = {}
+        if production and ":memory:" not in connection_string:
+            self._options.update(pool_size=pool_size, max_overflow=max_overflow)
+        self._engine = None
+        self._ready = False
+        # Reentrant, migrating runs statements through the engine being set up
+        self._engine_lock = threading.RLock()
+        
+        if not lazy:
+            self.engine
+    
+    @property
+    def engine(self):
+        """SQLAlchemy engine, created and migrated on first access."""
+        if self._ready:
+            return self._engine
+        with self._engine_lock:
+            if self._engine is None:
+                self._engine = create_engine(self.connection_string, echo=False, **self._options)
+                if self.production and self._engine.dialect.name == "sqlite":
+                    event.listen(self._engine, "connect", self._configure_sqlite)
+                try:
+                    if self.migrate:
+                        schema.migrate(self)
+                except Exception:
+                    self._engine.dispose()
+                    self._engine = None
+                    raise
+                self._ready = True
+        return self._engine
+    
+    def _configure_sqlite(self, dbapi_connection, connection_record):
+        """Apply SQLite pragmas to every new pooled connection."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        cursor.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        cursor.close()
     
     def _convert_query(self, query, args):
         """
         Convert SQL query with ? placeholders to SQLAlchemy named parameters.
         
+        The translation is memoized per query string (see _prepare), so
+        repeated calls only build the parameter dictionary.
+        
         Args:
             query: SQL query with ? placeholders
             args: Tuple of parameter values
             
         Returns:
-            Tuple of (converted_query, params_dict)
+            Tuple of (text_clause, params_dict, kind)
         """
-        if not args:
-            return query, {}
-        
-        # Replace ? with :param1, :param2, etc.
-        param_dict = {}
-        param_index = 1
-        
-        def replace_placeholder(match):
-            nonlocal param_index
-            param_name = f"param{param_index}"
-            param_index += 1
-            return f":{param_name}"
-        
-        # Replace ? placeholders with named parameters
-        converted_query = re.sub(r'\?', replace_placeholder, query)
-        
-        # Create parameter dictionary
-        for i, arg in enumerate(args, start=1):
-            param_dict[f"param{i}"] = arg
-        
-        return converted_query, param_dict
+        clause, param_names, kind = _prepare(query)
+        return clause, dict(zip(param_names, args)), kind
     
     def execute(self, query, *args):
         """
@@ -65,30 +159,21 @@ class Database:
             For INSERT: int (lastrowid)
             For UPDATE/DELETE: int (rowcount)
         """
-        query_upper = query.strip().upper()
+        # Convert ? placeholders to named parameters for SQLAlchemy
+        clause, params, kind = self._convert_query(query, args)
         
-        with self.engine.connect() as conn:
+        with self.engine.connect() as conn, metrics.timed(
+            metrics.db_query_seconds, "db", statement=metrics.normalize_sql(query)
+        ):
             try:
-                # Convert ? placeholders to named parameters for SQLAlchemy
-                converted_query, params = self._convert_query(query, args)
-                
                 # Execute query with parameters
-                result = conn.execute(text(converted_query), params)
+                result = conn.execute(clause, params)
                 
-                # Commit transaction
-                conn.commit()
+                # Commit transaction (reads have nothing to commit)
+                if kind != READ:
+                    conn.commit()
                 
-                # Handle different query types
-                if query_upper.startswith('SELECT'):
-                    # Convert rows to list of dictionaries
-                    rows = result.fetchall()
-                    return [dict(row._mapping) for row in rows]
-                elif query_upper.startswith('INSERT'):
-                    # Return lastrowid for INSERT
-                    return result.lastrowid
-                else:
-                    # For UPDATE/DELETE, return rowcount
-                    return result.rowcount
+                return _result(result, kind)
                     
             except IntegrityError as e:
                 # Convert IntegrityError to ValueError for compatibility with cs50.SQL
@@ -98,3 +183,263 @@ class Database:
                 # Rollback on error
                 conn.rollback()
                 raise
+    
+    def executemany(self, query, rows):
+        """
+        Execute a write statement once per row of parameters with a single commit.
+        
+        Args:
+            query: SQL query string with ? placeholders
+            rows: Iterable of parameter tuples
+            
+        Returns:
+            Total number of rows affected
+        """
+        with self.transaction() as tx:
+            return tx.executemany(query, rows)
+    
+    def columns(self, query, *args):
+        """
+        Execute SELECT query and return its result column by column.
+        
+        Skips building a dict per row, for callers that load many rows into
+        arrays (see analytics).
+        
+        Args:
+            query: SQL query string with ? placeholders
+            *args: Query parameters
+            
+        Returns:
+            Dict mapping column name to list of values
+        """
+        clause, params, kind = self._convert_query(query, args)
+        
+        with self.engine.connect() as conn, metrics.timed(
+            metrics.db_query_seconds, "db", statement=metrics.normalize_sql(query)
+        ):
+            return _columns(conn.execute(clause, params))
+    
+    def iterate(self, query, *args, batch_size=500):
+        """
+        Execute SELECT query and yield rows one at a time.
+        
+        Rows are fetched from a server-side cursor in batches of batch_size,
+        so memory use doesn't depend on the size of the result. The
+        connection stays checked out until the generator is exhausted or closed.
+        
+        Args:
+            query: SQL query string with ? placeholders
+            *args: Query parameters
+            batch_size: Number of rows fetched from the cursor at a time
+            
+        Yields:
+            Rows as dicts
+        """
+        clause, params, kind = self._convert_query(query, args)
+        
+        with self.engine.connect() as conn:
+            with metrics.timed(metrics.db_query_seconds, "db", statement=metrics.normalize_sql(query)):
+                result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(clause, params)
+            for row in result:
+                yield dict(row._mapping)
+    
+    @contextmanager
+    def transaction(self, immediate=True):
+        """
+        Run several statements on one connection with a single commit.
+        
+        On SQLite the transaction is started with BEGIN IMMEDIATE, so the
+        write lock is taken up front and reads inside the transaction can't
+        be invalidated by a concurrent writer. Leaving the block normally
+        commits, an exception rolls everything back.
+        
+        Usage:
+            with db.transaction() as tx:
+                rows = tx.execute("SELECT cash FROM users WHERE id = ?", user_id)
+                tx.execute("UPDATE users SET cash = ? WHERE id = ?", cash, user_id)
+        
+        Args:
+            immediate: Take the write lock up front; False starts a deferred
+                transaction, for reads that only need one consistent snapshot
+                and shouldn't hold up writers
+        
+        Yields:
+            Transaction with the same execute() API as Database
+        """
+        with self.engine.connect() as conn:
+            try:
+                if self.engine.dialect.name == "sqlite":
+                    conn.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+                yield Transaction(self, conn)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+
+class AsyncDatabase:
+    """
+    Async variant of Database on SQLAlchemy's async engine.
+    
+    SQLite URLs are served by the aiosqlite driver. Statements run on the
+    shared event loop (see aio), so the connection pool is reused across
+    requests whichever loop awaits execute().
+    """
+    
+    def __init__(self, connection_string, production=False, pool_size=5, max_overflow=10,
+                 busy_timeout=5000, mmap_size=256 * 1024 * 1024):
+        """
+        Initialize async database connection.
+        
+        Args:
+            connection_string: Database connection string (e.g., "sqlite:///finance.db")
+            production: Enable connection pool sizing and SQLite pragma tuning (see Database)
+            pool_size: Number of connections kept open in production mode
+            max_overflow: Extra connections allowed above pool_size under load
+            busy_timeout: Milliseconds SQLite waits for a lock before failing
+            mmap_size: Bytes of the SQLite database file to memory-map
+        """
+        from sqlalchemy.ext.asyncio import create_async_engine
+        
+        self.production = production
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        
+        if connection_string.startswith("sqlite://"):
+            connection_string = "sqlite+aiosqlite://" + connection_string[len("sqlite://"):]
+        options = {}
+        if production and ":memory:" not in connection_string:
+            options.update(pool_size=pool_size, max_overflow=max_overflow)
+        self.engine = create_async_engine(connection_string, echo=False, **options)
+        
+        if production and self.engine.dialect.name == "sqlite":
+            event.listen(self.engine.sync_engine, "connect", self._configure_sqlite)
+    
+    _configure_sqlite = Database._configure_sqlite
+    
+    async def execute(self, query, *args):
+        """
+        Execute SQL query and return results, see Database.execute.
+        
+        Args:
+            query: SQL query string with ? placeholders
+            *args: Query parameters
+        """
+        with metrics.timed(metrics.db_query_seconds, "db", statement=metrics.normalize_sql(query)):
+            return await aio.run(self._execute(query, args))
+    
+    async def _execute(self, query, args):
+        """Execute query on the shared event loop."""
+        clause, param_names, kind = _prepare(query)
+        params = dict(zip(param_names, args))
+        
+        async with self.engine.connect() as conn:
+            try:
+                result = await conn.execute(clause, params)
+                
+                # Commit transaction (reads have nothing to commit)
+                if kind != READ:
+                    await conn.commit()
+                
+                return _result(result, kind)
+            
+            except IntegrityError as e:
+                # Convert IntegrityError to ValueError for compatibility with cs50.SQL
+                raise ValueError(str(e)) from e
+            except Exception:
+                await conn.rollback()
+                raise
+    
+    async def columns(self, query, *args):
+        """Execute SELECT query and return its result column by column, see Database.columns."""
+        with metrics.timed(metrics.db_query_seconds, "db", statement=metrics.normalize_sql(query)):
+            return await aio.run(self._columns(query, args))
+    
+    async def _columns(self, query, args):
+        """Read columns on the shared event loop."""
+        clause, param_names, kind = _prepare(query)
+        async with self.engine.connect() as conn:
+            return _columns(await conn.execute(clause, dict(zip(param_names, args))))
+    
+    async def dispose(self):
+        """Close all pooled connections."""
+        await aio.run(self.engine.dispose())
+
+
+class Transaction:
+    """Statements executed on the connection of Database.transaction()"""
+    
+    def __init__(self, database, conn):
+        self.database = database
+        self.conn = conn
+    
+    def execute(self, query, *args):
+        """
+        Execute SQL query inside the transaction without committing.
+        
+        Returns the same values as Database.execute.
+        """
+        clause, params, kind = self.database._convert_query(query, args)
+        with metrics.timed(metrics.db_query_seconds, "db", statement=metrics.normalize_sql(query)):
+            try:
+                result = self.conn.execute(clause, params)
+            except IntegrityError as e:
+                # Convert IntegrityError to ValueError for compatibility with cs50.SQL
+                raise ValueError(str(e)) from e
+            return _result(result, kind)
+    
+    @contextmanager
+    def transaction(self, immediate=True):
+        """
+        Join this transaction, so code written against a Database can run
+        inside an outer one (see schema.migrate).
+        
+        Yields:
+            This transaction
+        """
+        yield self
+    
+    def executemany(self, query, rows):
+        """
+        Execute a write statement once per row of parameters, in one DBAPI call.
+        
+        Args:
+            query: SQL query string with ? placeholders
+            rows: Iterable of parameter tuples
+            
+        Returns:
+            Total number of rows affected
+        """
+        clause, param_names, kind = _prepare(query)
+        params = [dict(zip(param_names, row)) for row in rows]
+        if not params:
+            return 0
+        with metrics.timed(metrics.db_query_seconds, "db", statement=metrics.normalize_sql(query)):
+            try:
+                return self.conn.execute(clause, params).rowcount
+            except IntegrityError as e:
+                raise ValueError(str(e)) from e
+
+
+def _result(result, kind):
+    """Convert SQLAlchemy result to the value returned by execute."""
+    # Handle different query types
+    if kind == READ:
+        # Convert rows to list of dictionaries
+        rows = result.fetchall()
+        return [dict(row._mapping) for row in rows]
+    elif kind == INSERT:
+        # Return lastrowid for INSERT
+        return result.lastrowid
+    else:
+        # For UPDATE/DELETE, return rowcount
+        return result.rowcount
+
+
+def _columns(result):
+    """Convert SQLAlchemy result to a dict of column lists."""
+    keys = list(result.keys())
+    rows = result.fetchall()
+    if not rows:
+        return {key: [] for key in keys}
+    return {key: list(values) for key, values in zip(keys, zip(*rows))}
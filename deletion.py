@@ -0,0 +1,235 @@
+"""
+Background account deletion.
+
+Deleting an account in a request only marks it (users.deleted_at, see
+schema migration 7) and drops its holdings, so the request never waits on
+the size of the ledger. AccountPurger then removes the account's
+transactions in chunks of chunk_size rows, each deleted in its own short
+write transaction, and sleeps between chunks so it holds the SQLite write
+lock at most `duty` of the time; other users' trades wait for one chunk at
+worst. The user row goes last.
+
+Every worker process runs a purger. A purger leases the account it works
+on (users.purging_until, see schema migration 8) and renews the lease with
+each chunk, so one purger at a time works on an account and another takes
+over once the lease of a purger that died lapses. The username is free as
+soon as the account is marked: only live accounts need unique usernames.
+
+With an archive directory, each chunk is appended to
+<archive_dir>/user-<id>.jsonl.gz before it is deleted: one line describing
+the account, then one JSON object per transaction, oldest first. A chunk
+archived but not deleted (the process died in between) is archived again
+on the next attempt, so readers should skip transaction ids already seen.
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows, archives are then only safe with one process
+    fcntl = None
+
+
+def mark_deleted(db, user_id):
+    """Mark account user_id deleted, freeing its username, and drop its holdings; AccountPurger removes the rest."""
+    with db.transaction() as tx:
+        tx.execute(
+            "UPDATE users SET deleted_at = ?, ledger_version = ledger_version + 1 WHERE id = ? AND deleted_at IS NULL",
+            time.time(),
+            user_id
+        )
+        tx.execute("DELETE FROM holdings WHERE user_id = ?", user_id)
+
+
+class AccountPurger:
+    """Daemon thread removing the ledgers of accounts marked deleted, a chunk at a time."""
+
+    def __init__(self, db, archive_dir=None, chunk_size=500, duty=0.2, interval=30.0, lease=60.0):
+        """
+        Initialize purger.
+
+        Args:
+            db: Database with the users and transactions tables
+            archive_dir: Directory to archive purged accounts into, None to only delete
+            chunk_size: Transactions deleted per write transaction
+            duty: Largest fraction of time spent holding the write lock, between 0 and 1
+            interval: Seconds between checks for marked accounts when not woken (see wake)
+            lease: Seconds an account stays claimed without a chunk being purged
+        """
+        if not 0 < duty <= 1:
+            raise ValueError(f"duty must be above 0 and at most 1, not {duty!r}")
+        self.db = db
+        self.archive_dir = archive_dir
+        self.chunk_size = chunk_size
+        self.duty = duty
+        self.interval = interval
+        self.lease = lease
+        self.accounts = 0
+        self.transactions = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def pending(self):
+        """Return the account marked deleted longest ago, None if there is none."""
+        rows = self.db.execute(
+            "SELECT id, username, cash, deleted_at FROM users WHERE deleted_at IS NOT NULL "
+            "ORDER BY deleted_at LIMIT 1"
+        )
+        return rows[0] if rows else None
+
+    def claim(self):
+        """
+        Lease the account marked deleted longest ago that no other purger holds.
+
+        Returns:
+            Tuple of (users row, lease expiry), None if there is no such account
+        """
+        now = time.time()
+        rows = self.db.execute(
+            "SELECT id, username, cash, deleted_at FROM users WHERE deleted_at IS NOT NULL "
+            "AND (purging_until IS NULL OR purging_until < ?) ORDER BY deleted_at LIMIT 1",
+            now
+        )
+        if not rows:
+            return None
+        until = now + self.lease
+        # Purgers in other processes may have picked the same account, only one of them updates it
+        claimed = self.db.execute(
+            "UPDATE users SET purging_until = ? WHERE id = ? AND (purging_until IS NULL OR purging_until < ?)",
+            until,
+            rows[0]["id"],
+            now
+        )
+        return (rows[0], until) if claimed else None
+
+    def purge_next(self):
+        """
+        Claim and purge the account marked deleted longest ago.
+
+        Returns:
+            Whether there was an account to purge
+        """
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        self.purge(*claimed)
+        return True
+
+    def purge(self, account, until):
+        """
+        Archive and delete the transactions of account, then the account, unless stopped.
+
+        Args:
+            account: users row, as returned by claim
+            until: Expiry of the lease on account, as returned by claim
+        """
+        user_id = account["id"]
+        path = None
+        if self.archive_dir:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            path = os.path.join(self.archive_dir, f"user-{user_id}.jsonl.gz")
+            if not os.path.exists(path):
+                _append(path, [{"user": dict(account)}])
+
+        while not self._stop.is_set():
+            # Oldest first along the (user_id, timestamp, id) index, so each chunk costs the same
+            rows = self.db.execute(
+                "SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? "
+                "ORDER BY timestamp, id LIMIT ?",
+                user_id,
+                self.chunk_size
+            )
+            if path is not None and rows:
+                _append(path, rows)
+
+            started = time.monotonic()
+            with self.db.transaction() as tx:
+                renewed = time.time() + self.lease
+                if not tx.execute(
+                    "UPDATE users SET purging_until = ? WHERE id = ? AND purging_until = ?", renewed, user_id, until
+                ):
+                    # Lease lapsed and another purger took the account over
+                    return
+                until = renewed
+                if rows:
+                    tx.executemany("DELETE FROM transactions WHERE id = ?", [(row["id"],) for row in rows])
+                else:
+                    tx.execute("DELETE FROM holdings WHERE user_id = ?", user_id)
+                    tx.execute("DELETE FROM users WHERE id = ? AND deleted_at IS NOT NULL", user_id)
+            held = time.monotonic() - started
+
+            if not rows:
+                self.accounts += 1
+                return
+            self.transactions += len(rows)
+            # Leave the write lock to others for the rest of the duty cycle
+            self._stop.wait(held * (1 - self.duty) / self.duty)
+
+    def run(self):
+        """Purge marked accounts until stopped."""
+        while not self._stop.is_set():
+            try:
+                purged = self.purge_next()
+            except Exception as e:
+                # Keep purging through transient database errors
+                print(f"Account purge error: {e}")
+                purged = False
+            if not purged:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def wake(self):
+        """Start purging now, call after marking an account deleted."""
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        """Start purging in a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="account-purger", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop purging and wait for the thread to finish."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def _append(path, records):
+    """Append records as JSON lines to the gzip file at path, on disk before returning."""
+    with open(path, "ab") as f:
+        # One gzip member at a time, a purger whose lease lapsed may still be appending
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        with gzip.GzipFile(fileobj=f, mode="ab") as archive:
+            archive.write("".join(json.dumps(record, default=str) + "\n" for record in records).encode())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_archive(path):
+    """
+    Read an archive written by AccountPurger.
+
+    Returns:
+        Tuple of (account dict, list of transaction dicts without duplicates)
+    """
+    account = None
+    transactions = {}
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            record = json.loads(line)
+            if "user" in record:
+                account = record["user"]
+            else:
+                transactions.setdefault(record["id"], record)
+    return account, list(transactions.values())
@@ -0,0 +1,327 @@
+"""
+Live portfolio updates.
+
+PriceFeed looks up the quotes of every symbol somebody is watching from one
+thread, through lookup_many and so the shared quote cache, and fans price
+changes out to subscriptions: a thousand users watching AAPL cost one
+lookup per poll, not a thousand.
+
+A Subscription keeps only the latest unsent quote per watched symbol, so a
+slow or idle client holds at most one pending entry per symbol however far
+it lags. It can be waited on from a thread (wait) or from an event loop
+(wait_async), and PortfolioStream turns its updates into server-sent events
+carrying position values and recomputed totals.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+
+class FeedFull(Exception):
+    """Raised when the feed already has max_subscribers subscriptions."""
+
+
+class Subscription:
+    """One client's interest in a set of symbols, with coalesced pending updates."""
+
+    def __init__(self, user_id, loop=None):
+        """
+        Initialize subscription.
+
+        Args:
+            user_id: User the subscription belongs to (see PriceFeed.holdings_changed)
+            loop: Event loop to wake when waiting with wait_async, None to wait from a thread
+        """
+        self.user_id = user_id
+        self.symbols = frozenset()
+        self.loop = loop
+        self._pending = {}
+        self._stale = False
+        self._lock = threading.Lock()
+        self._event = asyncio.Event() if loop is not None else threading.Event()
+
+    def push(self, symbol, quote):
+        """Queue quote, replacing any unsent quote of the same symbol."""
+        with self._lock:
+            self._pending[symbol] = quote
+        self._notify()
+
+    def mark_stale(self):
+        """Tell the waiter that the user's holdings changed."""
+        with self._lock:
+            self._stale = True
+        self._notify()
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds for updates.
+
+        Returns:
+            Tuple of (dict of symbol to latest quote, whether holdings changed),
+            empty and False on timeout
+        """
+        self._event.wait(timeout)
+        return self._take()
+
+    async def wait_async(self, timeout):
+        """Coroutine version of wait, for subscriptions created with a loop."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._take()
+
+    def _take(self):
+        """Return and clear pending updates."""
+        with self._lock:
+            self._event.clear()
+            pending, self._pending = self._pending, {}
+            stale, self._stale = self._stale, False
+        return pending, stale
+
+    def _notify(self):
+        """Wake the waiter."""
+        if self.loop is None:
+            self._event.set()
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # Loop closed, the connection is going away
+            pass
+
+
+class PriceFeed:
+    """Shared poller of watched symbols, publishing price changes to subscriptions."""
+
+    def __init__(self, lookup_many, interval=5.0, max_subscribers=10000):
+        """
+        Initialize feed, its thread starts with the first subscription.
+
+        Args:
+            lookup_many: Callable taking symbols and returning {symbol: quote or None}
+            interval: Seconds between two polls of the watched symbols
+            max_subscribers: Subscriptions allowed at once
+        """
+        self.lookup_many = lookup_many
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        self.polls = 0
+        self.published = 0
+        self._count = 0
+        self._watchers = {}
+        self._users = {}
+        self._prices = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def subscribers(self):
+        """Number of open subscriptions."""
+        return self._count
+
+    def subscribe(self, user_id, loop=None):
+        """
+        Open a subscription for user_id, watching no symbols yet (see watch).
+
+        Raises:
+            FeedFull: If max_subscribers subscriptions are open
+        """
+        subscription = Subscription(user_id, loop)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise FeedFull("too many live subscriptions")
+            self._users.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+        self._start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Close subscription."""
+        self.watch(subscription, ())
+        with self._lock:
+            subscriptions = self._users.get(subscription.user_id)
+            if subscriptions is not None and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self._count -= 1
+                if not subscriptions:
+                    del self._users[subscription.user_id]
+
+    def watch(self, subscription, symbols):
+        """Replace the symbols subscription gets updates for."""
+        symbols = frozenset(symbols)
+        with self._lock:
+            idle = not self._watchers
+            for symbol in subscription.symbols - symbols:
+                watchers = self._watchers[symbol]
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._watchers[symbol]
+                    self._prices.pop(symbol, None)
+            for symbol in symbols - subscription.symbols:
+                self._watchers.setdefault(symbol, set()).add(subscription)
+            subscription.symbols = symbols
+            if idle and self._watchers:
+                self._changed.notify()
+
+    def holdings_changed(self, user_id):
+        """Tell user_id's subscriptions to reload their holdings, call after a trade commits."""
+        with self._lock:
+            subscriptions = list(self._users.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.mark_stale()
+
+    def current(self, symbols):
+        """Return {symbol: quote or None} for symbols, from the last poll where possible."""
+        with self._lock:
+            quotes = {symbol: self._prices[symbol] for symbol in symbols if symbol in self._prices}
+        missing = [symbol for symbol in symbols if symbol not in quotes]
+        if missing:
+            fetched = self.lookup_many(missing)
+            quotes.update(fetched)
+            with self._lock:
+                # Later polls report changes relative to these
+                for symbol, quote in fetched.items():
+                    if quote is not None and symbol in self._watchers:
+                        self._prices.setdefault(symbol, quote)
+        return quotes
+
+    def poll(self):
+        """Look up every watched symbol once and publish the quotes whose price changed."""
+        with self._lock:
+            symbols = list(self._watchers)
+        if not symbols:
+            return
+        quotes = self.lookup_many(symbols)
+        self.polls += 1
+
+        for symbol, quote in quotes.items():
+            if quote is None:
+                continue
+            with self._lock:
+                previous = self._prices.get(symbol)
+                if symbol not in self._watchers or (previous is not None and previous["price"] == quote["price"]):
+                    continue
+                self._prices[symbol] = quote
+                watchers = list(self._watchers[symbol])
+            for subscription in watchers:
+                subscription.push(symbol, quote)
+            self.published += 1
+
+    def run(self):
+        """Poll while anything is watched, until stopped."""
+        while True:
+            with self._lock:
+                while not self._watchers and not self._stopped:
+                    self._changed.wait()
+                if self._stopped:
+                    return
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                # Keep the feed alive through transient lookup errors
+                print(f"Price feed error: {e}")
+            with self._lock:
+                if not self._stopped:
+                    self._changed.wait(max(0, self.interval - (time.monotonic() - started)))
+
+    def stop(self, timeout=None):
+        """Stop polling and wait for the thread to finish."""
+        with self._lock:
+            self._stopped = True
+            self._changed.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _start(self):
+        """Start polling thread if it isn't running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self.run, name="price-feed", daemon=True)
+                self._thread.start()
+
+
+class PortfolioStream:
+    """Server-sent events for one subscription: a snapshot, then changed positions and totals."""
+
+    def __init__(self, feed, subscription, load):
+        """
+        Initialize stream.
+
+        Args:
+            feed: PriceFeed the subscription belongs to
+            subscription: Subscription to read updates from
+            load: Callable taking user_id and returning (cash, {symbol: (shares, cost basis)})
+        """
+        self.feed = feed
+        self.subscription = subscription
+        self.load = load
+        self.cash = 0
+        self.positions = {}
+        self.prices = {}
+
+    def snapshot(self):
+        """Load holdings, watch their symbols and return an event with every position."""
+        self.cash, self.positions = self.load(self.subscription.user_id)
+        self.feed.watch(self.subscription, self.positions)
+        self.prices = {
+            symbol: quote["price"]
+            for symbol, quote in self.feed.current(list(self.positions)).items()
+            if quote is not None
+        }
+        return self._event("snapshot", self.positions)
+
+    def advance(self, updates, stale):
+        """
+        Apply updates from Subscription.wait.
+
+        Returns:
+            Event text, or None if nothing changed
+        """
+        if stale:
+            return self.snapshot()
+        changed = [symbol for symbol in updates if symbol in self.positions]
+        if not changed:
+            return None
+        for symbol in changed:
+            self.prices[symbol] = updates[symbol]["price"]
+        return self._event("prices", changed)
+
+    def _event(self, name, symbols):
+        """Format an event with the given positions and the portfolio totals."""
+        positions = {}
+        for symbol in symbols:
+            shares, cost_basis = self.positions[symbol]
+            price = self.prices.get(symbol)
+            value = shares * price if price is not None else None
+            positions[symbol] = {
+                "price": price,
+                "value": round(value, 2) if value is not None else None,
+                "unrealized_pnl": round(value - cost_basis, 2) if value is not None else None,
+            }
+        value = sum(
+            shares * self.prices[symbol] for symbol, (shares, _) in self.positions.items() if symbol in self.prices
+        )
+        cost_basis = sum(cost_basis for symbol, (_, cost_basis) in self.positions.items() if symbol in self.prices)
+        totals = {
+            "cash": round(self.cash, 2),
+            "value": round(value, 2),
+            "unrealized_pnl": round(value - cost_basis, 2),
+            "grand_total": round(self.cash + value, 2),
+        }
+        return format_event(name, {"positions": positions, "totals": totals})
+
+
+def format_event(name, data):
+    """Return data as a server-sent event named name."""
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+# Sent while idle, so proxies and clients keep the connection open
+HEARTBEAT = ": keep-alive\n\n"
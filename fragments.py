@@ -0,0 +1,163 @@
+"""
+Rendered fragment cache.
+
+Pages built from a user's ledger (portfolio table, history pages, sell
+form) only change when the user trades, or for the portfolio when the
+quotes it shows change. FragmentCache keeps their rendered HTML keyed by
+(user_id, ledger version, page), where the ledger version is
+users.ledger_version (see schema migration 9), bumped in the write
+transaction of every trade. Each process keeps its own cache, but they all
+read the version from the database, so a trade made through another worker
+misses here too. A portfolio entry also records the price epoch it was
+rendered at, the quotes it showed, and is only served while the quote cache
+still holds those same quotes. A hit costs the primary key lookup of the
+version instead of the page's queries and rendering.
+
+Entries are evicted least recently used first once their total size
+exceeds max_bytes, and only the newest version of a user's fragments is
+kept.
+"""
+
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class Fragment:
+    """Rendered HTML of a page fragment, with what it was rendered from."""
+
+    __slots__ = ("html", "epoch", "data", "created")
+
+    def __init__(self, html, epoch=None, data=None):
+        self.html = html
+        self.epoch = epoch
+        self.data = data or {}
+        self.created = time.monotonic()
+
+
+class FragmentCache:
+    """Per-user LRU cache of rendered fragments, bounded by total size."""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=60.0):
+        """
+        Initialize fragment cache.
+
+        Args:
+            max_bytes: Total size of cached HTML (characters), 0 disables the cache
+            ttl: Seconds an entry is served for at most
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key, version, epoch=None):
+        """
+        Return cached fragment of user_id for key, or None.
+
+        Args:
+            user_id: Owner of the fragment
+            key: Hashable identifying the page and its arguments
+            version: Current ledger version of user_id
+            epoch: Callable taking the fragment and returning its current
+                price epoch; the fragment is only served if it matches the
+                epoch it was rendered at
+        """
+        with self._lock:
+            cache_key = (user_id, version, key)
+            fragment = self._entries.get(cache_key)
+            if fragment is not None and time.monotonic() - fragment.created < self.ttl:
+                self._entries.move_to_end(cache_key)
+            else:
+                fragment = None
+        if fragment is not None and epoch is not None and epoch(fragment) != fragment.epoch:
+            fragment = None
+        with self._lock:
+            if fragment is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return fragment
+
+    def put(self, user_id, key, version, html, epoch=None, data=None):
+        """
+        Cache a rendered fragment.
+
+        Args:
+            user_id: Owner of the fragment
+            key: Hashable identifying the page and its arguments
+            version: Ledger version of user_id read before the fragment's data,
+                so a trade in between leaves the fragment under an outdated key
+            html: Rendered HTML
+            epoch: Price epoch the fragment was rendered at (see get)
+            data: Dict of anything needed to serve the fragment again
+
+        Returns:
+            The Fragment, cached or not
+        """
+        fragment = Fragment(html, epoch, data)
+        if len(html) > self.max_bytes:
+            return fragment
+        with self._lock:
+            keys = self._keys.get(user_id, ())
+            if any(cached_version > version for _, cached_version, _ in keys):
+                # Rendered before a trade another request has already seen
+                return fragment
+            for outdated in [cache_key for cache_key in keys if cache_key[1] < version]:
+                self._forget(outdated, self._entries.pop(outdated))
+            cache_key = (user_id, version, key)
+            previous = self._entries.pop(cache_key, None)
+            if previous is not None:
+                self.size -= len(previous.html)
+            self._entries[cache_key] = fragment
+            self._keys.setdefault(user_id, set()).add(cache_key)
+            self.size += len(html)
+            while self.size > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._forget(evicted_key, evicted)
+                self.evictions += 1
+        return fragment
+
+    def invalidate(self, user_id):
+        """Drop every fragment of user_id early, call when their ledger changes."""
+        with self._lock:
+            for cache_key in self._keys.pop(user_id, ()):
+                fragment = self._entries.pop(cache_key, None)
+                if fragment is not None:
+                    self.size -= len(fragment.html)
+            self.invalidations += 1
+
+    def clear(self):
+        """Drop every fragment."""
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self.size,
+            }
+
+    def _forget(self, cache_key, fragment):
+        """Account for an entry removed from _entries."""
+        self.size -= len(fragment.html)
+        keys = self._keys.get(cache_key[0])
+        if keys is not None:
+            keys.discard(cache_key)
+            if not keys:
+                del self._keys[cache_key[0]]
@@ -1,7 +1,275 @@
-import requests
+import asyncio
+import base64
+import inspect
+import os
+import threading
+import time
 
-from flask import redirect, render_template, session
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context, redirect, render_template, session
 from functools import wraps
+from werkzeug.local import LocalProxy
+
+import aio
+import metrics
+
+from quotes import DEFAULT_QUOTE_URL, AsyncQuoteClient, QuoteCache, QuoteClient, QuoteUnavailable
+
+
+def setting(config, name, default=None, kind=str):
+    """
+    Look up a setting by its environment variable name.
+
+    Args:
+        config: Mapping of settings, taking precedence over the environment
+        name: Setting name, e.g. "DATABASE_URL"
+        default: Value if neither config nor the environment has it
+        kind: Callable converting a configured value, e.g. int or flag
+
+    Returns:
+        Converted value, or default
+    """
+    value = config.get(name, os.environ.get(name))
+    if value is None:
+        return default
+    return kind(value)
+
+
+def flag(value):
+    """Convert a "1"/"0" (or boolean) setting to bool."""
+    return value is True or str(value) == "1"
+
+
+class QuoteService:
+    """
+    Quote API client, quote cache and lookup pool of one app.
+
+    create_app keeps one per app in app.extensions["quotes"]. The module
+    level lookup functions use the current app's (see quote_service), so
+    apps created side by side, e.g. in tests, don't share quotes or settings.
+    """
+
+    def __init__(self, config=None):
+        """
+        Initialize quote service, the client is only created (and requests imported) on the first fetch.
+
+        Args:
+            config: Mapping of QUOTE_* settings, missing ones are read from the environment
+        """
+        config = config or {}
+        self.settings = {
+            "base_url": setting(config, "QUOTE_API_URL", DEFAULT_QUOTE_URL),
+            "connect_timeout": setting(config, "QUOTE_CONNECT_TIMEOUT", 3.05, float),
+            "read_timeout": setting(config, "QUOTE_READ_TIMEOUT", 5.0, float),
+            "max_retries": setting(config, "QUOTE_MAX_RETRIES", 2, int),
+            "pool_size": setting(config, "QUOTE_POOL_SIZE", 32, int),
+        }
+        # Cache in front of the quote API (see lookup)
+        self.cache = QuoteCache(
+            ttl=setting(config, "QUOTE_CACHE_TTL", 15.0, float),
+            maxsize=setting(config, "QUOTE_CACHE_SIZE", 1024, int),
+        )
+        # Bounded pool used by lookup_many to fetch missing quotes concurrently
+        self.pool = ThreadPoolExecutor(
+            max_workers=setting(config, "QUOTE_FETCH_WORKERS", 32, int),
+            thread_name_prefix="lookup",
+        )
+        # Store recording every fetched quote (see record_prices)
+        self.price_store = None
+        # Recorded prices served instead of the quote API (see replay_prices)
+        self.replay_client = None
+        # Known symbols, lookups of unlisted ones fail without calling the quote API (see use_symbol_directory)
+        self.symbol_directory = None
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
+
+    def record_prices(self, store):
+        """Record every quote fetched from the quote API in store (a PriceStore, None to stop)."""
+        self.price_store = store
+
+    def replay_prices(self, client):
+        """
+        Serve quotes from client (a ReplayClient, None to stop) instead of the quote API.
+
+        Cached quotes would outlive the simulated clock moving on, and a replayed
+        lookup is as cheap as a cache hit, so the quote cache is bypassed.
+        """
+        self.replay_client = client
+        if client is not None:
+            self.cache.ttl = 0
+        self.cache.invalidate()
+
+    def use_symbol_directory(self, directory):
+        """Check symbols against directory (a SymbolDirectory, None to stop) before looking them up."""
+        self.symbol_directory = directory
+
+    def lookup(self, symbol):
+        """Look up quote for symbol, served from the cache when fresh."""
+        started = time.perf_counter()
+        quote_data = self._lookup(symbol.upper())
+        metrics.record_timing("quote", time.perf_counter() - started)
+        return quote_data
+
+    def lookup_many(self, symbols):
+        """
+        Look up quotes for several symbols at once.
+
+        Cached quotes are returned directly, the rest are fetched concurrently,
+        so the call takes about as long as the slowest single lookup.
+
+        Args:
+            symbols: Iterable of stock symbols
+
+        Returns:
+            Dict mapping upper-cased symbol to quote dict (None if lookup failed)
+        """
+        started = time.perf_counter()
+        quotes, missing = self._cached(symbols)
+
+        if len(missing) == 1 or self.replay_client is not None:
+            # Nothing to wait on concurrently
+            for symbol in missing:
+                quotes[symbol] = self._lookup(symbol)
+        elif missing:
+            for symbol, quote_data in zip(missing, self.pool.map(self._lookup, missing)):
+                quotes[symbol] = quote_data
+
+        metrics.record_timing("quote", time.perf_counter() - started)
+        return quotes
+
+    def fetch(self, symbol):
+        """Fetch quote for symbol from the quote API (or replay), bypassing the cache."""
+        if self.replay_client is not None:
+            return self.replay_client.fetch(symbol.upper())
+        started = time.perf_counter()
+        result = "error"
+        try:
+            quote_data = self.client().fetch(symbol.upper())
+            result = "ok" if quote_data is not None else "invalid"
+            if quote_data is not None and self.price_store is not None:
+                self.price_store.record(quote_data)
+            return quote_data
+        finally:
+            metrics.quote_fetch_seconds.observe(time.perf_counter() - started, result=result)
+
+    async def lookup_many_async(self, symbols):
+        """
+        Look up quotes for several symbols at once like lookup_many.
+
+        Missing quotes are fetched concurrently on the shared event loop (see
+        aio) instead of a thread pool.
+        """
+        started = time.perf_counter()
+        quotes, missing = self._cached(symbols)
+
+        if missing:
+            fetched = await aio.run(self._gather_lookups(missing))
+            quotes.update(zip(missing, fetched))
+
+        metrics.record_timing("quote", time.perf_counter() - started)
+        return quotes
+
+    def client(self):
+        """Return the QuoteClient, creating it on first use."""
+        client = self._client
+        if client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = QuoteClient(**self.settings)
+                client = self._client
+        return client
+
+    def close(self):
+        """Shut down the lookup pool and close pooled connections."""
+        self.pool.shutdown(wait=False)
+        with self._client_lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    def _cached(self, symbols):
+        """Return ({upper-cased symbol: cached quote or None}, symbols that need fetching)."""
+        quotes = {}
+        missing = []
+        for symbol in dict.fromkeys(s.upper() for s in symbols):
+            if self._unlisted(symbol):
+                quotes[symbol] = None
+                continue
+            quote_data = self.cache.get_cached(symbol)
+            if quote_data is None:
+                missing.append(symbol)
+            else:
+                metrics.quote_lookup_seconds.observe(0, result="hit")
+            quotes[symbol] = quote_data
+        return quotes, missing
+
+    def _unlisted(self, symbol):
+        """Return whether upper-cased symbol is missing from an authoritative symbol directory."""
+        if self.symbol_directory is None or self.symbol_directory.is_valid(symbol):
+            return False
+        metrics.quote_lookup_seconds.observe(0, result="unlisted")
+        return True
+
+    def _lookup(self, symbol):
+        """Look up quote for upper-cased symbol, recording whether the cache had it."""
+        if self._unlisted(symbol):
+            return None
+        started = time.perf_counter()
+        quote_data = self.cache.get_cached(symbol)
+        if quote_data is not None:
+            metrics.quote_lookup_seconds.observe(time.perf_counter() - started, result="hit")
+            return quote_data
+
+        try:
+            quote_data = self.cache.get(symbol, self.fetch)
+        except QuoteUnavailable as e:
+            print(f"Request error: {e}")
+            quote_data = None
+        metrics.quote_lookup_seconds.observe(time.perf_counter() - started, result="miss")
+        return quote_data
+
+    async def _gather_lookups(self, symbols):
+        """Look up upper-cased symbols concurrently on the shared event loop."""
+        return await asyncio.gather(*(self._lookup_async(symbol) for symbol in symbols))
+
+    async def _lookup_async(self, symbol):
+        """Coroutine version of _lookup."""
+        started = time.perf_counter()
+        try:
+            quote_data = await self.cache.get_async(symbol, self._fetch_async)
+        except QuoteUnavailable as e:
+            print(f"Request error: {e}")
+            quote_data = None
+        metrics.quote_lookup_seconds.observe(time.perf_counter() - started, result="miss")
+        return quote_data
+
+    async def _fetch_async(self, symbol):
+        """Fetch quote for symbol from the quote API without blocking."""
+        if self.replay_client is not None:
+            # Series are in memory once loaded, the first lookup of a symbol reads it from the database
+            return self.replay_client.fetch(symbol.upper())
+        started = time.perf_counter()
+        result = "error"
+        try:
+            if self._async_client is None:
+                # Only ever called on the shared loop, so no lock is needed
+                self._async_client = AsyncQuoteClient(self.client())
+            quote_data = await self._async_client.fetch(symbol.upper())
+            result = "ok" if quote_data is not None else "invalid"
+            if quote_data is not None and self.price_store is not None:
+                # A full buffer is written by the recording call, keep that off the event loop
+                await asyncio.to_thread(self.price_store.record, quote_data)
+            return quote_data
+        finally:
+            metrics.quote_fetch_seconds.observe(time.perf_counter() - started, result=result)
+
+
+def quote_service():
+    """Return the QuoteService of the current app, default_quote_service outside an app context."""
+    if has_app_context():
+        return current_app.extensions.get("quotes", default_quote_service)
+    return default_quote_service
 
 
 def apology(message, code=400):
@@ -36,6 +304,15 @@ def login_required(f):
     https://flask.palletsprojects.com/en/latest/patterns/viewdecorators/
     """
 
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_coroutine(*args, **kwargs):
+            if session.get("user_id") is None:
+                return redirect("/login")
+            return await f(*args, **kwargs)
+
+        return decorated_coroutine
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if session.get("user_id") is None:
@@ -45,25 +322,98 @@ def login_required(f):
     return decorated_function
 
 
+def admin_required(f):
+    """Decorate routes to require a user listed in ADMIN_USERNAMES (see login)."""
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get("admin"):
+            return apology("admins only", 403)
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
 def lookup(symbol):
-    """Look up quote for symbol."""
-    url = f"https://finance.cs50.io/quote?symbol={symbol.upper()}"
+    """Look up quote for symbol with the current app's QuoteService, see QuoteService.lookup."""
+    return quote_service().lookup(symbol)
+
+
+def lookup_many(symbols):
+    """Look up quotes for several symbols at once, see QuoteService.lookup_many."""
+    return quote_service().lookup_many(symbols)
+
+
+def fetch_quote(symbol):
+    """Fetch quote for symbol bypassing the cache, see QuoteService.fetch."""
+    return quote_service().fetch(symbol)
+
+
+async def lookup_async(symbol):
+    """Look up quote for symbol like lookup, without blocking the event loop."""
+    return (await lookup_many_async([symbol]))[symbol.upper()]
+
+
+async def lookup_many_async(symbols):
+    """Look up quotes for several symbols at once without blocking, see QuoteService.lookup_many_async."""
+    return await quote_service().lookup_many_async(symbols)
+
+
+def record_prices(store):
+    """Record quotes fetched by the current app's QuoteService in store, see QuoteService.record_prices."""
+    quote_service().record_prices(store)
+
+
+def replay_prices(client):
+    """Serve the current app's quotes from client, see QuoteService.replay_prices."""
+    quote_service().replay_prices(client)
+
+
+def use_symbol_directory(directory):
+    """Check the current app's lookups against directory, see QuoteService.use_symbol_directory."""
+    quote_service().use_symbol_directory(directory)
+
+
+def encode_cursor(timestamp, row_id):
+    """Encode (timestamp, id) position in transaction history as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode cursor created by encode_cursor.
+
+    Returns:
+        Tuple of (timestamp, id)
+
+    Raises:
+        ValueError: If cursor is malformed
+    """
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for HTTP error responses
-        quote_data = response.json()
-        return {
-            "name": quote_data["companyName"],
-            "price": quote_data["latestPrice"],
-            "symbol": symbol.upper()
-        }
-    except requests.RequestException as e:
-        print(f"Request error: {e}")
-    except (KeyError, ValueError) as e:
-        print(f"Data parsing error: {e}")
-    return None
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit("|", 1)
+        return timestamp, int(row_id)
+    except (UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
 
 
 def usd(value):
     """Format value as USD."""
     return f"${value:,.2f}"
+
+
+def age(seconds):
+    """Format age in seconds as a short human-readable duration."""
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    return f"{seconds // 3600}h"
+
+
+# Quotes looked up outside an app (scripts, benchmarks), configured from the environment
+default_quote_service = QuoteService()
+
+# Cache of the current app's QuoteService
+quote_cache = LocalProxy(lambda: quote_service().cache)
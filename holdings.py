@@ -0,0 +1,244 @@
+"""
+Materialized holdings table.
+
+holdings keeps one row per (user_id, symbol) with the number of shares held
+and their average cost basis. Buy and sell update it in the same transaction
+as the ledger insert, so reading a portfolio is O(positions) instead of a
+GROUP BY over every trade. Sales also add their profit over that average
+cost to users.realized_pnl (see schema migration 10). rebuild(),
+rebuild_realized() and verify() recompute them from the transactions table.
+"""
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS holdings (
+        user_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        shares INTEGER NOT NULL,
+        cost_basis NUMERIC NOT NULL,
+        PRIMARY KEY (user_id, symbol)
+    )
+"""
+
+# Allowed difference between stored and recomputed cost basis
+COST_BASIS_TOLERANCE = 0.005
+
+
+def create_table(db):
+    """Create holdings table, populating it from transactions if it is new."""
+    exists = db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'holdings'")
+    if not exists:
+        db.execute(SCHEMA)
+        rebuild(db)
+
+
+def record_buy(tx, user_id, symbol, shares, price):
+    """Add bought shares to user's position."""
+    tx.execute(
+        "INSERT INTO holdings (user_id, symbol, shares, cost_basis) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id, symbol) DO UPDATE SET "
+        "shares = shares + excluded.shares, cost_basis = cost_basis + excluded.cost_basis",
+        user_id,
+        symbol,
+        shares,
+        shares * price
+    )
+
+
+def record_sell(tx, user_id, symbol, shares, price):
+    """Remove sold shares from user's position, reducing cost basis at average cost, and book the profit."""
+    tx.execute(
+        "UPDATE users SET realized_pnl = realized_pnl + "
+        "COALESCE((SELECT ? * (? - cost_basis * 1.0 / shares) FROM holdings WHERE user_id = ? AND symbol = ?), 0) "
+        "WHERE id = ?",
+        shares,
+        price,
+        user_id,
+        symbol,
+        user_id
+    )
+    tx.execute(
+        "UPDATE holdings SET cost_basis = cost_basis * (shares - ?) * 1.0 / shares, shares = shares - ? "
+        "WHERE user_id = ? AND symbol = ?",
+        shares,
+        shares,
+        user_id,
+        symbol
+    )
+    tx.execute(
+        "DELETE FROM holdings WHERE user_id = ? AND symbol = ? AND shares <= 0",
+        user_id,
+        symbol
+    )
+
+
+def compute(rows):
+    """
+    Replay ledger rows into positions.
+
+    Args:
+        rows: Dicts with user_id, symbol, shares and price, ordered by id
+
+    Returns:
+        Dict mapping (user_id, symbol) to [shares, cost_basis] for open positions
+    """
+    return _replay(rows)[0]
+
+
+def record_trades(tx, user_id, current, trades):
+    """
+    Apply several trades of one user with batched writes.
+
+    The caller has checked that no sale exceeds the shares held at that point.
+
+    Args:
+        tx: Transaction
+        user_id: Trading user
+        current: User's holdings rows (symbol, shares, cost_basis) read in tx
+        trades: (symbol, shares, price) tuples in order, shares negative for sales
+    """
+    positions = {row["symbol"]: [row["shares"], row["cost_basis"]] for row in current}
+    realized = sum(_apply(positions, symbol, shares, price) for symbol, shares, price in trades)
+
+    touched = {symbol for symbol, _, _ in trades}
+    tx.executemany(
+        "INSERT INTO holdings (user_id, symbol, shares, cost_basis) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id, symbol) DO UPDATE SET shares = excluded.shares, cost_basis = excluded.cost_basis",
+        [(user_id, symbol, *positions[symbol]) for symbol in touched if symbol in positions]
+    )
+    tx.executemany(
+        "DELETE FROM holdings WHERE user_id = ? AND symbol = ?",
+        [(user_id, symbol) for symbol in touched if symbol not in positions]
+    )
+    if any(shares < 0 for _, shares, _ in trades):
+        tx.execute("UPDATE users SET realized_pnl = realized_pnl + ? WHERE id = ?", realized, user_id)
+
+
+def _apply(positions, key, delta, price):
+    """
+    Apply one trade to the position at key, dropping it once no shares are left.
+
+    Returns:
+        Profit of a sale over the average cost of the shares sold, 0 for a purchase
+    """
+    shares, cost_basis = positions.get(key, (0, 0.0))
+    realized = 0.0
+    if delta > 0:
+        cost_basis += delta * price
+    elif shares > 0:
+        sold = min(-delta, shares)
+        realized = sold * (price - cost_basis / shares)
+        cost_basis *= (shares - sold) / shares
+    shares += delta
+    if shares > 0:
+        positions[key] = [shares, cost_basis]
+    else:
+        positions.pop(key, None)
+    return realized
+
+
+def _replay(rows):
+    """Replay ledger rows, return (positions as compute does, {user_id: realized P&L})."""
+    positions = {}
+    realized = {}
+    for row in rows:
+        profit = _apply(positions, (row["user_id"], row["symbol"]), row["shares"], row["price"])
+        realized[row["user_id"]] = realized.get(row["user_id"], 0.0) + profit
+    return positions, realized
+
+
+def _ledger(tx, user_id):
+    """Return ledger rows of one user, or of every user if user_id is None."""
+    if user_id is None:
+        return tx.execute("SELECT user_id, symbol, shares, price FROM transactions ORDER BY id")
+    return tx.execute(
+        "SELECT user_id, symbol, shares, price FROM transactions WHERE user_id = ? ORDER BY id",
+        user_id
+    )
+
+
+def rebuild(db, user_id=None):
+    """
+    Recompute holdings from transactions.
+
+    Args:
+        db: Database
+        user_id: Only rebuild this user's holdings
+
+    Returns:
+        Number of positions written
+    """
+    with db.transaction() as tx:
+        positions = compute(_ledger(tx, user_id))
+        if user_id is None:
+            tx.execute("DELETE FROM holdings")
+        else:
+            tx.execute("DELETE FROM holdings WHERE user_id = ?", user_id)
+        for (uid, symbol), (shares, cost_basis) in positions.items():
+            tx.execute(
+                "INSERT INTO holdings (user_id, symbol, shares, cost_basis) VALUES (?, ?, ?, ?)",
+                uid,
+                symbol,
+                shares,
+                cost_basis
+            )
+    return len(positions)
+
+
+def rebuild_realized(db, user_id=None):
+    """
+    Recompute users.realized_pnl from transactions.
+
+    Args:
+        db: Database
+        user_id: Only recompute this user's realized P&L
+
+    Returns:
+        Number of users updated
+    """
+    with db.transaction() as tx:
+        _, realized = _replay(_ledger(tx, user_id))
+        if user_id is None:
+            tx.execute("UPDATE users SET realized_pnl = 0")
+        else:
+            realized.setdefault(user_id, 0.0)
+        tx.executemany(
+            "UPDATE users SET realized_pnl = ? WHERE id = ?",
+            [(profit, uid) for uid, profit in realized.items()]
+        )
+    return len(realized)
+
+
+def verify(db, user_id=None):
+    """
+    Compare holdings with positions recomputed from transactions.
+
+    Both tables are read from one snapshot in a deferred transaction, so
+    trades carry on while the ledger is scanned.
+
+    Returns:
+        List of (user_id, symbol, stored, expected) tuples for every mismatch,
+        where stored and expected are (shares, cost_basis) or None
+    """
+    with db.transaction(immediate=False) as tx:
+        expected = compute(_ledger(tx, user_id))
+        if user_id is None:
+            rows = tx.execute("SELECT user_id, symbol, shares, cost_basis FROM holdings")
+        else:
+            rows = tx.execute(
+                "SELECT user_id, symbol, shares, cost_basis FROM holdings WHERE user_id = ?",
+                user_id
+            )
+
+    stored = {(row["user_id"], row["symbol"]): (row["shares"], row["cost_basis"]) for row in rows}
+    mismatches = []
+    for key in sorted(stored.keys() | expected.keys()):
+        have = stored.get(key)
+        want = tuple(expected[key]) if key in expected else None
+        if (
+            have is None
+            or want is None
+            or have[0] != want[0]
+            or abs(have[1] - want[1]) > COST_BASIS_TOLERANCE
+        ):
+            mismatches.append((key[0], key[1], have, want))
+    return mismatches
@@ -0,0 +1,181 @@
+"""
+Leaderboard of all accounts by total value.
+
+Leaderboard values every account in one pass: a single query over users
+joined with holdings, and one batched quote lookup for the union of held
+symbols. The ranking is then kept in memory and updated as trades commit,
+so reading it doesn't touch the database or the quote API. Prices are a
+snapshot taken at the last rebuild, refreshed once it is older than ttl.
+
+Each process keeps its own leaderboard, so with several workers trades
+made elsewhere show up at the next rebuild, as does a trade that commits
+while a rebuild is reading the database.
+"""
+
+import bisect
+import threading
+import time
+
+
+LEADERBOARD_QUERY = (
+    "SELECT users.id, users.username, users.cash, holdings.symbol, holdings.shares "
+    "FROM users LEFT JOIN holdings ON holdings.user_id = users.id WHERE users.deleted_at IS NULL"
+)
+
+
+class Leaderboard:
+    """Ranking of accounts by cash plus positions at snapshot prices."""
+
+    def __init__(self, db, lookup_many, ttl=60.0):
+        """
+        Initialize leaderboard, built on first use.
+
+        Args:
+            db: Database with users and holdings tables
+            lookup_many: Callable taking symbols and returning dict of symbol to quote dict
+            ttl: Seconds before prices are refetched and the ranking rebuilt
+        """
+        self.db = db
+        self.lookup_many = lookup_many
+        self.ttl = ttl
+        self.built_at = None
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._usernames = {}
+        self._cash = {}
+        self._positions = {}
+        self._holders = {}
+        self._prices = {}
+        self._values = {}
+        # (-value, user_id), so the richest account comes first
+        self._ranking = []
+
+    def rebuild(self):
+        """Recompute every account's value from the database and fresh quotes."""
+        rows = self.db.execute(LEADERBOARD_QUERY)
+        quotes = self.lookup_many({row["symbol"] for row in rows if row["symbol"] is not None})
+
+        usernames, cash, positions, holders = {}, {}, {}, {}
+        for row in rows:
+            user_id = row["id"]
+            usernames[user_id] = row["username"]
+            cash[user_id] = row["cash"]
+            user_positions = positions.setdefault(user_id, {})
+            if row["symbol"] is not None:
+                user_positions[row["symbol"]] = row["shares"]
+                holders.setdefault(row["symbol"], set()).add(user_id)
+        prices = {symbol: quote["price"] for symbol, quote in quotes.items() if quote is not None}
+
+        with self._lock:
+            self._usernames, self._cash, self._positions = usernames, cash, positions
+            self._holders, self._prices = holders, prices
+            self._values = {user_id: self._value(user_id) for user_id in usernames}
+            self._ranking = sorted((-value, user_id) for user_id, value in self._values.items())
+            self.built_at = time.monotonic()
+            self.rebuilds += 1
+
+    def top(self, limit=None):
+        """
+        Return the ranking, richest first.
+
+        Args:
+            limit: Number of accounts to return (all if None)
+
+        Returns:
+            List of dicts with rank, user_id, username, cash and value
+        """
+        if self._stale():
+            # One request rebuilds, the others wait for it rather than rebuilding too
+            with self._rebuild_lock:
+                if self._stale():
+                    self.rebuild()
+        with self._lock:
+            ranking = self._ranking if limit is None else self._ranking[:limit]
+            return [
+                {
+                    "rank": rank,
+                    "user_id": user_id,
+                    "username": self._usernames[user_id],
+                    "cash": self._cash[user_id],
+                    "value": -value,
+                }
+                for rank, (value, user_id) in enumerate(ranking, 1)
+            ]
+
+    def record_trade(self, user_id, symbol, shares, price):
+        """
+        Apply a committed trade to the ranking.
+
+        Args:
+            user_id: Trading user
+            symbol: Traded symbol
+            shares: Shares bought, negative for a sale
+            price: Price per share
+        """
+        with self._lock:
+            if self.built_at is None or user_id not in self._cash:
+                # The next rebuild reads it from the database
+                return
+            self._cash[user_id] -= shares * price
+            positions = self._positions[user_id]
+            positions[symbol] = positions.get(symbol, 0) + shares
+            if positions[symbol] <= 0:
+                del positions[symbol]
+                self._holders.get(symbol, set()).discard(user_id)
+            else:
+                self._holders.setdefault(symbol, set()).add(user_id)
+
+            if symbol in self._prices:
+                self._update(user_id)
+            else:
+                # First price seen for symbol, it changes the value of everyone holding it
+                self._prices[symbol] = price
+                for holder in self._holders.get(symbol, ()) | {user_id}:
+                    self._update(holder)
+
+    def add_user(self, user_id):
+        """Add a newly registered account."""
+        if self.built_at is None:
+            return
+        rows = self.db.execute("SELECT username, cash FROM users WHERE id = ?", user_id)
+        if not rows:
+            return
+        with self._lock:
+            self._usernames[user_id] = rows[0]["username"]
+            self._cash[user_id] = rows[0]["cash"]
+            self._positions[user_id] = {}
+            self._update(user_id)
+
+    def remove_user(self, user_id):
+        """Drop a deleted account."""
+        with self._lock:
+            if user_id not in self._values:
+                return
+            self._remove(user_id)
+            for symbol in self._positions.pop(user_id):
+                self._holders.get(symbol, set()).discard(user_id)
+            del self._usernames[user_id], self._cash[user_id]
+
+    def _stale(self):
+        """Return whether the ranking needs a rebuild."""
+        return self.built_at is None or time.monotonic() - self.built_at > self.ttl
+
+    def _value(self, user_id):
+        """Cash plus positions of user_id at snapshot prices. Caller holds lock."""
+        return self._cash[user_id] + sum(
+            shares * self._prices.get(symbol, 0.0) for symbol, shares in self._positions[user_id].items()
+        )
+
+    def _update(self, user_id):
+        """Revalue user_id and move it to its new rank. Caller holds lock."""
+        self._remove(user_id)
+        value = self._values[user_id] = self._value(user_id)
+        bisect.insort(self._ranking, (-value, user_id))
+
+    def _remove(self, user_id):
+        """Take user_id out of the ranking. Caller holds lock."""
+        value = self._values.pop(user_id, None)
+        if value is not None:
+            i = bisect.bisect_left(self._ranking, (-value, user_id))
+            del self._ranking[i]
@@ -0,0 +1,202 @@
+"""
+Hot-path instrumentation.
+
+Database queries, quote lookups, template renders and whole requests are
+timed into histograms, exported in the Prometheus text format by render().
+Within a request the same timings are summed per category for the
+Server-Timing response header, and slow requests can be profiled.
+"""
+
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import lru_cache
+
+from flask import g, has_request_context
+
+
+# Upper bounds of histogram buckets in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative histogram with labels, in the style of a Prometheus histogram."""
+
+    def __init__(self, name, documentation, labelnames, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        """Record value for the series identified by labels."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        """Return histogram in Prometheus text format as a list of lines."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-2]}")
+            lines.append(f"{self.name}_count{suffix} {values[-1]}")
+        return lines
+
+
+REGISTRY = []
+
+# Callables returning extra (name, type, documentation, value) samples, e.g. cache counters
+COLLECTORS = []
+
+db_query_seconds = Histogram(
+    "finance_db_query_seconds", "Time spent executing database statements.", ("statement",)
+)
+quote_lookup_seconds = Histogram(
+    "finance_quote_lookup_seconds", "Time spent looking up quotes, by cache result.", ("result",)
+)
+quote_fetch_seconds = Histogram(
+    "finance_quote_fetch_seconds", "Time spent fetching quotes from the quote API.", ("result",)
+)
+template_render_seconds = Histogram(
+    "finance_template_render_seconds", "Time spent rendering templates.", ("template",)
+)
+request_seconds = Histogram(
+    "finance_request_seconds", "Time spent handling requests.", ("endpoint", "method", "status")
+)
+
+
+def _escape(value):
+    """Escape label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@lru_cache(maxsize=256)
+def normalize_sql(query):
+    """Collapse whitespace and placeholder lists so equal statements share one series."""
+    query = " ".join(query.split())
+    return re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", query)
+
+
+def record_timing(category, seconds):
+    """Add seconds to category of the current request's Server-Timing header."""
+    if not has_request_context():
+        return
+    timings = g.setdefault("server_timing", {})
+    total, count = timings.get(category, (0.0, 0))
+    timings[category] = (total + seconds, count + 1)
+
+
+@contextmanager
+def timed(histogram, category=None, **labels):
+    """Time block into histogram and, if category is given, into Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        if category is not None:
+            record_timing(category, elapsed)
+
+
+def server_timing(total=None):
+    """Return Server-Timing header value for the current request."""
+    entries = [
+        f'{category};dur={seconds * 1000:.2f};desc="{count}x"'
+        for category, (seconds, count) in g.get("server_timing", {}).items()
+    ]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def before_render(sender, template, context, **extra):
+    """Signal receiver marking the start of a template render."""
+    if has_request_context():
+        g.setdefault("render_started", []).append(time.perf_counter())
+
+
+def after_render(sender, template, context, **extra):
+    """Signal receiver recording a finished template render."""
+    if has_request_context() and g.get("render_started"):
+        elapsed = time.perf_counter() - g.render_started.pop()
+        template_render_seconds.observe(elapsed, template=template.name)
+        record_timing("render", elapsed)
+
+
+def render():
+    """Return all metrics in Prometheus text format."""
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.render())
+    for collector in COLLECTORS:
+        for name, kind, documentation, value in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in profiler for slow requests.
+
+    A sample of requests runs under cProfile, and the profiles of requests
+    slower than the threshold are written to directory, one .prof file per
+    request named after the endpoint.
+    """
+
+    def __init__(self, threshold_ms, sample_rate=1.0, directory="profiles"):
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.directory = directory
+
+    def start(self):
+        """Start profiling the current request if it is sampled."""
+        if random.random() >= self.sample_rate:
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active in this interpreter
+            return
+        g.profiler = profiler
+
+    def stop(self, endpoint, elapsed):
+        """Stop profiling, keeping the profile if the request was slow."""
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return
+        profiler.disable()
+        if elapsed >= self.threshold:
+            os.makedirs(self.directory, exist_ok=True)
+            filename = f"{endpoint or 'unknown'}-{int(time.time() * 1000)}-{int(elapsed * 1000)}ms.prof"
+            profiler.dump_stats(os.path.join(self.directory, filename))
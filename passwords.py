@@ -0,0 +1,126 @@
+"""
+Password hashing service.
+
+Hashing and verification are deliberately slow, so PasswordHasher runs them
+in a bounded pool of worker processes: a login storm then queues up there
+instead of holding request threads and the GIL, and past max_pending
+waiting jobs callers get PasswordServiceBusy instead of piling up.
+
+The method is any Werkzeug method string, e.g. "scrypt" (default),
+"scrypt:65536:8:1" or "pbkdf2:sha256:1000000". Hashes made with other
+parameters still verify, and verify_and_update() returns a new hash for
+them so login can upgrade them.
+"""
+
+import multiprocessing
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many hashing jobs are already waiting."""
+
+
+class PasswordHasher:
+    """Hash and verify passwords, in worker processes if workers > 0."""
+
+    def __init__(self, method="scrypt", workers=0, max_pending=64, timeout=5.0):
+        """
+        Initialize hasher, worker processes start on first use.
+
+        Args:
+            method: Werkzeug hash method with its cost parameters
+            workers: Worker processes, 0 to hash in the calling thread
+            max_pending: Jobs allowed to wait for or run in the pool
+            timeout: Seconds to wait for a free slot before raising PasswordServiceBusy
+        """
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._prefix = None
+
+    def hash(self, password):
+        """Return hash of password with the current method."""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Return whether password matches password_hash."""
+        return self._run(check_password_hash, password_hash, password)
+
+    def verify_and_update(self, password_hash, password):
+        """
+        Verify password and rehash it if password_hash uses other parameters.
+
+        Returns:
+            Tuple of (matches, new hash or None if no rehash is needed)
+        """
+        return self._run(_verify_and_update, password_hash, password, self.method, self.prefix())
+
+    def needs_rehash(self, password_hash):
+        """Return whether password_hash was made with other parameters than the current method."""
+        return password_hash.split("$", 1)[0] != self.prefix()
+
+    def prefix(self):
+        """Return the method part Werkzeug writes into hashes, with default parameters filled in."""
+        if self._prefix is None:
+            # Werkzeug expands e.g. "scrypt" to "scrypt:32768:8:1", cheapest way to learn how is to ask it
+            self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        return self._prefix
+
+    def close(self):
+        """Shut down worker processes."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _run(self, func, *args):
+        """Run func(*args) in the pool, or inline without workers."""
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordServiceBusy("too many password hashing jobs waiting")
+        try:
+            pool = self._executor()
+            try:
+                return pool.submit(func, *args).result()
+            except BrokenProcessPool:
+                # A worker died (killed for memory, crashed starting up) and took the pool with it,
+                # every later job would fail the same way, so start a new pool and retry once
+                self._discard(pool)
+                return self._executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def _executor(self):
+        """Return the process pool, starting it on first use."""
+        with self._pool_lock:
+            if self._pool is None:
+                # Forking a process with running threads can deadlock the child, so spawn
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _discard(self, pool):
+        """Shut down a broken pool, unless another job already replaced it."""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+
+def _verify_and_update(password_hash, password, method, prefix):
+    """Worker side of PasswordHasher.verify_and_update."""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if password_hash.split("$", 1)[0] == prefix:
+        return True, None
+    return True, generate_password_hash(password, method)
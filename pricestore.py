@@ -0,0 +1,201 @@
+"""
+Historical price store and offline quote replay.
+
+PriceStore appends every quote fetched from the quote API to the prices
+table (indexed on symbol, ts). Writes are buffered and committed in
+batches, and a company name is only stored when it differs from the last
+one recorded for the symbol, so a row is little more than (symbol, ts, price).
+
+ReplayClient stands in for QuoteClient: it answers fetch(symbol) with the
+last recorded price at or before a SimulatedClock's time, from series
+loaded into memory once per symbol. Load tests and backtests then run
+deterministically, without the network, at local speed.
+"""
+
+import threading
+import time
+
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+
+SERIES_QUERY = "SELECT ts, price, name FROM prices WHERE symbol = ? ORDER BY ts"
+
+
+class PriceStore:
+    """Append-only time series of quotes in the prices table."""
+
+    def __init__(self, db, batch_size=200, flush_interval=5.0):
+        """
+        Initialize price store.
+
+        Args:
+            db: Database with the prices table (see schema migration 6)
+            batch_size: Quotes buffered before they are written
+            flush_interval: Seconds after which a non-empty buffer is written on the next record
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self._pending = []
+        self._names = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def record(self, quote):
+        """Buffer quote dict (symbol, price, name, fetched_at) for writing."""
+        symbol = quote["symbol"]
+        with self._lock:
+            name = quote.get("name")
+            if self._names.get(symbol) == name:
+                name = None
+            else:
+                self._names[symbol] = name
+            self._pending.append((symbol, quote.get("fetched_at", time.time()), quote["price"], name))
+            due = (
+                len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write buffered quotes in one transaction."""
+        # One writer at a time, so batches are committed in the order they were taken
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                self._last_flush = time.monotonic()
+            if rows:
+                self.db.executemany("INSERT INTO prices (symbol, ts, price, name) VALUES (?, ?, ?, ?)", rows)
+                self.recorded += len(rows)
+
+    def series(self, symbol):
+        """
+        Load every recorded price of symbol.
+
+        Returns:
+            Tuple of lists (timestamps, prices, names) in time order, names
+            carried forward from the last row that recorded one
+        """
+        self.flush()
+        columns = self.db.columns(SERIES_QUERY, symbol)
+        names = []
+        name = None
+        for value in columns["name"]:
+            if value is not None:
+                name = value
+            names.append(name)
+        return columns["ts"], [float(price) for price in columns["price"]], names
+
+    def span(self):
+        """Return (first, last) recorded timestamp, (None, None) if the store is empty."""
+        self.flush()
+        rows = self.db.execute("SELECT MIN(ts) AS first, MAX(ts) AS last FROM prices")
+        return rows[0]["first"], rows[0]["last"]
+
+
+class SimulatedClock:
+    """Clock that starts at a given time and runs at speed times real time."""
+
+    def __init__(self, start, speed=1.0):
+        """
+        Initialize clock.
+
+        Args:
+            start: Unix timestamp the clock starts at
+            speed: Simulated seconds per real second, 0 for a clock that only moves by set/advance
+        """
+        self.speed = speed
+        self._start = start
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def now(self):
+        """Return the simulated unix timestamp."""
+        with self._lock:
+            return self._start + (time.monotonic() - self._started) * self.speed
+
+    def set(self, timestamp):
+        """Move clock to timestamp."""
+        with self._lock:
+            self._start = timestamp
+            self._started = time.monotonic()
+
+    def advance(self, seconds):
+        """Move clock forward by seconds."""
+        self.set(self.now() + seconds)
+
+
+class ReplayClient:
+    """Quote source serving recorded prices at a simulated time, in place of QuoteClient."""
+
+    def __init__(self, store, clock):
+        """
+        Initialize replay client.
+
+        Args:
+            store: PriceStore to read series from
+            clock: SimulatedClock deciding which recorded price is current
+        """
+        self.store = store
+        self.clock = clock
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, symbol):
+        """
+        Return the last recorded quote of symbol at the clock's time.
+
+        Returns:
+            Quote dict like QuoteClient.fetch, or None if symbol has no price
+            recorded at or before that time
+        """
+        series = self._series.get(symbol)
+        if series is None:
+            series = self.store.series(symbol)
+            with self._lock:
+                series = self._series.setdefault(symbol, series)
+        timestamps, prices, names = series
+        index = bisect_right(timestamps, self.clock.now()) - 1
+        if index < 0:
+            return None
+        return {
+            "name": names[index] or symbol,
+            "price": prices[index],
+            "symbol": symbol,
+            "fetched_at": timestamps[index],
+        }
+
+    def reload(self):
+        """Forget loaded series, so prices recorded since are picked up."""
+        with self._lock:
+            self._series.clear()
+
+    def close(self):
+        """Nothing to release, for symmetry with QuoteClient."""
+
+
+def parse_time(value):
+    """
+    Parse a replay start time.
+
+    Args:
+        value: Unix timestamp, or ISO 8601 date/time (UTC unless it has an offset)
+
+    Returns:
+        Unix timestamp
+
+    Raises:
+        ValueError: If value is neither
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
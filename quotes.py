@@ -0,0 +1,468 @@
+import asyncio
+import random
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+DEFAULT_QUOTE_URL = "https://finance.cs50.io/quote"
+
+
+class QuoteUnavailable(Exception):
+    """Raised when the quote API can't be reached or is degraded."""
+
+
+class CircuitOpen(QuoteUnavailable):
+    """Raised without calling the quote API while the circuit breaker is open."""
+
+
+class QuoteCache:
+    """
+    In-process cache for stock quotes.
+
+    Entries expire after a per-symbol TTL, the cache holds at most `maxsize`
+    symbols (least recently used are evicted first), and concurrent misses
+    for the same symbol share a single upstream fetch.
+    """
+
+    def __init__(self, ttl=15.0, maxsize=1024, max_stale=300.0):
+        """
+        Initialize quote cache.
+
+        Args:
+            ttl: Default time-to-live of a cached quote in seconds
+            maxsize: Maximum number of symbols kept in the cache
+            max_stale: How long past its TTL a quote may still be served
+                while the quote API is unavailable, in seconds
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_stale = max_stale
+        self._ttl_overrides = {}
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.stale = 0
+
+    def set_ttl(self, symbol, ttl):
+        """Override TTL for a single symbol (None restores the default)."""
+        with self._lock:
+            if ttl is None:
+                self._ttl_overrides.pop(symbol, None)
+            else:
+                self._ttl_overrides[symbol] = ttl
+
+    def ttl_for(self, symbol):
+        """Return TTL in seconds for symbol."""
+        return self._ttl_overrides.get(symbol, self.ttl)
+
+    def get_cached(self, symbol):
+        """Return fresh cached quote for symbol without fetching, or None."""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(symbol)
+                self.hits += 1
+                return entry[1]
+        return None
+
+    def get(self, symbol, fetch):
+        """
+        Return cached quote for symbol, fetching it on a miss.
+
+        Args:
+            symbol: Stock symbol (cache key)
+            fetch: Callable taking symbol and returning quote dict or None
+
+        Returns:
+            Quote dict, or None if fetch failed (failures are not cached)
+
+        Raises:
+            QuoteUnavailable: If fetch raised it and no stale quote is left
+        """
+        cached, future, leader = self._begin(symbol)
+        if future is None:
+            return cached
+        if not leader:
+            return future.result()
+
+        try:
+            quote = fetch(symbol)
+        except BaseException as e:
+            return self._fail(symbol, future, e)
+        return self._finish(symbol, future, quote)
+
+    async def get_async(self, symbol, fetch):
+        """
+        Coroutine version of get for an async fetch.
+
+        Waiters are coalesced with concurrent get and get_async calls for
+        the same symbol, whichever thread or event loop they run on.
+        """
+        cached, future, leader = self._begin(symbol)
+        if future is None:
+            return cached
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            quote = await fetch(symbol)
+        except BaseException as e:
+            return self._fail(symbol, future, e)
+        return self._finish(symbol, future, quote)
+
+    def _begin(self, symbol):
+        """
+        Start a lookup.
+
+        Returns:
+            (quote, None, False) on a hit, otherwise (None, future, leader)
+            where only the leader fetches and then resolves future
+        """
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(symbol)
+                self.hits += 1
+                return entry[1], None, False
+
+            self.misses += 1
+            future = self._inflight.get(symbol)
+            if future is not None:
+                # Someone is already fetching this symbol, wait for them
+                self.coalesced += 1
+                return None, future, False
+
+            future = Future()
+            self._inflight[symbol] = future
+            return None, future, True
+
+    def _finish(self, symbol, future, quote):
+        """Store fetched quote and wake up waiters."""
+        with self._lock:
+            del self._inflight[symbol]
+            if quote is not None:
+                self._store(symbol, quote)
+        future.set_result(quote)
+        return quote
+
+    def _fail(self, symbol, future, error):
+        """Handle failed fetch, serving a stale quote if upstream is degraded."""
+        quote = None
+        with self._lock:
+            del self._inflight[symbol]
+            if isinstance(error, QuoteUnavailable):
+                # Upstream is degraded, fall back to an expired quote if we have one
+                entry = self._entries.get(symbol)
+                if entry is not None and entry[0] + self.max_stale > time.monotonic():
+                    self.stale += 1
+                    quote = entry[1]
+        if quote is None:
+            future.set_exception(error)
+            raise error
+        future.set_result(quote)
+        return quote
+
+    def _store(self, symbol, quote):
+        """Insert quote and evict least recently used entries. Caller holds lock."""
+        self._entries[symbol] = (time.monotonic() + self.ttl_for(symbol), quote)
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, symbol, quote):
+        """Store freshly fetched quote for symbol, e.g. from a background refresher."""
+        with self._lock:
+            self._store(symbol, quote)
+
+    def invalidate(self, symbol=None):
+        """Drop one symbol, or every symbol if none is given."""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(symbol, None)
+
+    def stats(self):
+        """Return cache counters as a dict."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+                "stale": self.stale,
+            }
+
+
+class RetryBudget:
+    """
+    Token bucket that caps retries at a fraction of all requests.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, so
+    during an outage retries can't multiply the load on the quote API.
+    """
+
+    def __init__(self, ratio=0.1, max_tokens=10.0):
+        """
+        Initialize retry budget.
+
+        Args:
+            ratio: Retries allowed per request
+            max_tokens: Maximum number of retries that can be saved up
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Record a request."""
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """Try to spend one retry, return True if the budget allowed it."""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """
+    Fail fast after repeated upstream failures.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are rejected for `reset_timeout` seconds, then a single trial
+    call is let through to decide whether to close it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Initialize circuit breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds to stay open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Return "closed", "open" or "half-open"."""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """Return True if a call may go through."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        """Close the circuit."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """Count a failure, opening the circuit once the threshold is reached."""
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class QuoteClient:
+    """
+    HTTP client for the quote API.
+
+    Uses one pooled keep-alive session, bounded connect/read timeouts,
+    jittered retries limited by a RetryBudget, and a CircuitBreaker.
+    """
+
+    def __init__(
+        self,
+        base_url=DEFAULT_QUOTE_URL,
+        connect_timeout=3.05,
+        read_timeout=5.0,
+        max_retries=2,
+        backoff=0.1,
+        pool_size=32,
+        retry_budget=None,
+        breaker=None,
+    ):
+        """
+        Initialize quote client.
+
+        Args:
+            base_url: Quote endpoint, called as {base_url}?symbol={SYMBOL}
+            connect_timeout: Seconds to wait for a connection
+            read_timeout: Seconds to wait for response data
+            max_retries: Maximum retries per request
+            backoff: Base delay in seconds for exponential backoff with full jitter
+            pool_size: Maximum keep-alive connections to the quote API
+            retry_budget: RetryBudget shared by all requests
+            breaker: CircuitBreaker guarding the quote API
+        """
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+
+        # Imported here so processes that never fetch a quote don't pay for it
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._errors = (requests.RequestException, QuoteUnavailable)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, symbol):
+        """
+        Fetch quote for symbol.
+
+        Returns:
+            Quote dict, or None if the symbol is unknown or the response is malformed
+
+        Raises:
+            QuoteUnavailable: If the quote API is down, slow or the circuit is open
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen(f"quote API circuit open, not fetching {symbol}")
+
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(
+                    self.base_url, params={"symbol": symbol}, timeout=self.timeout
+                )
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise QuoteUnavailable(f"quote API returned {response.status_code}")
+                break
+            except self._errors as e:
+                if attempt >= self.max_retries or not self.retry_budget.withdraw():
+                    self.breaker.record_failure()
+                    if isinstance(e, QuoteUnavailable):
+                        raise
+                    raise QuoteUnavailable(str(e)) from e
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                attempt += 1
+
+        # The API answered, so any remaining problem is with the request itself
+        self.breaker.record_success()
+        return _parse_quote(symbol, response)
+
+    def close(self):
+        """Close pooled connections."""
+        self.session.close()
+
+
+class AsyncQuoteClient:
+    """
+    Non-blocking counterpart of QuoteClient built on httpx.AsyncClient.
+
+    Shares the retry budget and circuit breaker of a QuoteClient, so sync
+    and async requests are limited together. The connection pool is bound
+    to the event loop the client is first used on.
+    """
+
+    def __init__(self, client):
+        """
+        Initialize async quote client.
+
+        Args:
+            client: QuoteClient to take URL, timeouts, retry and breaker settings from
+        """
+        import httpx
+
+        self.base_url = client.base_url
+        self.max_retries = client.max_retries
+        self.backoff = client.backoff
+        self.retry_budget = client.retry_budget
+        self.breaker = client.breaker
+        self._errors = (httpx.HTTPError, QuoteUnavailable)
+        connect_timeout, read_timeout = client.timeout
+        self.session = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=client.pool_size, max_keepalive_connections=client.pool_size),
+        )
+
+    async def fetch(self, symbol):
+        """Fetch quote for symbol, see QuoteClient.fetch."""
+        if not self.breaker.allow():
+            raise CircuitOpen(f"quote API circuit open, not fetching {symbol}")
+
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = await self.session.get(self.base_url, params={"symbol": symbol})
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise QuoteUnavailable(f"quote API returned {response.status_code}")
+                break
+            except self._errors as e:
+                if attempt >= self.max_retries or not self.retry_budget.withdraw():
+                    self.breaker.record_failure()
+                    if isinstance(e, QuoteUnavailable):
+                        raise
+                    raise QuoteUnavailable(str(e) or type(e).__name__) from e
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                attempt += 1
+
+        self.breaker.record_success()
+        return _parse_quote(symbol, response)
+
+    async def close(self):
+        """Close pooled connections."""
+        await self.session.aclose()
+
+
+def _parse_quote(symbol, response):
+    """Convert quote API response to a quote dict, None if there is no valid quote."""
+    if response.status_code >= 400:
+        return None
+    try:
+        quote_data = response.json()
+        return {
+            "name": quote_data["companyName"],
+            "price": quote_data["latestPrice"],
+            "symbol": symbol,
+            "fetched_at": time.time(),
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Data parsing error: {e}")
+        return None
@@ -0,0 +1,88 @@
+"""
+Background price refresher.
+
+Keeps quotes of every symbol somebody holds fresh in the shared quote cache,
+so request handlers find them there instead of waiting for the quote API.
+"""
+
+import threading
+import time
+
+from quotes import QuoteUnavailable
+
+
+class PriceRefresher:
+    """Daemon thread that periodically refetches quotes of held symbols."""
+
+    def __init__(self, db, cache, fetch, interval=10.0, rate=5.0):
+        """
+        Initialize refresher.
+
+        Args:
+            db: Database with the holdings table
+            cache: QuoteCache to publish quotes into
+            fetch: Callable taking symbol and returning quote dict or None
+            interval: Seconds between the starts of two refresh cycles
+            rate: Maximum quote API requests per second
+        """
+        self.db = db
+        self.cache = cache
+        self.fetch = fetch
+        self.interval = interval
+        self.rate = rate
+        self.refreshed = 0
+        self.failed = 0
+        self.last_cycle = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def held_symbols(self):
+        """Return every symbol currently held by any user."""
+        return [row["symbol"] for row in self.db.execute("SELECT DISTINCT symbol FROM holdings")]
+
+    def refresh(self):
+        """Refresh all held symbols once, at most `rate` requests per second."""
+        started = time.monotonic()
+        next_request = started
+        for symbol in self.held_symbols():
+            # Pace requests so a large portfolio set doesn't burst the quote API
+            delay = next_request - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            next_request = max(next_request, time.monotonic()) + 1 / self.rate
+
+            try:
+                quote = self.fetch(symbol)
+            except QuoteUnavailable as e:
+                print(f"Request error: {e}")
+                quote = None
+            if quote is None:
+                self.failed += 1
+            else:
+                self.cache.put(symbol, quote)
+                self.refreshed += 1
+        self.last_cycle = time.monotonic() - started
+
+    def run(self):
+        """Refresh until stopped."""
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep refreshing through transient database errors
+                print(f"Price refresh error: {e}")
+            self._stop.wait(max(0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        """Start refreshing in a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="price-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop refreshing and wait for the thread to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,205 @@
+"""
+Database schema and migrations.
+
+Each migration is a list of SQL statements or callables taking the Database
+(a Transaction while migrating, see migrate).
+migrate() applies the ones newer than the version recorded in schema_version,
+so Database can bring any database up to date at startup. Statements use
+IF NOT EXISTS because databases created by hand predate the version table.
+"""
+
+import holdings
+
+
+MIGRATIONS = [
+    # 1: users and transactions
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+            username TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            cash NUMERIC NOT NULL DEFAULT 10000.00
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS username ON users (username)",
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            symbol TEXT NOT NULL,
+            shares INTEGER NOT NULL,
+            price NUMERIC NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ],
+    # 2: materialized holdings
+    [holdings.create_table],
+    # 3: covering indexes for per-user ledger queries
+    [
+        "CREATE INDEX IF NOT EXISTS transactions_user_symbol ON transactions (user_id, symbol, shares)",
+        "CREATE INDEX IF NOT EXISTS transactions_user_timestamp ON transactions (user_id, timestamp DESC)",
+    ],
+    # 4: keyset pagination of history on (timestamp, id)
+    [
+        "CREATE INDEX IF NOT EXISTS transactions_user_timestamp_id ON transactions (user_id, timestamp DESC, id DESC)",
+        "DROP INDEX IF EXISTS transactions_user_timestamp",
+    ],
+    # 5: server-side sessions (SESSION_BACKEND=sqlite)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY NOT NULL,
+            data BLOB NOT NULL,
+            expiry REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expiry)",
+    ],
+    # 6: recorded quotes for replay (see pricestore), name only when it changed
+    [
+        """
+        CREATE TABLE IF NOT EXISTS prices (
+            symbol TEXT NOT NULL,
+            ts REAL NOT NULL,
+            price NUMERIC NOT NULL,
+            name TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS prices_symbol_ts ON prices (symbol, ts)",
+    ],
+    # 7: accounts marked deleted, their ledger purged in the background (see deletion)
+    [
+        "ALTER TABLE users ADD COLUMN deleted_at REAL",
+        "CREATE INDEX IF NOT EXISTS users_deleted_at ON users (deleted_at)",
+    ],
+    # 8: usernames of deleted accounts free at once, purges leased to one worker (see deletion)
+    [
+        "ALTER TABLE users ADD COLUMN purging_until REAL",
+        "DROP INDEX IF EXISTS username",
+        "CREATE UNIQUE INDEX IF NOT EXISTS username ON users (username) WHERE deleted_at IS NULL",
+    ],
+    # 9: ledger version bumped by every trade, cached fragments are keyed on it (see fragments)
+    ["ALTER TABLE users ADD COLUMN ledger_version INTEGER NOT NULL DEFAULT 0"],
+    # 10: realized P&L at average cost, kept by the trade paths (see holdings)
+    [
+        "ALTER TABLE users ADD COLUMN realized_pnl NUMERIC NOT NULL DEFAULT 0",
+        holdings.rebuild_realized,
+    ],
+]
+
+# Queries issued by the routes in app.py with sample arguments, see check_query_plans
+ROUTE_QUERIES = [
+    ("SELECT cash FROM users WHERE id = ?", 1),
+    ("SELECT cash, ledger_version, realized_pnl FROM users WHERE id = ?", 1),
+    ("SELECT ledger_version FROM users WHERE id = ?", 1),
+    ("SELECT cash FROM users WHERE id = ? AND deleted_at IS NULL", 1),
+    ("SELECT hash FROM users WHERE id = ?", 1),
+    ("SELECT * FROM users WHERE username = ? AND deleted_at IS NULL", "alice"),
+    ("SELECT symbol, shares as total_shares FROM holdings WHERE user_id = ?", 1),
+    ("SELECT symbol, shares as total_shares FROM holdings WHERE user_id = ? AND symbol = ?", 1, "AAPL"),
+    ("SELECT symbol FROM holdings WHERE user_id = ?", 1),
+    ("SELECT symbol, shares, cost_basis FROM holdings WHERE user_id = ?", 1),
+    ("SELECT id, timestamp FROM transactions WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?", 1, 1),
+    ("SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? "
+     "ORDER BY timestamp DESC, id DESC LIMIT ?", 1, 51),
+    ("SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? "
+     "ORDER BY timestamp DESC, id DESC", 1),
+    ("SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? AND (timestamp, id) < (?, ?) "
+     "ORDER BY timestamp DESC, id DESC LIMIT ?", 1, "2024-01-01 00:00:00", 1, 51),
+    ("SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? AND (timestamp, id) > (?, ?) "
+     "ORDER BY timestamp, id LIMIT ?", 1, "2024-01-01 00:00:00", 1, 51),
+    ("SELECT symbol, shares, price, timestamp FROM transactions WHERE user_id = ? "
+     "ORDER BY timestamp, id", 1),
+    ("UPDATE users SET cash = cash - ?, ledger_version = ledger_version + 1 WHERE id = ?", 1.0, 1),
+    ("UPDATE users SET cash = cash + ?, ledger_version = ledger_version + 1 WHERE id = ?", 1.0, 1),
+    ("UPDATE users SET hash = ? WHERE id = ?", "hash", 1),
+    ("UPDATE users SET realized_pnl = realized_pnl + "
+     "COALESCE((SELECT ? * (? - cost_basis * 1.0 / shares) FROM holdings WHERE user_id = ? AND symbol = ?), 0) "
+     "WHERE id = ?", 1, 1.0, 1, "AAPL", 1),
+    ("UPDATE users SET realized_pnl = realized_pnl + ? WHERE id = ?", 1.0, 1),
+    ("UPDATE holdings SET cost_basis = cost_basis * (shares - ?) * 1.0 / shares, shares = shares - ? "
+     "WHERE user_id = ? AND symbol = ?", 1, 1, 1, "AAPL"),
+    ("DELETE FROM holdings WHERE user_id = ? AND symbol = ? AND shares <= 0", 1, "AAPL"),
+    ("DELETE FROM holdings WHERE user_id = ? AND symbol = ?", 1, "AAPL"),
+    ("UPDATE users SET deleted_at = ?, ledger_version = ledger_version + 1 WHERE id = ? AND deleted_at IS NULL", 0.0, 1),
+    ("DELETE FROM holdings WHERE user_id = ?", 1),
+    ("SELECT id, username, cash, deleted_at FROM users WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT 1",),
+    ("SELECT id, username, cash, deleted_at FROM users WHERE deleted_at IS NOT NULL "
+     "AND (purging_until IS NULL OR purging_until < ?) ORDER BY deleted_at LIMIT 1", 0.0),
+    ("UPDATE users SET purging_until = ? WHERE id = ? AND (purging_until IS NULL OR purging_until < ?)", 0.0, 1, 0.0),
+    ("UPDATE users SET purging_until = ? WHERE id = ? AND purging_until = ?", 0.0, 1, 0.0),
+    ("SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? ORDER BY timestamp, id LIMIT ?",
+     1, 500),
+    ("DELETE FROM transactions WHERE id = ?", 1),
+    ("DELETE FROM users WHERE id = ? AND deleted_at IS NOT NULL", 1),
+    ("SELECT username, cash FROM users WHERE id = ?", 1),
+    ("SELECT data FROM sessions WHERE id = ? AND expiry > ?", "session:abc", 0.0),
+    ("DELETE FROM sessions WHERE id = ?", "session:abc"),
+    ("DELETE FROM sessions WHERE id IN (SELECT id FROM sessions WHERE expiry <= ? LIMIT ?)", 0.0, 500),
+    ("SELECT ts, price, name FROM prices WHERE symbol = ? ORDER BY ts", "AAPL"),
+]
+
+
+def version(db):
+    """Return schema version of the database (0 if never migrated)."""
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+    )
+    rows = db.execute("SELECT version FROM schema_version WHERE id = 1")
+    return rows[0]["version"] if rows else 0
+
+
+def migrate(db):
+    """
+    Apply pending migrations.
+
+    Everything runs in one write transaction (BEGIN IMMEDIATE on SQLite) and
+    the version is read once the lock is held, so when several workers start
+    at once, one migrates and the others then find the schema up to date.
+    A failing migration leaves the database as it was.
+
+    Args:
+        db: Database to migrate
+
+    Returns:
+        Schema version after migrating
+    """
+    with db.transaction() as tx:
+        current = version(tx)
+        for number, steps in enumerate(MIGRATIONS, start=1):
+            if number <= current:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(tx)
+                else:
+                    tx.execute(step)
+            tx.execute("INSERT OR REPLACE INTO schema_version (id, version) VALUES (1, ?)", number)
+            current = number
+    return current
+
+
+def explain(db, query, *args):
+    """Return SQLite query plan of query as a list of detail strings."""
+    return [row["detail"] for row in db.execute(f"EXPLAIN QUERY PLAN {query}", *args)]
+
+
+def check_query_plans(db, queries=ROUTE_QUERIES):
+    """
+    Check that queries are answered through indexes.
+
+    A plan step that scans a whole table or sorts in a temporary b-tree
+    means a query's cost grows with the size of the table.
+
+    Returns:
+        List of (query, plan) tuples for queries that don't use an index
+    """
+    failures = []
+    for query, *args in queries:
+        plan = explain(db, query, *args)
+        if any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan):
+            failures.append((query, plan))
+    return failures
@@ -0,0 +1,255 @@
+"""
+Pluggable session storage.
+
+init_session() configures the app for the backend named by SESSION_BACKEND:
+
+- "filesystem": Flask-Session files under flask_session/ (the original setup)
+- "cookie": Flask's signed cookies, nothing stored server-side
+- "sqlite": a sessions table in the app's Database, with indexed expiry
+- "redis": any Redis-compatible client, or MemoryRedis for "memory://"
+"""
+
+import secrets
+import threading
+import time
+
+from flask.sessions import SessionInterface
+from flask_session import Session
+from flask_session._utils import total_seconds
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+from flask_session.defaults import Defaults
+
+
+BACKENDS = ("filesystem", "cookie", "sqlite", "redis")
+
+
+class DatabaseSession(ServerSideSession):
+    pass
+
+
+class DatabaseSessionInterface(ServerSideSessionInterface):
+    """
+    Store sessions in the sessions table of a database.Database.
+
+    Expired rows are skipped on read and removed in batches, on average
+    every cleanup_n_requests requests or with `flask session_cleanup`.
+    """
+
+    session_class = DatabaseSession
+    ttl = False
+
+    def __init__(
+        self,
+        app,
+        db,
+        key_prefix=Defaults.SESSION_KEY_PREFIX,
+        use_signer=Defaults.SESSION_USE_SIGNER,
+        permanent=Defaults.SESSION_PERMANENT,
+        sid_length=Defaults.SESSION_ID_LENGTH,
+        serialization_format=Defaults.SESSION_SERIALIZATION_FORMAT,
+        cleanup_n_requests=1000,
+        cleanup_batch_size=500,
+    ):
+        self.db = db
+        self.cleanup_batch_size = cleanup_batch_size
+        super().__init__(
+            app, key_prefix, use_signer, permanent, sid_length, serialization_format, cleanup_n_requests
+        )
+
+    def _retrieve_session_data(self, store_id):
+        rows = self.db.execute(
+            "SELECT data FROM sessions WHERE id = ? AND expiry > ?", store_id, time.time()
+        )
+        if rows:
+            return self.serializer.decode(rows[0]["data"])
+        return None
+
+    def _delete_session(self, store_id):
+        self.db.execute("DELETE FROM sessions WHERE id = ?", store_id)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        self.db.execute(
+            "INSERT INTO sessions (id, data, expiry) VALUES (?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET data = excluded.data, expiry = excluded.expiry",
+            store_id,
+            self.serializer.encode(session),
+            time.time() + total_seconds(session_lifetime)
+        )
+
+    def _delete_expired_sessions(self):
+        # Small batches keep each write lock short
+        now = time.time()
+        while True:
+            deleted = self.db.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions WHERE expiry <= ? LIMIT ?)",
+                now,
+                self.cleanup_batch_size
+            )
+            if deleted < self.cleanup_batch_size:
+                break
+
+
+class KeyValueSession(ServerSideSession):
+    pass
+
+
+class KeyValueSessionInterface(ServerSideSessionInterface):
+    """
+    Store sessions in a Redis-compatible key-value store.
+
+    The client only needs get(name), set(name, value, ex=seconds) and
+    delete(name), so redis.Redis and MemoryRedis both work.
+    """
+
+    session_class = KeyValueSession
+    ttl = True
+
+    def __init__(
+        self,
+        app,
+        client,
+        key_prefix=Defaults.SESSION_KEY_PREFIX,
+        use_signer=Defaults.SESSION_USE_SIGNER,
+        permanent=Defaults.SESSION_PERMANENT,
+        sid_length=Defaults.SESSION_ID_LENGTH,
+        serialization_format=Defaults.SESSION_SERIALIZATION_FORMAT,
+    ):
+        self.client = client
+        super().__init__(app, key_prefix, use_signer, permanent, sid_length, serialization_format)
+
+    def _retrieve_session_data(self, store_id):
+        data = self.client.get(store_id)
+        if data:
+            return self.serializer.decode(data)
+        return None
+
+    def _delete_session(self, store_id):
+        self.client.delete(store_id)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        self.client.set(store_id, self.serializer.encode(session), ex=total_seconds(session_lifetime))
+
+
+class MemoryRedis:
+    """In-process stand-in for the subset of the Redis client used by KeyValueSessionInterface."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            item = self._data.get(name)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires <= time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+
+class LazySessionInterface(SessionInterface):
+    """
+    Stand-in that sets up the configured session backend on the first
+    request, then replaces itself with it (see init_session).
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+        self._lock = threading.Lock()
+
+    def backend(self, app):
+        """Return the real session interface of app, setting it up if needed."""
+        with self._lock:
+            if app.session_interface is self:
+                init_session(app, self.db)
+        return app.session_interface
+
+    def open_session(self, app, request):
+        return self.backend(app).open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.backend(app).save_session(app, session, response)
+
+
+def delete_expired_sessions(app):
+    """
+    Delete expired sessions of app's backend, setting it up first if that was left to the first request.
+
+    Returns:
+        Whether the backend keeps expired sessions until deleted; the others expire them on their own
+    """
+    interface = app.session_interface
+    if isinstance(interface, LazySessionInterface):
+        interface = interface.backend(app)
+    if getattr(interface, "ttl", True):
+        return False
+    interface._delete_expired_sessions()
+    return True
+
+
+def init_session(app, db=None, lazy=False):
+    """
+    Configure session storage of app for SESSION_BACKEND.
+
+    Args:
+        app: Flask app
+        db: Database holding the sessions table, required by the "sqlite" backend
+        lazy: Set the backend up on the first request (creating session
+            directories or clients), only checking the configuration now
+    """
+    backend = app.config.get("SESSION_BACKEND", "filesystem")
+    if backend not in BACKENDS:
+        raise ValueError(f"SESSION_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+    if backend == "sqlite" and db is None:
+        raise ValueError("the sqlite session backend needs a Database")
+
+    if lazy and backend != "cookie":
+        app.session_interface = LazySessionInterface(db)
+        return
+
+    if backend == "filesystem":
+        app.config["SESSION_TYPE"] = "filesystem"
+        Session(app)
+        return
+
+    if backend == "cookie":
+        # Signed cookies need the same secret key on every node
+        if not app.secret_key:
+            print("SECRET_KEY not set, sessions won't survive a restart or work across nodes")
+            app.secret_key = secrets.token_hex(32)
+        return
+
+    options = {
+        "key_prefix": app.config.get("SESSION_KEY_PREFIX", Defaults.SESSION_KEY_PREFIX),
+        "permanent": app.config.get("SESSION_PERMANENT", Defaults.SESSION_PERMANENT),
+        "sid_length": app.config.get("SESSION_ID_LENGTH", Defaults.SESSION_ID_LENGTH),
+        "serialization_format": app.config.get(
+            "SESSION_SERIALIZATION_FORMAT", Defaults.SESSION_SERIALIZATION_FORMAT
+        ),
+    }
+
+    if backend == "sqlite":
+        app.session_interface = DatabaseSessionInterface(
+            app, db, cleanup_n_requests=app.config.get("SESSION_CLEANUP_N_REQUESTS", 1000), **options
+        )
+        return
+
+    url = app.config.get("SESSION_REDIS_URL", "redis://localhost:6379/0")
+    if url == "memory://":
+        client = MemoryRedis()
+    else:
+        import redis
+
+        client = redis.Redis.from_url(url)
+    app.session_interface = KeyValueSessionInterface(app, client, **options)
@@ -0,0 +1,38 @@
+// Keep the portfolio table current from the /api/stream server-sent events
+document.addEventListener('DOMContentLoaded', function() {
+    const usd = new Intl.NumberFormat('en-US', {style: 'currency', currency: 'USD'});
+    const source = new EventSource('/api/stream');
+
+    function update(data) {
+        Object.entries(data.positions).forEach(function([symbol, position]) {
+            const row = document.querySelector('tr[data-symbol="' + symbol + '"]');
+            if (!row || position.price === null) {
+                return;
+            }
+            row.querySelector('[data-field="price"]').textContent = usd.format(position.price);
+            row.querySelector('[data-field="value"]').textContent = usd.format(position.value);
+            row.querySelector('[data-field="unrealized_pnl"]').textContent = usd.format(position.unrealized_pnl);
+            row.querySelector('[data-field="age"]').textContent = 'live';
+        });
+        document.querySelector('[data-total="unrealized_pnl"]').textContent = usd.format(data.totals.unrealized_pnl);
+        document.querySelector('[data-total="grand_total"]').textContent = usd.format(data.totals.grand_total);
+    }
+
+    source.addEventListener('snapshot', function(event) {
+        const data = JSON.parse(event.data);
+        const rows = document.querySelectorAll('tr[data-symbol]');
+        // Holdings changed since the page was rendered (e.g. a trade in another tab), render it again
+        const priced = Object.values(data.positions).filter(function(position) {
+            return position.price !== null;
+        });
+        if (rows.length !== priced.length) {
+            source.close();
+            window.location.reload();
+            return;
+        }
+        update(data);
+    });
+    source.addEventListener('prices', function(event) {
+        update(JSON.parse(event.data));
+    });
+});
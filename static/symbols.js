@@ -0,0 +1,38 @@
+// Suggest symbols from /symbols as the user types into inputs with a data-symbols attribute
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('input[data-symbols]').forEach(function(input) {
+        const list = document.getElementById(input.getAttribute('list'));
+        let timer = null;
+        let controller = null;
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const prefix = input.value.trim();
+            if (!prefix) {
+                list.replaceChildren();
+                return;
+            }
+
+            // Wait for a pause in typing, and drop answers to prefixes that are no longer current
+            timer = setTimeout(function() {
+                if (controller) {
+                    controller.abort();
+                }
+                controller = new AbortController();
+                fetch('/symbols?prefix=' + encodeURIComponent(prefix), {signal: controller.signal})
+                    .then(function(response) {
+                        return response.json();
+                    })
+                    .then(function(data) {
+                        list.replaceChildren(...data.symbols.map(function(match) {
+                            const option = document.createElement('option');
+                            option.value = match.symbol;
+                            option.label = match.name;
+                            return option;
+                        }));
+                    })
+                    .catch(function() {});
+            }, 100);
+        });
+    });
+});
@@ -0,0 +1,158 @@
+"""
+Symbol directory.
+
+Holds the known stock symbols and company names in memory as sorted
+arrays: prefix queries are two binary searches and a slice, and checking a
+symbol is one binary search, with no per-entry objects beyond the strings.
+
+Loaded from a CSV file whose first two columns are symbol and company name
+(exchange listing files have this shape), the directory is authoritative and
+lookup() rejects symbols that aren't in it without calling the quote API.
+Loaded from recorded prices instead (see pricestore) it only serves
+autocomplete, since any symbol not traded yet would be missing.
+"""
+
+import csv
+import threading
+
+from bisect import bisect_left, bisect_right
+
+
+# Sorts after every character that can appear in a symbol or name
+_HIGH = "\U0010ffff"
+
+
+class SymbolDirectory:
+    """Sorted in-memory index of symbols and company names."""
+
+    def __init__(self, entries=(), authoritative=False, loader=None):
+        """
+        Initialize directory.
+
+        Args:
+            entries: Iterable of (symbol, company name) pairs
+            authoritative: Whether symbols missing from the directory are invalid
+            loader: Callable returning the entries, called on first use instead
+        """
+        self.authoritative = authoritative
+        self._version = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._index = ([], [], [], [])
+        self._loader = loader
+        if loader is None:
+            self.replace(entries)
+
+    @classmethod
+    def from_csv(cls, path, lazy=False):
+        """Load an authoritative directory from CSV file with symbol and name columns, on first use if lazy."""
+        def load():
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = csv.reader(f)
+                header = next(rows, None)
+                entries = [(row[0], row[1]) for row in rows if len(row) >= 2]
+                # Files without a header start with data
+                if header and len(header) >= 2 and not any(word in header[0].lower() for word in ("symbol", "ticker")):
+                    entries.append((header[0], header[1]))
+            return entries
+
+        return cls(authoritative=True, loader=load) if lazy else cls(load(), authoritative=True)
+
+    @classmethod
+    def from_prices(cls, db, lazy=False):
+        """Load a non-authoritative directory from the symbols in the prices table, on first use if lazy."""
+        def load():
+            rows = db.execute("SELECT symbol, MAX(name) AS name FROM prices GROUP BY symbol")
+            return [(row["symbol"], row["name"] or "") for row in rows]
+
+        return cls(authoritative=False, loader=load) if lazy else cls(load(), authoritative=False)
+
+    @property
+    def version(self):
+        """Number of times the index was (re)built, changes with its contents."""
+        self._current()
+        return self._version
+
+    def replace(self, entries):
+        """Rebuild the index from (symbol, name) pairs, swapping it in atomically."""
+        merged = {}
+        for symbol, name in entries:
+            symbol = symbol.strip().upper()
+            if symbol:
+                merged[symbol] = name.strip()
+        symbols = sorted(merged)
+        names = [merged[symbol] for symbol in symbols]
+
+        # Second index over lower-cased names, pointing back into symbols
+        by_name = sorted((name.lower(), i) for i, name in enumerate(names) if name)
+        name_keys = [key for key, _ in by_name]
+        name_refs = [i for _, i in by_name]
+
+        with self._lock:
+            self._index = (symbols, names, name_keys, name_refs)
+            self._version += 1
+            self._loader = None
+
+    def _current(self):
+        """Return the index, loading it first if the directory was created with a loader."""
+        if self._loader is not None:
+            with self._load_lock:
+                loader = self._loader
+                if loader is not None:
+                    self.replace(loader())
+        return self._index
+
+    def __len__(self):
+        return len(self._current()[0])
+
+    def __contains__(self, symbol):
+        symbols = self._current()[0]
+        i = bisect_left(symbols, symbol)
+        return i < len(symbols) and symbols[i] == symbol
+
+    def is_valid(self, symbol):
+        """Return whether symbol may be looked up: it is listed, or the directory isn't authoritative."""
+        return not self.authoritative or symbol.upper() in self
+
+    def name(self, symbol):
+        """Return company name of symbol, None if it isn't listed."""
+        symbols, names, _, _ = self._current()
+        i = bisect_left(symbols, symbol.upper())
+        if i < len(symbols) and symbols[i] == symbol.upper():
+            return names[i]
+        return None
+
+    def search(self, prefix, limit=10):
+        """
+        Find symbols starting with prefix, then companies whose name does.
+
+        Args:
+            prefix: Beginning of a symbol or company name, case-insensitive
+            limit: Maximum number of results
+
+        Returns:
+            List of (symbol, name) pairs, symbol matches first, each in sorted order
+        """
+        prefix = prefix.strip()
+        if not prefix or limit <= 0:
+            return []
+        symbols, names, name_keys, name_refs = self._current()
+
+        upper = prefix.upper()
+        start = bisect_left(symbols, upper)
+        end = min(bisect_right(symbols, upper + _HIGH, start), start + limit)
+        results = [(symbols[i], names[i]) for i in range(start, end)]
+        if len(results) == limit:
+            return results
+
+        lower = prefix.lower()
+        start = bisect_left(name_keys, lower)
+        end = bisect_right(name_keys, lower + _HIGH, start)
+        for j in range(start, end):
+            # Symbols matching by prefix too were listed above
+            i = name_refs[j]
+            if not symbols[i].startswith(upper):
+                results.append((symbols[i], names[i]))
+                if len(results) == limit:
+                    break
+        return results
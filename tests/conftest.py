@@ -0,0 +1,68 @@
+"""
+Shared fixtures: an app on a scratch database, quoting from the stub quote
+server in benchmarks, and logged-in test clients.
+"""
+
+import pytest
+
+import app as finance
+
+from benchmarks.stub_quote_server import start_stub_server
+
+
+@pytest.fixture(scope="session")
+def quote_server():
+    """Local stand-in for the quote API."""
+    server = start_stub_server()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def config(tmp_path, quote_server):
+    """Settings for a test app, tests can change them before using app."""
+    return {
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'finance.db'}",
+        "QUOTE_API_URL": quote_server.url,
+        "SESSION_BACKEND": "cookie",
+        "SECRET_KEY": "test",
+        # Cheap hashes, in the test process
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+        "PASSWORD_HASH_WORKERS": 0,
+        "PRICE_STORE": False,
+    }
+
+
+@pytest.fixture
+def app(config):
+    """App created from config, its background work stopped afterwards."""
+    app = finance.create_app(config)
+    yield app
+    app.extensions["finance"].stop()
+
+
+@pytest.fixture
+def services(app):
+    """Services of app (see app.Services)."""
+    return app.extensions["finance"]
+
+
+@pytest.fixture
+def db(services):
+    """Database of app."""
+    return services.db
+
+
+@pytest.fixture
+def register(app):
+    """Return a function registering a user and returning a client logged in as them."""
+
+    def register(username, password="password"):
+        client = app.test_client()
+        response = client.post(
+            "/register", data={"username": username, "password": password, "confirmation": password}
+        )
+        assert response.status_code == 302
+        return client
+
+    return register
@@ -0,0 +1,137 @@
+"""
+Deleting an account only marks it; AccountPurger removes the ledger in the
+background, archived, without holding up other users' trades.
+"""
+
+import statistics
+import time
+
+import pytest
+
+import deletion
+
+from deletion import AccountPurger, read_archive
+
+
+LEDGER_QUERY = "SELECT id, symbol, shares, price, timestamp FROM transactions WHERE user_id = ? ORDER BY id"
+
+
+@pytest.fixture
+def config(config, tmp_path):
+    """Archive purged accounts, in small chunks so a purge takes several."""
+    return dict(config, ACCOUNT_ARCHIVE_DIR=str(tmp_path / "archive"), ACCOUNT_PURGE_CHUNK=100)
+
+
+@pytest.fixture
+def purger(services, monkeypatch):
+    """The app's purger, purging only when a test calls it."""
+    monkeypatch.setattr(services.purger, "start", lambda: None)
+    monkeypatch.setattr(services.purger, "wake", lambda: None)
+    return services.purger
+
+
+def user_id(db, username):
+    """Return the id of the live account username."""
+    return db.execute("SELECT id FROM users WHERE username = ? AND deleted_at IS NULL", username)[0]["id"]
+
+
+def delete_account(client):
+    """Delete the account client is logged in as."""
+    response = client.post("/profile", data={"action": "delete_account", "delete_password": "password"})
+    assert response.status_code == 302
+
+
+def test_delete_marks_and_purge_removes(app, db, register, purger, tmp_path):
+    alice = register("alice")
+    for symbol in ("AAPL", "MSFT", "AAPL"):
+        alice.post("/buy", data={"symbol": symbol, "shares": "2"})
+    alice.post("/sell", data={"symbol": "AAPL", "shares": "1"})
+    alice_id = user_id(db, "alice")
+    ledger = db.execute(LEDGER_QUERY, alice_id)
+    assert len(ledger) == 4
+
+    delete_account(alice)
+    # The request leaves the ledger to the purger
+    assert db.execute(LEDGER_QUERY, alice_id) == ledger
+    assert db.execute("SELECT symbol FROM holdings WHERE user_id = ?", alice_id) == []
+    response = app.test_client().post("/login", data={"username": "alice", "password": "password"})
+    assert response.status_code == 403
+    # The username is free at once
+    register("alice")
+    assert user_id(db, "alice") != alice_id
+
+    assert purger.purge_next()
+    assert not purger.purge_next()
+    assert db.execute(LEDGER_QUERY, alice_id) == []
+    assert db.execute("SELECT id FROM users WHERE id = ?", alice_id) == []
+
+    account, transactions = read_archive(tmp_path / "archive" / f"user-{alice_id}.jsonl.gz")
+    assert (account["id"], account["username"]) == (alice_id, "alice")
+    assert sorted(transactions, key=lambda row: row["id"]) == ledger
+
+
+def test_archive_skips_chunks_archived_twice(tmp_path):
+    path = tmp_path / "user-1.jsonl.gz"
+    rows = [{"id": i, "symbol": "AAPL", "shares": 1, "price": 1.0, "timestamp": "2020-01-01"} for i in range(3)]
+    deletion._append(path, [{"user": {"id": 1, "username": "alice"}}])
+    deletion._append(path, rows[:2])
+    # Archived again after a crash before the chunk was deleted
+    deletion._append(path, rows)
+    assert read_archive(path) == ({"id": 1, "username": "alice"}, rows)
+
+
+def test_one_purger_per_account(db, register, purger):
+    delete_account(register("alice"))
+    other = AccountPurger(db, lease=60.0)
+
+    claimed = purger.claim()
+    assert claimed is not None
+    assert other.claim() is None
+
+    # Once the lease lapses, another purger takes over and the first one stops
+    db.execute("UPDATE users SET purging_until = ? WHERE id = ?", 0.0, claimed[0]["id"])
+    account, until = other.claim()
+    purger.purge(*claimed)
+    assert db.execute("SELECT id FROM users WHERE id = ?", account["id"])
+    other.purge(account, until)
+    assert db.execute("SELECT id FROM users WHERE id = ?", account["id"]) == []
+
+
+@pytest.mark.parametrize("duty", [0, -0.5, 1.5])
+def test_duty_is_a_fraction(duty):
+    with pytest.raises(ValueError):
+        AccountPurger(None, duty=duty)
+
+
+def test_buys_are_not_held_up_by_a_large_deletion(db, register):
+    bob = register("bob")
+    bob_id = user_id(db, "bob")
+    db.executemany(
+        "INSERT INTO transactions (user_id, symbol, shares, price, timestamp) VALUES (?, 'AAPL', 1, 100.0, ?)",
+        [(bob_id, f"2020-01-01 00:00:{i % 60:02d}") for i in range(20000)]
+    )
+    alice = register("alice")
+    db.execute("UPDATE users SET cash = ? WHERE id = ?", 10 ** 9, user_id(db, "alice"))
+
+    def buys(count):
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            assert alice.post("/buy", data={"symbol": "AAPL", "shares": "1"}).status_code == 302
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    # Warm the quote cache and the connection pool
+    buys(10)
+    baseline = buys(200)
+    delete_account(bob)
+    during = []
+    deadline = time.monotonic() + 30
+    while db.execute("SELECT id FROM users WHERE id = ?", bob_id) and time.monotonic() < deadline:
+        during.extend(buys(10))
+    assert db.execute("SELECT id FROM users WHERE id = ?", bob_id) == []
+    assert len(during) >= 20
+
+    # Buys wait for one chunk at worst, never for the whole ledger
+    p99 = statistics.quantiles(during, n=100)[98]
+    assert p99 < 3 * statistics.quantiles(baseline, n=100)[98] + 0.02
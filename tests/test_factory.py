@@ -0,0 +1,43 @@
+"""
+Every app created by create_app has its own services, so apps created side
+by side don't share or stop each other's state.
+"""
+
+import time
+
+import app as finance
+
+
+def test_apps_side_by_side(app, services, config, tmp_path, register):
+    other = finance.create_app(dict(config, DATABASE_URL=f"sqlite:///{tmp_path / 'other.db'}"))
+    try:
+        other_services = other.extensions["finance"]
+        assert other_services.db is not services.db
+        assert other.extensions["quotes"] is not app.extensions["quotes"]
+
+        register("alice").post("/buy", data={"symbol": "AAPL", "shares": "2"})
+        client = other.test_client()
+        client.post("/register", data={"username": "alice", "password": "password", "confirmation": "password"})
+        assert b"AAPL" not in client.get("/sell").data
+
+        # Creating the second app left the first one's background work running
+        with app.test_request_context():
+            assert finance.db.execute("SELECT COUNT(*) AS n FROM transactions")[0]["n"] == 1
+        assert services.purger._thread.is_alive()
+    finally:
+        other_services.stop()
+
+
+def test_session_cleanup_command(config, tmp_path):
+    app = finance.create_app(dict(config, SESSION_BACKEND="sqlite"))
+    try:
+        db = app.extensions["finance"].db
+        db.execute("INSERT INTO sessions (id, data, expiry) VALUES (?, ?, ?)", "session:old", b"", time.time() - 1)
+        db.execute("INSERT INTO sessions (id, data, expiry) VALUES (?, ?, ?)", "session:new", b"", time.time() + 60)
+
+        # The backend is set up lazily, the command has to work before any request
+        result = app.test_cli_runner().invoke(args=["session_cleanup"])
+        assert result.exit_code == 0, result.output
+        assert [row["id"] for row in db.execute("SELECT id FROM sessions")] == ["session:new"]
+    finally:
+        app.extensions["finance"].stop()
@@ -0,0 +1,55 @@
+"""
+Cached fragments are keyed on users.ledger_version, so a trade committed by
+another worker process is seen on the next request here.
+"""
+
+import holdings
+
+
+def trade_elsewhere(db, username, symbol, shares, price):
+    """Record a buy the way another worker would, leaving this process's cache alone."""
+    user_id = db.execute("SELECT id FROM users WHERE username = ?", username)[0]["id"]
+    with db.transaction() as tx:
+        tx.execute(
+            "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
+            user_id, symbol, shares, price
+        )
+        holdings.record_buy(tx, user_id, symbol, shares, price)
+        tx.execute(
+            "UPDATE users SET cash = cash - ?, ledger_version = ledger_version + 1 WHERE id = ?",
+            shares * price, user_id
+        )
+
+
+def test_trade_in_another_worker_misses_the_cache(db, services, register):
+    alice = register("alice")
+    alice.post("/buy", data={"symbol": "AAPL", "shares": "1"})
+    for page in ("/", "/sell", "/history"):
+        alice.get(page)
+    hits = services.fragments.hits
+    assert b"NFLX" not in alice.get("/sell").data
+    assert services.fragments.hits == hits + 1
+
+    trade_elsewhere(db, "alice", "NFLX", 2, 10.0)
+    for page in ("/", "/sell", "/history"):
+        assert b"NFLX" in alice.get(page).data, page
+
+
+def test_trade_in_another_worker_changes_the_history_etag(db, register):
+    alice = register("alice")
+    alice.post("/buy", data={"symbol": "AAPL", "shares": "1"})
+    etag = alice.get("/history").headers["ETag"]
+    assert alice.get("/history", headers={"If-None-Match": etag}).status_code == 304
+
+    trade_elsewhere(db, "alice", "NFLX", 2, 10.0)
+    assert alice.get("/history", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_only_the_newest_version_is_kept(db, services, register):
+    alice = register("alice")
+    alice.post("/buy", data={"symbol": "AAPL", "shares": "1"})
+    for shares in (1, 2, 3):
+        trade_elsewhere(db, "alice", "NFLX", shares, 10.0)
+        alice.get("/sell")
+        alice.get("/history")
+    assert services.fragments.stats()["entries"] == 2
@@ -0,0 +1,20 @@
+"""PasswordHasher keeps working when its worker pool breaks."""
+
+from passwords import PasswordHasher
+
+
+def test_recovers_from_dead_worker():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=1)
+    try:
+        password_hash = hasher.hash("password")
+        broken = hasher._pool
+        # As if the worker were killed for memory: the pool is broken for every later job
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+
+        assert hasher.verify(password_hash, "password")
+        assert hasher._pool is not broken
+        assert hasher.verify_and_update(password_hash, "password") == (True, None)
+    finally:
+        hasher.close()
@@ -0,0 +1,78 @@
+"""
+The portfolio page and stream are built from holdings at average cost,
+with realized P&L kept by the trade paths; FIFO analytics of the whole
+ledger are only computed for /api/portfolio.
+"""
+
+import pytest
+
+import analytics
+import app as finance
+import holdings
+
+from helpers import usd
+
+
+def trade(db, user_id, symbol, shares, price):
+    """Record one trade in the ledger and holdings, as buy and sell do."""
+    with db.transaction() as tx:
+        tx.execute(
+            "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
+            user_id, symbol, shares, price
+        )
+        if shares > 0:
+            holdings.record_buy(tx, user_id, symbol, shares, price)
+        else:
+            holdings.record_sell(tx, user_id, symbol, -shares, price)
+
+
+def realized(db, user_id):
+    return db.execute("SELECT realized_pnl FROM users WHERE id = ?", user_id)[0]["realized_pnl"]
+
+
+@pytest.fixture
+def alice(db, register):
+    register("alice")
+    return db.execute("SELECT id FROM users WHERE username = 'alice'")[0]["id"]
+
+
+def test_sales_book_profit_over_average_cost(db, alice):
+    trade(db, alice, "AAPL", 10, 100.0)
+    trade(db, alice, "AAPL", 10, 200.0)
+    trade(db, alice, "AAPL", -5, 180.0)
+    # FIFO would book 5 * (180 - 100), average cost books 5 * (180 - 150)
+    assert realized(db, alice) == pytest.approx(150.0)
+
+    with db.transaction() as tx:
+        current = tx.execute("SELECT symbol, shares, cost_basis FROM holdings WHERE user_id = ?", alice)
+        basket = [("AAPL", -15, 120.0), ("MSFT", 4, 50.0), ("MSFT", -1, 60.0)]
+        tx.executemany(
+            "INSERT INTO transactions (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
+            [(alice, *order) for order in basket]
+        )
+        holdings.record_trades(tx, alice, current, basket)
+    assert realized(db, alice) == pytest.approx(150.0 + 15 * (120.0 - 150.0) + 1 * (60.0 - 50.0))
+
+    # Kept incrementally, it matches a replay of the ledger
+    kept = realized(db, alice)
+    holdings.rebuild_realized(db, alice)
+    assert realized(db, alice) == pytest.approx(kept)
+    assert holdings.verify(db, alice) == []
+
+
+def test_page_and_stream_do_not_read_the_ledger(db, register, monkeypatch):
+    client = register("bob")
+    client.post("/buy", data={"symbol": "AAPL", "shares": "3"})
+    client.post("/buy", data={"symbol": "AAPL", "shares": "1"})
+    user_id = db.execute("SELECT id FROM users WHERE username = 'bob'")[0]["id"]
+    position = db.execute("SELECT shares, cost_basis FROM holdings WHERE user_id = ?", user_id)[0]
+
+    def load(*args):
+        raise AssertionError("ledger loaded")
+
+    monkeypatch.setattr(analytics, "load", load)
+    monkeypatch.setattr(analytics.Ledger, "from_columns", load)
+    page = client.get("/")
+    assert page.status_code == 200
+    assert usd(position["cost_basis"] / position["shares"]).encode() in page.data
+    assert finance.stream_holdings(db, user_id)[1] == {"AAPL": (position["shares"], position["cost_basis"])}
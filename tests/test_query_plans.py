@@ -0,0 +1,100 @@
+"""
+Every query the routes issue is answered through an index.
+
+check_query_plans() explains the statements listed in schema.ROUTE_QUERIES;
+test_route_queries_match_the_app keeps that list in step with the app by
+recording the statements issued while a user goes through every page.
+"""
+
+import time
+
+import pytest
+
+import database
+import leaderboard
+import schema
+
+from database import Database
+from helpers import encode_cursor
+
+
+# Statements that read whole tables by design: ranking every account, listing every recorded symbol
+FULL_SCANS = {
+    leaderboard.LEADERBOARD_QUERY,
+    "SELECT symbol, MAX(name) AS name FROM prices GROUP BY symbol",
+}
+
+
+@pytest.fixture
+def config(config):
+    """Server-side sessions, so their queries are recorded too, and an admin."""
+    return dict(config, SESSION_BACKEND="sqlite", ADMIN_USERNAMES="alice", PRICE_STORE=True)
+
+
+def test_route_queries_use_indexes(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'plans.db'}", migrate=True)
+    assert schema.check_query_plans(db) == []
+
+
+def test_route_queries_match_the_app(app, services, register, monkeypatch):
+    # Migrate before recording, migrations may scan
+    services.db.engine
+
+    issued = set()
+    prepare = database._prepare
+
+    def recording_prepare(query):
+        issued.add(query)
+        return prepare(query)
+
+    monkeypatch.setattr(database, "_prepare", recording_prepare)
+
+    alice = register("alice")
+    bob = register("bob")
+    for client in (alice, bob):
+        client.post("/buy", data={"symbol": "AAPL", "shares": "5"})
+    alice.post("/buy", data={"symbol": "MSFT", "shares": "3"})
+    alice.post("/sell", data={"symbol": "AAPL", "shares": "2"})
+    alice.post("/api/orders", json={"orders": [
+        {"symbol": "AAPL", "side": "buy", "shares": 1},
+        {"symbol": "MSFT", "side": "sell", "shares": 3},
+    ]})
+    for path in (
+        "/",
+        "/sell",
+        "/quote?symbol=AAPL",
+        "/symbols?prefix=A",
+        "/history",
+        f"/history?before={encode_cursor('2999-01-01 00:00:00', 10 ** 9)}",
+        f"/history?after={encode_cursor('1970-01-01 00:00:00', 0)}",
+        "/history/export?format=csv",
+        "/history/export?format=jsonl",
+        "/api/portfolio",
+        "/api/leaderboard",
+        "/metrics",
+    ):
+        assert alice.get(path).status_code == 200, path
+    # Accounts registered once the leaderboard is built are added to it
+    register("carol")
+    # Replay reads the recorded series of a symbol
+    services.price_store.flush()
+    services.price_store.series("AAPL")
+
+    alice.post("/profile", data={
+        "current_password": "password", "new_password": "secret", "confirmation": "secret",
+    })
+    alice.get("/logout")
+    alice.post("/login", data={"username": "alice", "password": "secret"})
+    assert alice.get("/").status_code == 200
+
+    bob.post("/profile", data={"action": "delete_account", "delete_password": "password"})
+    # Woken by the deletion, the purger removes bob in the background
+    deadline = time.monotonic() + 10
+    while services.purger.pending() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    app.session_interface._delete_expired_sessions()
+
+    statements = {query for query in issued if query.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE"))}
+    checked = {query for query, *_ in schema.ROUTE_QUERIES}
+    assert sorted(statements - FULL_SCANS - checked) == [], "issued but missing from ROUTE_QUERIES"
+    assert sorted(checked - statements) == [], "in ROUTE_QUERIES but never issued"